@@ -3,19 +3,42 @@
 """
 from datetime import datetime
 
+from ranking_index import RankingIndex
+from records import as_country_result
+
 
 class SEOAnalyzer:
     """Класс для анализа данных SEO-запросов"""
     
-    def __init__(self, all_data):
+    # Периоды, между которыми считается тренд (новый, базовый)
+    TREND_PERIODS = ("1_month", "3_months")
+    # Период, по дневному ряду которого считается тренд (trend_engine)
+    TREND_SERIES_PERIOD = "3_months"
+    
+    def __init__(self, all_data, all_queries=None):
         """
         Инициализация анализатора
         
         Args:
-            all_data: Словарь с данными по всем странам
+            all_data: Словарь {country_name: CountryResult} (словари старого
+                      формата преобразуются при загрузке)
+            all_queries: Словарь {country_name: [queries]} с вариациями запросов
         """
         self.all_data = all_data
+        self.all_queries = all_queries or {}
         self.analyzed = {}
+        self._reset_indexes()
+    
+    def _reset_indexes(self):
+        """Сбрасывает индексы рейтингов"""
+        self.analyzed = {
+            "countries": {},
+            "ranking": {},
+            "trends": [],
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        self.period_indexes = {}
+        self.trend_index = RankingIndex()
         
     def analyze_all_countries(self):
         """
@@ -24,106 +47,145 @@ class SEOAnalyzer:
         Returns:
             dict: Анализированные данные
         """
-        self.analyzed = {
-            "countries": {},
-            "ranking": {},
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        self._reset_indexes()
         
         for country_name, country_data in self.all_data.items():
-            self.analyzed["countries"][country_name] = self._analyze_country(country_data)
+            self.update_country(country_name, country_data, update_trend=False)
         
-        # Создаем рейтинг стран
-        self._create_rankings()
+        # Тренды всех стран одним векторизованным проходом
+        self._update_trends(list(self.analyzed["countries"]))
+        
+        # Снимок рейтингов для сохранения и вывода
+        self.analyzed["ranking"] = {
+            period: index.items() for period, index in self.period_indexes.items()
+        }
+        self.analyzed["trends"] = self.trend_index.items()
         
         return self.analyzed
     
-    def _analyze_country(self, country_data):
+    def update_country(self, country_name, country_data, update_trend=True):
         """
-        Анализирует данные одной страны
+        Добавляет или обновляет результат одной страны во всех рейтингах
         
         Args:
-            country_data: Данные по одной стране
+            country_name: Название страны
+            country_data: Данные по стране (CountryResult или словарь старого формата)
+            update_trend: Пересчитать тренд страны сразу (False - пересчет
+                          выполнит вызывающий код пакетом через _update_trends)
             
         Returns:
-            dict: Анализированные данные страны
+            CountryResult: Запись страны
         """
-        analysis = {
-            "country": country_data["country"],
-            "periods": {}
-        }
+        # Запись хранится в одном экземпляре: и как исходные, и как анализированные данные
+        analysis = as_country_result(country_data)
+        self.all_data[country_name] = analysis
+        self.analyzed["countries"][country_name] = analysis
         
-        for period_name, period_data in country_data["queries"].items():
-            if period_data and period_data.get("max_interest", 0) > 0:
-                period_analysis = {
-                    "max_interest": period_data["max_interest"],
-                    "top_query": period_data["top_query"],
-                    "all_interests": period_data["averages"],
-                    "related_queries": period_data.get("related_queries", {})
-                }
-                analysis["periods"][period_name] = period_analysis
+        # Рейтинги по периодам
+        for period_name in set(self.period_indexes) | set(analysis.periods):
+            index = self.period_indexes.setdefault(period_name, RankingIndex())
+            period_analysis = analysis.periods.get(period_name)
+            if period_analysis is None:
+                index.remove(country_name)
+            else:
+                index.update(country_name, period_analysis.max_interest, {
+                    "country": country_name,
+                    "interest": period_analysis.max_interest,
+                    "top_query": period_analysis.top_query
+                })
+        
+        if update_trend:
+            self._update_trends([country_name])
         
         return analysis
     
-    def _create_rankings(self):
+    def _update_trends(self, country_names):
         """
-        Создает рейтинги стран по популярности
-        """
-        # Рейтинг за 3 месяца (основной)
-        ranking_3m = []
-        ranking_1m = []
+        Пересчитывает тренды стран: ряды всех стран считаются одной матрицей
         
-        for country_name, analysis in self.analyzed["countries"].items():
-            # Данные за 3 месяца
-            if "3_months" in analysis["periods"]:
-                ranking_3m.append({
-                    "country": country_name,
-                    "interest": analysis["periods"]["3_months"]["max_interest"],
-                    "top_query": analysis["periods"]["3_months"]["top_query"]
-                })
-            
-            # Данные за 1 месяц
-            if "1_month" in analysis["periods"]:
-                ranking_1m.append({
-                    "country": country_name,
-                    "interest": analysis["periods"]["1_month"]["max_interest"],
-                    "top_query": analysis["periods"]["1_month"]["top_query"]
-                })
+        Args:
+            country_names: Названия стран
+        """
+        names = []
+        series_list = []
+        for country_name in country_names:
+            series = self._trend_series(self.analyzed["countries"].get(country_name))
+            if series is not None:
+                names.append(country_name)
+                series_list.append(series)
         
-        # Сортируем по убыванию интереса
-        ranking_3m.sort(key=lambda x: x["interest"], reverse=True)
-        ranking_1m.sort(key=lambda x: x["interest"], reverse=True)
+        series_stats = {}
+        if series_list:
+            # NumPy нужен только при наличии рядов
+            from trend_engine import compute_trends
+            series_stats = dict(zip(names, compute_trends(series_list)))
         
-        self.analyzed["ranking"]["3_months"] = ranking_3m
-        self.analyzed["ranking"]["1_month"] = ranking_1m
+        for country_name in country_names:
+            analysis = self.analyzed["countries"].get(country_name)
+            trend = None
+            if analysis is not None:
+                trend = self._calculate_trend(country_name, analysis, series_stats.get(country_name))
+            if trend is None:
+                self.trend_index.remove(country_name)
+            else:
+                self.trend_index.update(country_name, trend["change_percent"], trend)
         
-        # Вычисляем изменение (рост/падение)
-        self._calculate_trend()
+    def _trend_series(self, analysis):
+        """Возвращает дневной ряд топ-запроса страны за TREND_SERIES_PERIOD или None"""
+        if not analysis:
+            return None
+        period_analysis = analysis.periods.get(self.TREND_SERIES_PERIOD)
+        if period_analysis is None:
+            return None
+        return period_analysis.top_series()
     
-    def _calculate_trend(self):
+    def _calculate_trend(self, country_name, analysis, series_stats=None):
         """
-        Вычисляет тренд (рост/падение) между периодами
+        Вычисляет тренд (рост/падение) для страны
+        
+        Если есть показатели дневного ряда (trend_engine), тренд берется из них:
+        change_percent - изменение по линии МНК за 30 дней после удаления недельной
+        сезонности. Иначе (например, кэш старого формата) сравниваются max_interest
+        двух периодов.
+        
+        Args:
+            country_name: Название страны
+            analysis: Запись страны (CountryResult)
+            series_stats: Показатели ряда из trend_engine.compute_trends или None
+            
+        Returns:
+            dict: Тренд страны или None, если данных недостаточно
         """
-        trends = []
+        recent_period, base_period = self.TREND_PERIODS
+        periods = analysis.periods
+        interest_1m = periods[recent_period].max_interest if recent_period in periods else 0
+        interest_3m = periods[base_period].max_interest if base_period in periods else 0
         
-        for country_name, analysis in self.analyzed["countries"].items():
-            if "1_month" in analysis["periods"] and "3_months" in analysis["periods"]:
-                interest_1m = analysis["periods"]["1_month"]["max_interest"]
-                interest_3m = analysis["periods"]["3_months"]["max_interest"]
+        if series_stats is not None:
+            trend = {
+                "country": country_name,
+                "interest_1m": interest_1m,
+                "interest_3m": interest_3m,
+                "method": "series"
+            }
+            trend.update(series_stats)
+            return trend
+        
+        if recent_period not in periods or base_period not in periods:
+            return None
                 
-                if interest_3m > 0:
-                    change_percent = ((interest_1m - interest_3m) / interest_3m) * 100
-                else:
-                    change_percent = 0
+        if interest_3m > 0:
+            change_percent = ((interest_1m - interest_3m) / interest_3m) * 100
+        else:
+            change_percent = 0
                 
-                trends.append({
-                    "country": country_name,
-                    "interest_1m": interest_1m,
-                    "interest_3m": interest_3m,
-                    "change_percent": change_percent
-                })
-        
-        self.analyzed["trends"] = trends
+        return {
+            "country": country_name,
+            "interest_1m": interest_1m,
+            "interest_3m": interest_3m,
+            "change_percent": change_percent,
+            "method": "periods"
+        }
     
     def get_top_countries(self, period="3_months", limit=20):
         """
@@ -136,7 +198,10 @@ class SEOAnalyzer:
         Returns:
             list: Топ стран
         """
-        return self.analyzed["ranking"].get(period, [])[:limit]
+        index = self.period_indexes.get(period)
+        if index is None:
+            return []
+        return index.top(limit)
     
     def get_rising_countries(self, limit=10):
         """
@@ -148,9 +213,7 @@ class SEOAnalyzer:
         Returns:
             list: Страны с ростом
         """
-        rising = [t for t in self.analyzed["trends"] if t["change_percent"] > 0]
-        rising.sort(key=lambda x: x["change_percent"], reverse=True)
-        return rising[:limit]
+        return self.trend_index.top(limit, min_score=0)
     
     def get_falling_countries(self, limit=10):
         """
@@ -162,9 +225,53 @@ class SEOAnalyzer:
         Returns:
             list: Страны с падением
         """
-        falling = [t for t in self.analyzed["trends"] if t["change_percent"] < 0]
-        falling.sort(key=lambda x: x["change_percent"])
-        return falling[:limit]
+        return self.trend_index.bottom(limit, max_score=0)
+    
+    def get_interest(self, country_name, period="3_months", default=0):
+        """
+        Возвращает интерес к стране за период (O(1))
+        
+        Args:
+            country_name: Название страны
+            period: Период анализа
+            default: Значение, если данных нет
+            
+        Returns:
+            float: Интерес
+        """
+        index = self.period_indexes.get(period)
+        if index is None:
+            return default
+        return index.score(country_name, default)
+    
+    def get_trend(self, country_name):
+        """Возвращает тренд страны или None (O(1))"""
+        return self.trend_index.get(country_name)
+    
+    def get_query_count(self, country_name):
+        """
+        Возвращает количество вариаций запросов для страны
+        
+        Args:
+            country_name: Название страны
+            
+        Returns:
+            int: Количество запросов
+        """
+        if country_name in self.all_queries:
+            return len(self.all_queries[country_name])
+        
+        analysis = self.analyzed["countries"].get(country_name)
+        if not analysis:
+            return 0
+        return max((len(p.queries) for p in analysis.periods.values()), default=0)
+    
+    def _period(self, country_name, period):
+        """Возвращает PeriodResult страны за период или None"""
+        analysis = self.analyzed["countries"].get(country_name)
+        if analysis is None:
+            return None
+        return analysis.periods.get(period)
     
     def get_related_queries(self, country_name, period="3_months", limit=10):
         """
@@ -178,36 +285,74 @@ class SEOAnalyzer:
         Returns:
             dict: Связанные запросы (top и rising)
         """
-        if country_name not in self.analyzed["countries"]:
+        period_data = self._period(country_name, period)
+        if period_data is None:
             return None
         
-        period_data = self.analyzed["countries"][country_name]["periods"].get(period)
-        if not period_data:
+        # Top и rising запросы (кортежи RelatedQuery)
+        return {
+            "top": [{"query": q.query, "interest": q.value} for q in period_data.related_top[:limit]],
+            "rising": [{"query": q.query, "interest": q.value} for q in period_data.related_rising[:limit]]
+        }
+    
+    def get_top_regions(self, country_name, period="3_months", limit=10):
+        """
+        Возвращает регионы, в которых спрос на страну выше всего
+        
+        Args:
+            country_name: Название страны
+            period: Период анализа
+            limit: Количество регионов
+            
+        Returns:
+            list: [{region, code, interest}] по убыванию интереса или None
+        """
+        period_data = self._period(country_name, period)
+        if period_data is None or period_data.regions is None:
             return None
         
-        related = period_data.get("related_queries", {})
-        result = {
-            "top": [],
-            "rising": []
-        }
+        regions = period_data.regions
+        order = sorted(range(len(regions.values)), key=regions.values.__getitem__, reverse=True)
+        return [
+            {"region": regions.names[i], "code": regions.codes[i], "interest": regions.values[i]}
+            for i in order[:limit]
+        ]
         
-        # Top запросы
-        if "top" in related and related["top"] is not None:
-            top_queries = related["top"].head(limit).to_dict('records')
-            result["top"] = [
-                {"query": q["query"], "interest": q["value"]}
-                for q in top_queries
-            ]
-        
-        # Rising запросы
-        if "rising" in related and related["rising"] is not None:
-            rising_queries = related["rising"].head(limit).to_dict('records')
-            result["rising"] = [
-                {"query": q["query"], "interest": q["value"]}
-                for q in rising_queries
-            ]
+    def get_regional_demand(self, period="3_months", limit=20):
+        """
+        Возвращает регионы, которые формируют спрос на VPN-локации в целом
         
-        return result
+        Региональный интерес к топ-запросу страны (0-100 внутри страны) взвешивается
+        общим интересом к стране, затем суммируется по всем странам.
+        
+        Args:
+            period: Период анализа
+            limit: Количество регионов
+            
+        Returns:
+            list: [{region, code, demand, top_country}] по убыванию спроса
+        """
+        demand = {}
+        for country_name, analysis in self.analyzed["countries"].items():
+            period_analysis = analysis.periods.get(period)
+            if period_analysis is None or period_analysis.regions is None:
+                continue
+            
+            regions = period_analysis.regions
+            weight = period_analysis.max_interest / 100
+            for name, code, value in zip(regions.names, regions.codes, regions.values):
+                entry = demand.setdefault(name, {"region": name, "code": code, "demand": 0.0,
+                                                 "top_country": None, "_top_value": -1})
+                entry["demand"] += value * weight
+                if value * weight > entry["_top_value"]:
+                    entry["_top_value"] = value * weight
+                    entry["top_country"] = country_name
+        
+        ranking = sorted(demand.values(), key=lambda x: x["demand"], reverse=True)[:limit]
+        return [
+            {key: value for key, value in entry.items() if not key.startswith("_")}
+            for entry in ranking
+        ]
     
     def get_all_queries_interest(self, country_name, period="3_months"):
         """
@@ -220,17 +365,13 @@ class SEOAnalyzer:
         Returns:
             list: Список запросов с их интересом
         """
-        if country_name not in self.analyzed["countries"]:
-            return None
-        
-        period_data = self.analyzed["countries"][country_name]["periods"].get(period)
-        if not period_data:
+        period_data = self._period(country_name, period)
+        if period_data is None:
             return None
         
-        interests = period_data.get("all_interests", {})
         result = [
-            {"query": query, "interest": value if value is not None else 0}
-            for query, value in interests.items()
+            {"query": query, "interest": value}
+            for query, value in zip(period_data.queries, period_data.interests)
         ]
         
         # Сортируем по убыванию интереса
@@ -239,6 +380,174 @@ class SEOAnalyzer:
         return result
 
 
+class MultiGeoAnalyzer:
+    """Анализ результатов по нескольким геолокациям: рейтинги по каждой и сводный"""
+    
+    def __init__(self, geo_data, all_queries=None):
+        """
+        Инициализация анализатора
+        
+        Args:
+            geo_data: Словарь {geo: {country_name: country_data}}
+            all_queries: Словарь {country_name: [queries]} с вариациями запросов
+        """
+        self.geos = list(geo_data)
+        self.analyzers = {
+            geo: SEOAnalyzer(dict(data), all_queries) for geo, data in geo_data.items()
+        }
+        self.combined_indexes = {}
+    
+    def analyze_all(self):
+        """
+        Анализирует каждую геолокацию и строит сводные рейтинги
+        
+        Returns:
+            dict: {geo: анализированные данные}
+        """
+        result = {geo: analyzer.analyze_all_countries() for geo, analyzer in self.analyzers.items()}
+        
+        periods = set()
+        for analyzer in self.analyzers.values():
+            periods.update(analyzer.period_indexes)
+        
+        self.combined_indexes = {}
+        for period in periods:
+            self.combined_indexes[period] = self._combine_period(period)
+        
+        return result
+    
+    def _combine_period(self, period):
+        """
+        Строит сводный рейтинг за период
+        
+        Интерес усредняется по всем геолокациям запуска; отсутствие данных в
+        геолокации считается нулевым интересом.
+        """
+        per_country = {}
+        for geo, analyzer in self.analyzers.items():
+            index = analyzer.period_indexes.get(period)
+            if index is None:
+                continue
+            for item in index.items():
+                per_country.setdefault(item["country"], {})[geo] = item["interest"]
+        
+        combined = RankingIndex()
+        for country, by_geo in per_country.items():
+            interest = sum(by_geo.values()) / len(self.geos)
+            combined.update(country, interest, {
+                "country": country,
+                "interest": interest,
+                "geos": by_geo
+            })
+        return combined
+    
+    def get_analyzer(self, geo):
+        """Возвращает SEOAnalyzer геолокации"""
+        return self.analyzers.get(geo)
+    
+    def get_top_countries(self, period="3_months", limit=20, geo=None):
+        """
+        Возвращает топ стран по геолокации или по всем геолокациям
+        
+        Args:
+            period: Период анализа
+            limit: Количество стран в топе
+            geo: Код геолокации (None - сводный рейтинг)
+            
+        Returns:
+            list: Топ стран
+        """
+        if geo is not None:
+            analyzer = self.analyzers.get(geo)
+            return analyzer.get_top_countries(period, limit) if analyzer else []
+        
+        index = self.combined_indexes.get(period)
+        return index.top(limit) if index is not None else []
+
+
+class MultiCategoryAnalyzer:
+    """Анализ результатов одной геолокации по нескольким категориям поиска"""
+    
+    def __init__(self, category_data, all_queries=None):
+        """
+        Инициализация анализатора
+        
+        Args:
+            category_data: Словарь {category: {country_name: country_data}}
+            all_queries: Словарь {country_name: [queries]} с вариациями запросов
+        """
+        self.categories = list(category_data)
+        self.analyzers = {
+            category: SEOAnalyzer(dict(data), all_queries) for category, data in category_data.items()
+        }
+    
+    def analyze_all(self):
+        """
+        Анализирует каждую категорию
+        
+        Returns:
+            dict: {category: анализированные данные}
+        """
+        return {category: analyzer.analyze_all_countries() for category, analyzer in self.analyzers.items()}
+    
+    def get_analyzer(self, category):
+        """Возвращает SEOAnalyzer категории"""
+        return self.analyzers.get(category)
+    
+    def get_top_countries(self, period="3_months", limit=20, category=None):
+        """
+        Возвращает топ стран в категории
+        
+        Args:
+            period: Период анализа
+            limit: Количество стран в топе
+            category: Категория (по умолчанию - первая категория запуска)
+        
+        Returns:
+            list: Топ стран
+        """
+        analyzer = self.analyzers.get(self.categories[0] if category is None else category)
+        return analyzer.get_top_countries(period, limit) if analyzer else []
+    
+    def compare_categories(self, period="3_months", limit=20, base=None):
+        """
+        Сравнивает места стран в рейтингах категорий
+        
+        Интерес нормируется Google внутри каждой категории, поэтому между
+        категориями сравниваются места, а не значения.
+        
+        Args:
+            period: Период анализа
+            limit: Количество стран (по рейтингу базовой категории)
+            base: Базовая категория (по умолчанию - первая категория запуска)
+        
+        Returns:
+            list: [{country, interest: {category: x}, rank: {category: место},
+                    rank_shift: {category: насколько выше, чем в базовой}}]
+        """
+        base = self.categories[0] if base is None else base
+        ranks = {}
+        interests = {}
+        for category, analyzer in self.analyzers.items():
+            for rank, item in enumerate(analyzer.get_top_countries(period, limit=None), 1):
+                ranks.setdefault(item["country"], {})[category] = rank
+                interests.setdefault(item["country"], {})[category] = item["interest"]
+        
+        result = []
+        for item in self.get_top_countries(period, limit, category=base):
+            country = item["country"]
+            base_rank = ranks[country][base]
+            result.append({
+                "country": country,
+                "interest": interests[country],
+                "rank": ranks[country],
+                "rank_shift": {
+                    category: base_rank - rank for category, rank in ranks[country].items() if category != base
+                },
+            })
+        return result
+
+
 if __name__ == "__main__":
     # Тест анализатора с тестовыми данными
     test_data = {
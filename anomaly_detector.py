@@ -0,0 +1,285 @@
+"""
+Потоковый детектор аномалий спроса
+
+Для каждого ряда (геолокация, категория, период, запрос) хранится несколько чисел
+состояния: среднее и дисперсия по Уэлфорду, EWMA со взвешенной дисперсией и
+потоковые оценки медианы и MAD (стохастическое приближение). Каждая новая точка
+сначала оценивается по текущему состоянию, затем обновляет его за O(1), поэтому
+время и память не зависят от длины истории, а состояние всех рядов помещается в
+небольшой JSON-файл.
+
+Точки подаются из результатов парсера (GoogleTrendsParser.get_interest_summary);
+для каждого ряда запоминается время последней точки, поэтому пересекающиеся окна
+и ответы из кэша не учитываются дважды.
+
+Google нормирует каждый ответ так, что максимум окна равен 100: когда старый пик
+выходит из окна, все значения растут без изменения спроса. Поэтому для ряда
+хранится хвост последнего ответа, и перед оценкой новых точек состояние
+переводится в масштаб нового ответа по медиане отношений в общих точках (как
+nowcast.merge_series). Если общих точек нет, масштабы несравнимы и ряд
+начинается заново.
+"""
+import json
+import math
+import os
+import statistics
+
+from config import (
+    ANOMALY_STATE_PATH, ANOMALY_MIN_POINTS, ANOMALY_Z, ANOMALY_EWMA_ALPHA, ANOMALY_RECENT_POINTS,
+    ANOMALY_SCALE_POINTS,
+)
+
+STATE_VERSION = 2
+# Нормирующий множитель MAD для нормального распределения
+MAD_SCALE = 1.4826
+# Минимальный разброс: значения Trends - целые 0-100
+MIN_SPREAD = 1.0
+# Шаг потоковой медианы и MAD в долях текущего разброса (в начале ряда - 1/count)
+MEDIAN_RATE = 0.03
+
+
+class OnlineStats:
+    """Состояние одного ряда, обновляемое за O(1) на точку"""
+    
+    __slots__ = ("count", "mean", "m2", "ewma", "ewvar", "median", "mad", "last_ts", "reference")
+    
+    def __init__(self, count=0, mean=0.0, m2=0.0, ewma=0.0, ewvar=0.0, median=0.0, mad=0.0, last_ts=None,
+                 reference=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.ewma = ewma
+        self.ewvar = ewvar
+        self.median = median
+        self.mad = mad
+        self.last_ts = last_ts
+        # Хвост последнего ответа [[timestamp, value], ...] для сведения масштабов
+        self.reference = reference or []
+    
+    @property
+    def std(self):
+        """Стандартное отклонение по Уэлфорду"""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+    
+    def score(self, value):
+        """
+        Оценивает точку по текущему состоянию (до обновления)
+        
+        Returns:
+            tuple: (robust_z, ewma_z) - отклонение от медианы в единицах MAD и от EWMA
+                   в единицах экспоненциально взвешенного стандартного отклонения
+        """
+        robust_z = (value - self.median) / (MAD_SCALE * max(self.mad, MIN_SPREAD))
+        ewma_z = (value - self.ewma) / max(math.sqrt(self.ewvar), MIN_SPREAD)
+        return robust_z, ewma_z
+    
+    def update(self, value, alpha=ANOMALY_EWMA_ALPHA):
+        """Добавляет точку в состояние"""
+        self.count += 1
+        if self.count == 1:
+            self.mean = self.ewma = self.median = value
+            return
+        
+        # Уэлфорд
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        
+        # EWMA и взвешенная дисперсия
+        diff = value - self.ewma
+        increment = alpha * diff
+        self.ewma += increment
+        self.ewvar = (1 - alpha) * (self.ewvar + diff * increment)
+        
+        # Медиана и MAD: шаг к точке пропорционален разбросу (пока MAD мал - по Уэлфорду)
+        # и уменьшается с ростом ряда до MEDIAN_RATE
+        step = max(MEDIAN_RATE, 1 / self.count) * max(self.mad * MAD_SCALE, self.std, MIN_SPREAD)
+        if value > self.median:
+            self.median += min(step, value - self.median)
+        elif value < self.median:
+            self.median -= min(step, self.median - value)
+        deviation = abs(value - self.median)
+        if deviation > self.mad:
+            self.mad += min(step, deviation - self.mad)
+        elif deviation < self.mad:
+            self.mad -= min(step, self.mad - deviation)
+    
+    def rescale(self, factor):
+        """Переводит состояние в другой масштаб (значения умножаются на factor)"""
+        self.mean *= factor
+        self.m2 *= factor * factor
+        self.ewma *= factor
+        self.ewvar *= factor * factor
+        self.median *= factor
+        self.mad *= factor
+    
+    def to_list(self):
+        """Компактное представление для файла состояния"""
+        return [self.count, round(self.mean, 4), round(self.m2, 4), round(self.ewma, 4),
+                round(self.ewvar, 4), round(self.median, 4), round(self.mad, 4), self.last_ts,
+                self.reference]
+    
+    @classmethod
+    def from_list(cls, data):
+        return cls(*data)
+
+
+def scale_factor(reference, timestamps, values):
+    """
+    Множитель перевода прошлого ответа в масштаб нового
+    
+    Args:
+        reference: Точки прошлого ответа [[timestamp, value], ...]
+        timestamps: Время точек нового ответа
+        values: Значения нового ответа
+    
+    Returns:
+        float: Медиана отношений новое/старое в общих точках или None, если общих
+               точек с ненулевыми значениями нет
+    """
+    stored = dict((ts, value) for ts, value in reference)
+    ratios = [value / stored[ts] for ts, value in zip(timestamps, values)
+              if stored.get(ts, 0) > 0 and value > 0]
+    return statistics.median(ratios) if ratios else None
+
+
+class AnomalyDetector:
+    """Потоковый детектор всплесков и провалов по рядам запросов"""
+    
+    def __init__(self, path=ANOMALY_STATE_PATH, min_points=ANOMALY_MIN_POINTS, threshold=ANOMALY_Z,
+                 alpha=ANOMALY_EWMA_ALPHA, recent_points=ANOMALY_RECENT_POINTS, scale_points=ANOMALY_SCALE_POINTS):
+        """
+        Args:
+            path: Файл состояния (None - без сохранения)
+            min_points: Сколько точек ряда нужно до первых оповещений
+            threshold: Порог |z| для медианы/MAD и для EWMA (нужны оба)
+            alpha: Коэффициент сглаживания EWMA
+            recent_points: Оповещения только для последних точек ответа (старые
+                           точки при первом запуске лишь прогревают состояние)
+            scale_points: Сколько последних точек ответа хранить для сведения масштабов
+        """
+        self.path = path
+        self.min_points = min_points
+        self.threshold = threshold
+        self.alpha = alpha
+        self.recent_points = recent_points
+        self.scale_points = scale_points
+        self.streams = {}
+        self.alerts = []
+        self.points = 0
+        self._load()
+    
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get("version") == STATE_VERSION:
+            self.streams = {key: OnlineStats.from_list(data) for key, data in state["streams"].items()}
+    
+    def save(self):
+        """Сохраняет состояние (атомарная замена файла)"""
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": STATE_VERSION,
+                "streams": {key: stats.to_list() for key, stats in self.streams.items()},
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+    
+    def observe(self, key, timestamp, value, alert=True):
+        """
+        Оценивает и добавляет одну точку ряда
+        
+        Args:
+            key: (geo, category, timeframe, query)
+            timestamp: Время точки (точки не новее последней пропускаются)
+            value: Значение интереса
+            alert: Можно ли выдать оповещение для этой точки
+        
+        Returns:
+            dict: Оповещение или None
+        """
+        stream_key = "|".join(map(str, key))
+        stats = self.streams.get(stream_key)
+        if stats is None:
+            stats = self.streams[stream_key] = OnlineStats()
+        elif stats.last_ts is not None and timestamp <= stats.last_ts:
+            return None
+        
+        result = None
+        if alert and stats.count >= self.min_points:
+            robust_z, ewma_z = stats.score(value)
+            # Всплеск должен выделяться и на фоне распределения ряда, и на фоне текущего уровня
+            if abs(robust_z) >= self.threshold and abs(ewma_z) >= self.threshold and robust_z * ewma_z > 0:
+                geo, category, timeframe, query = key
+                result = {
+                    "kind": "spike" if robust_z > 0 else "drop",
+                    "geo": geo,
+                    "category": category,
+                    "timeframe": timeframe,
+                    "query": query,
+                    "timestamp": timestamp,
+                    "value": value,
+                    "expected": stats.median,
+                    "robust_z": robust_z,
+                    "ewma_z": ewma_z,
+                }
+                self.alerts.append(result)
+        
+        stats.update(value, self.alpha)
+        stats.last_ts = timestamp
+        self.points += 1
+        return result
+    
+    def _align_scale(self, stream_key, timestamps, values):
+        """Переводит состояние ряда в масштаб нового ответа"""
+        stats = self.streams.get(stream_key)
+        if stats is None or not stats.reference:
+            return
+        factor = scale_factor(stats.reference, timestamps, values)
+        if factor is None:
+            # Окна не пересекаются: прошлое состояние в несравнимом масштабе
+            del self.streams[stream_key]
+        elif factor != 1:
+            stats.rescale(factor)
+    
+    def observe_series(self, series, timeframe, geo, category):
+        """
+        Подает ряд из результата парсера
+        
+        Перед оценкой состояние каждого ряда переводится в масштаб ответа.
+        
+        Args:
+            series: {"timestamps": [...], "values": {query: [...]}}
+            timeframe: Период запроса
+            geo: Код геолокации
+            category: Категория поиска
+        
+        Returns:
+            list: Новые оповещения
+        """
+        timestamps = series["timestamps"]
+        first_recent = len(timestamps) - self.recent_points
+        alerts = []
+        for query, values in series["values"].items():
+            key = (geo, category, timeframe, query)
+            stream_key = "|".join(map(str, key))
+            self._align_scale(stream_key, timestamps, values)
+            for idx, (timestamp, value) in enumerate(zip(timestamps, values)):
+                alert = self.observe(key, timestamp, value, alert=idx >= first_recent)
+                if alert is not None:
+                    alerts.append(alert)
+            stats = self.streams.get(stream_key)
+            if stats is not None:
+                stats.reference = [[ts, value] for ts, value in
+                                   zip(timestamps[-self.scale_points:], values[-self.scale_points:])]
+        return alerts
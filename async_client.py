@@ -0,0 +1,447 @@
+"""
+Асинхронный клиент Google Trends для встраивания в сервисы
+
+AsyncTrendsClient выполняет те же операции, что GoogleTrendsParser (кэш, ретраи,
+разбор ответов), но не блокирует цикл событий: каждый воркер держит свой парсер
+с отдельной HTTP-сессией в собственном потоке, а вызывающие ждут результат как
+обычную корутину.
+
+- Ограничение частоты общее для всех вызывающих и воркеров: перед каждым
+  HTTP-запросом поток воркера ждет AsyncRateLimiter в цикле событий (очередь
+  ожидающих - FIFO, интервал и квота хоста соблюдаются для всего клиента).
+- Обратное давление: задачи идут через ограниченную очередь, при заполнении
+  вызывающие ждут на put.
+- Одинаковые одновременные вызовы объединяются в одну задачу.
+- Отмена: если все ожидающие задачу отменены, она снимается из очереди или
+  прерывается на границе следующего HTTP-запроса.
+- Вместо вывода в консоль результат возвращается объектом TrendsResult со
+  значением, счетчиками запросов и сообщениями парсера.
+"""
+import asyncio
+import concurrent.futures
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    GEO, CATEGORY, TIMEFRAMES, REQUEST_DELAY_MIN, REQUEST_DELAY_MAX, RETRY_INITIAL_DELAY, TRENDS_BACKEND,
+    ASYNC_WORKERS, ASYNC_QUEUE_SIZE,
+)
+from rate_limiter import RateLimiter
+
+
+class JobCancelled(BaseException):
+    """
+    Задача отменена всеми ожидающими
+    
+    Наследуется от BaseException, чтобы пройти сквозь обработчики ошибок и ретраи
+    парсера (except Exception) и остановить задачу на границе запроса.
+    """
+
+
+class TrendsResult:
+    """Результат операции клиента"""
+    
+    __slots__ = ("kind", "value", "requests", "cache_hits", "waited", "elapsed", "messages")
+    
+    def __init__(self, kind, value, requests, cache_hits, waited, elapsed, messages):
+        """
+        Args:
+            kind: Операция (interest, related, regional, country)
+            value: Результат операции или None, если данных нет или запросы не удались
+            requests: Сколько HTTP-запросов выполнено
+            cache_hits: Сколько ответов взято из кэша
+            waited: Сколько секунд задача ждала ограничитель частоты и квоту
+            elapsed: Длительность выполнения в воркере, секунд
+            messages: Сообщения парсера (ошибки, повторы)
+        """
+        self.kind = kind
+        self.value = value
+        self.requests = requests
+        self.cache_hits = cache_hits
+        self.waited = waited
+        self.elapsed = elapsed
+        self.messages = messages
+    
+    @property
+    def ok(self):
+        """Операция вернула данные"""
+        return self.value is not None
+
+
+class AsyncRateLimiter:
+    """Ограничитель частоты для цикла событий: интервал между запросами и общая квота хоста"""
+    
+    def __init__(self, delay_min=REQUEST_DELAY_MIN, delay_max=REQUEST_DELAY_MAX, ledger=None):
+        """
+        Args:
+            delay_min: Минимальный интервал между запросами в секундах
+            delay_max: Максимальный интервал между запросами в секундах
+            ledger: Общий журнал квоты (QuotaLedger) или None; обращения к нему идут
+                    в пуле потоков по одному (под блокировкой ограничителя)
+        """
+        self.delay_min = delay_min
+        self.delay_max = delay_max
+        self.ledger = ledger
+        self._lock = None
+        self._next_allowed = 0.0
+    
+    def next_delay(self):
+        """Возвращает случайный интервал между delay_min и delay_max"""
+        return random.uniform(self.delay_min, self.delay_max)
+    
+    async def acquire(self):
+        """
+        Ждет своей очереди и разрешенного момента для запроса
+        
+        Returns:
+            float: Сколько секунд пришлось ждать
+        """
+        if self._lock is None:
+            # Lock создается в работающем цикле событий; ожидающие обслуживаются по порядку
+            self._lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        async with self._lock:
+            remaining = self._next_allowed - loop.time()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            if self.ledger is not None:
+                # BEGIN IMMEDIATE ждет блокировку базы до 30 сек - не в потоке цикла событий
+                quota_wait = await loop.run_in_executor(None, self.ledger.try_reserve)
+                while quota_wait > 0:
+                    await asyncio.sleep(quota_wait)
+                    quota_wait = await loop.run_in_executor(None, self.ledger.try_reserve)
+            self._next_allowed = loop.time() + self.next_delay()
+        return loop.time() - start
+
+
+class _WorkerRateLimiter(RateLimiter):
+    """Ограничитель парсера воркера: ожидание выполняет общий AsyncRateLimiter в цикле событий"""
+    
+    def __init__(self, limiter, loop):
+        super().__init__(0, 0)
+        self.limiter = limiter
+        self.loop = loop
+        self.job = None
+    
+    def time_until_next(self):
+        return 0.0
+    
+    def wait(self, prefetch=None):
+        job = self.job
+        if job.cancelled:
+            raise JobCancelled()
+        job.pending = asyncio.run_coroutine_threadsafe(self.limiter.acquire(), self.loop)
+        try:
+            waited = job.pending.result()
+        except concurrent.futures.CancelledError:
+            raise JobCancelled() from None
+        finally:
+            job.pending = None
+        job.waited += waited
+        if job.cancelled:
+            raise JobCancelled()
+        # Ожидание шло в цикле событий, токены запрашиваются уже после разрешения
+        if prefetch is not None:
+            prefetch()
+        return waited
+    
+    def mark(self):
+        # Интервал отсчитывается от момента разрешения в AsyncRateLimiter
+        pass
+
+
+class _Job:
+    """Задача очереди: вызов парсера и future для ожидающих"""
+    
+    __slots__ = ("kind", "call", "future", "waiters", "cancelled", "pending", "waited", "messages")
+    
+    def __init__(self, kind, call, future):
+        self.kind = kind
+        self.call = call
+        self.future = future
+        self.waiters = 0
+        self.cancelled = False
+        self.pending = None
+        self.waited = 0.0
+        self.messages = []
+    
+    def cancel(self):
+        """Отменяет задачу (вызывается в цикле событий)"""
+        self.cancelled = True
+        pending = self.pending
+        if pending is not None:
+            pending.cancel()
+        self.future.cancel()
+
+
+class _Worker:
+    """Поток с собственным парсером и HTTP-сессией"""
+    
+    def __init__(self, client, index):
+        self.client = client
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"trends-worker-{index}")
+        self.limiter = _WorkerRateLimiter(client.rate_limiter, client._loop)
+        self.parser = None
+        self.job = None
+    
+    def _log(self, message):
+        if self.job is not None:
+            self.job.messages.append(message.strip())
+    
+    def execute(self, job):
+        """Выполняет задачу в потоке воркера"""
+        if self.parser is None:
+            # Парсер (и requests) создается в потоке воркера и используется только в нем
+            from google_trends_parser import GoogleTrendsParser
+            self.parser = GoogleTrendsParser(geo=self.client.geo, category=self.client.category,
+                                             cache=self.client.cache, backend=self.client.backend,
+                                             rate_limiter=self.limiter, log=self._log,
+                                             retry_initial_delay=self.client.retry_initial_delay)
+        parser = self.parser
+        self.job = self.limiter.job = job
+        requests_before, hits_before = parser.request_count, parser.cache_hits
+        start = time.perf_counter()
+        try:
+            value = job.call(parser)
+        except JobCancelled:
+            return None
+        finally:
+            self.job = self.limiter.job = None
+        return TrendsResult(job.kind, value, parser.request_count - requests_before,
+                            parser.cache_hits - hits_before, job.waited, time.perf_counter() - start,
+                            job.messages)
+
+
+class AsyncTrendsClient:
+    """Асинхронный клиент Google Trends с общей очередью, ограничителем и кэшем"""
+    
+    def __init__(self, geo=GEO, category=CATEGORY, workers=ASYNC_WORKERS, queue_size=ASYNC_QUEUE_SIZE,
+                 cache=None, rate_limiter=None, backend=TRENDS_BACKEND, retry_initial_delay=RETRY_INITIAL_DELAY,
+                 locations=None):
+        """
+        Args:
+            geo: Код геолокации по умолчанию
+            category: Категория поиска
+            workers: Количество потоков (у каждого своя HTTP-сессия)
+            queue_size: Размер очереди задач (обратное давление)
+            cache: Кэш ответов (TrendsCache) или None
+            rate_limiter: Общий AsyncRateLimiter (по умолчанию - интервалы из config)
+            backend: Бэкенд Google Trends ("native" или "pytrends")
+            retry_initial_delay: Начальная задержка перед повтором
+            locations: Конфигурация стран (LocationConfig) для countries() без явного
+                       списка; файл перечитывается при изменении (по умолчанию - из config)
+        """
+        self.geo = geo
+        self.category = category
+        self.workers = workers
+        self.queue_size = queue_size
+        self.cache = cache
+        self.rate_limiter = rate_limiter or AsyncRateLimiter()
+        self.backend = backend
+        self.retry_initial_delay = retry_initial_delay
+        self.locations = locations
+        self._loop = None
+        self._queue = None
+        self._inflight = {}
+        self._workers = []
+        self._tasks = []
+    
+    async def start(self):
+        """Запускает воркеры (вызывается автоматически в async with)"""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.queue_size)
+        self._workers = [_Worker(self, index) for index in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._run_worker(worker)) for worker in self._workers]
+    
+    async def close(self):
+        """Отменяет задачи в очереди и останавливает воркеры"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            self._queue.get_nowait().cancel()
+        for job in list(self._inflight.values()):
+            job.cancel()
+        for worker in self._workers:
+            # Поток с незавершенным HTTP-запросом доработает сам, ждать его не нужно
+            worker.executor.shutdown(wait=False)
+        self._tasks = []
+        self._workers = []
+    
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    @property
+    def queued(self):
+        """Сколько задач ждет в очереди"""
+        return self._queue.qsize() if self._queue is not None else 0
+    
+    async def _run_worker(self, worker):
+        """Берет задачи из очереди и выполняет их в потоке воркера"""
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.cancelled:
+                    continue
+                try:
+                    result = await self._loop.run_in_executor(worker.executor, worker.execute, job)
+                except Exception as e:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    if not job.future.done():
+                        job.future.set_result(result)
+            finally:
+                self._queue.task_done()
+    
+    def _release(self, job):
+        """Снимает одного ожидающего; задача без ожидающих отменяется"""
+        job.waiters -= 1
+        if job.waiters == 0 and not job.future.done():
+            job.cancel()
+    
+    def _forget(self, key, job):
+        """Убирает завершенную задачу из выполняемых (если ее не сменила новая)"""
+        if self._inflight.get(key) is job:
+            del self._inflight[key]
+    
+    async def _submit(self, kind, key, call):
+        """
+        Ставит вызов парсера в очередь (или присоединяется к такому же) и ждет результат
+        
+        Returns:
+            TrendsResult: Результат операции
+        """
+        if not self._tasks:
+            await self.start()
+        job = self._inflight.get(key)
+        if job is not None:
+            job.waiters += 1
+        else:
+            # Задача регистрируется до постановки в очередь: пока очередь полна,
+            # одинаковые вызовы присоединяются к ней, а не ставят свою
+            job = _Job(kind, call, self._loop.create_future())
+            job.waiters += 1
+            self._inflight[key] = job
+            job.future.add_done_callback(lambda _: self._forget(key, job))
+            # Постановка - отдельная задача: если создатель отменен, присоединившиеся
+            # вызовы все равно дождутся выполнения
+            enqueue = self._loop.create_task(self._queue.put(job))
+            try:
+                await asyncio.shield(enqueue)
+            except asyncio.CancelledError:
+                self._release(job)
+                if job.cancelled:
+                    enqueue.cancel()
+                raise
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            self._release(job)
+            raise
+    
+    async def interest(self, queries, timeframe, geo=None):
+        """
+        Средний интерес и ряд интереса для пакета запросов (до 5)
+        
+        Returns:
+            TrendsResult: value - {"averages": {query: avg}, "series": {...}} или None
+        """
+        geo = geo or self.geo
+        queries = list(queries)
+        
+        def call(parser):
+            averages, series = parser.get_interest_summary(queries, timeframe, geo=geo)
+            return {"averages": averages, "series": series} if averages is not None else None
+        return await self._submit("interest", ("interest", tuple(queries), timeframe, geo), call)
+    
+    async def related(self, query, timeframe, geo=None):
+        """
+        Связанные запросы
+        
+        Returns:
+            TrendsResult: value - {"top": [...], "rising": [...]} или None
+        """
+        geo = geo or self.geo
+        return await self._submit(
+            "related", ("related", query, timeframe, geo),
+            lambda parser: parser.get_related_queries(query, timeframe, geo=geo) or None,
+        )
+    
+    async def regional(self, queries, timeframe, keyword, resolution="REGION", geo=None):
+        """
+        Региональный интерес к запросу из пакета
+        
+        Returns:
+            TrendsResult: value - {resolution, query, codes, names, values} или None
+        """
+        geo = geo or self.geo
+        queries = list(queries)
+        return await self._submit(
+            "regional", ("regional", tuple(queries), timeframe, keyword, resolution, geo),
+            lambda parser: parser.get_regional_interest(queries, timeframe, keyword, resolution=resolution, geo=geo),
+        )
+    
+    async def country(self, country_name, queries, timeframes=None, geo=None):
+        """
+        Полный результат страны по всем периодам (как parse_country_queries)
+        
+        Returns:
+            TrendsResult: value - CountryResult или None
+        """
+        geo = geo or self.geo
+        timeframes = timeframes or TIMEFRAMES
+        queries = list(queries)
+        return await self._submit(
+            "country", ("country", country_name, tuple(queries), tuple(timeframes.items()), geo),
+            lambda parser: parser.parse_country_queries(country_name, queries, timeframes, geo=geo),
+        )
+    
+    async def countries(self, all_queries=None, timeframes=None, geo=None):
+        """
+        Результаты всех стран; задачи ставятся в очередь сразу и выполняются по мере очереди
+        
+        Args:
+            all_queries: Словарь {country_name: [queries]}; None - текущая конфигурация
+                         стран (с учетом изменений файла)
+        
+        Returns:
+            dict: {country_name: TrendsResult}
+        """
+        if all_queries is None:
+            if self.locations is None:
+                from locations import LocationConfig
+                self.locations = LocationConfig()
+            all_queries = self.locations.queries
+        names = list(all_queries)
+        results = await asyncio.gather(*(
+            self.country(name, all_queries[name], timeframes, geo) for name in names
+        ))
+        return dict(zip(names, results))
+
+
+if __name__ == "__main__":
+    from locations import LocationConfig
+    
+    async def demo():
+        # Несколько потребителей одного клиента: запросы идут через общий ограничитель
+        locations = LocationConfig()
+        all_queries = locations.queries
+        async with AsyncTrendsClient(locations=locations) as client:
+            turkey, armenia = await asyncio.gather(
+                client.country("Турция", all_queries["Турция"]),
+                client.interest(all_queries["Армения"], TIMEFRAMES["1_month"]),
+            )
+        for name, result in (("Турция", turkey), ("Армения", armenia)):
+            print(f"{name}: ok={result.ok}, запросов {result.requests}, из кэша {result.cache_hits}, "
+                  f"ожидание {result.waited:.1f} сек, сообщений {len(result.messages)}")
+    
+    asyncio.run(demo())
@@ -0,0 +1,140 @@
+"""
+Бенчмарк представления результатов: вложенные словари против записей со __slots__
+
+Генерирует синтетические результаты для N стран (2 периода, 5 запросов, связанные
+запросы, регионы и дневной ряд за 90 дней), измеряет память через tracemalloc и
+время типичных обращений анализатора (интерес, связанные запросы, все запросы).
+Строки запросов и названий регионов записи разделяют со словарями, поэтому в
+памяти записей учитываются только контейнеры и числа.
+
+Использование:
+    python bench_records.py
+    python bench_records.py --countries 5000 --repeat 5
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from records import as_country_result
+
+PERIODS = ("1_month", "3_months")
+QUERIES_PER_COUNTRY = 5
+RELATED_PER_LIST = 25
+REGIONS = 80
+SERIES_DAYS = 90
+
+
+def make_country_data(idx, rng):
+    """Словарь страны в формате parse_country_queries до перехода на записи"""
+    queries = [f"впн страна{idx} вариант{q}" for q in range(QUERIES_PER_COUNTRY)]
+    timestamps = [1760000000 + 86400 * day for day in range(SERIES_DAYS)]
+    country = {"country": f"Страна {idx}", "geo": "RU", "queries": {}}
+    for period in PERIODS:
+        averages = {query: rng.uniform(1, 100) for query in queries}
+        top_query = max(averages, key=averages.get)
+        country["queries"][period] = {
+            "averages": averages,
+            "max_interest": averages[top_query],
+            "top_query": top_query,
+            "all_queries": queries,
+            "related_queries": {
+                name: [{"query": f"{top_query} {name} {r}", "value": rng.randint(1, 100)}
+                       for r in range(RELATED_PER_LIST)]
+                for name in ("top", "rising")
+            },
+            "regions": {
+                "resolution": "REGION",
+                "query": top_query,
+                "codes": [f"RU-{r:03d}" for r in range(REGIONS)],
+                "names": [f"Регион {r}" for r in range(REGIONS)],
+                "values": [float(rng.randint(0, 100)) for _ in range(REGIONS)],
+            },
+            "series": {
+                "timestamps": timestamps,
+                "values": {query: [float(rng.randint(0, 100)) for _ in range(SERIES_DAYS)]
+                           for query in queries},
+            },
+        }
+    return country
+
+
+def measure_memory(build):
+    """Возвращает (результат, занятая память в байтах)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def access_dicts(data):
+    """Обращения анализатора к словарям (как до перехода на записи)"""
+    total = 0
+    for country in data.values():
+        for period in PERIODS:
+            period_data = country["queries"][period]
+            total += period_data["max_interest"]
+            related = period_data["related_queries"]
+            total += len([{"query": q["query"], "interest": q["value"]} for q in related["top"][:10]])
+            total += len([{"query": q["query"], "interest": q["value"]} for q in related["rising"][:10]])
+            total += sum(v for v in period_data["averages"].values())
+    return total
+
+
+def access_records(data):
+    """Те же обращения к записям"""
+    total = 0
+    for country in data.values():
+        for period in PERIODS:
+            period_data = country.periods[period]
+            total += period_data.max_interest
+            total += len([{"query": q.query, "interest": q.value} for q in period_data.related_top[:10]])
+            total += len([{"query": q.query, "interest": q.value} for q in period_data.related_rising[:10]])
+            total += sum(period_data.interests)
+    return total
+
+
+def best_time(func, data, repeat):
+    """Лучшее время выполнения func(data) в мс"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def main():
+    """Главная функция бенчмарка"""
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк представления результатов")
+    arg_parser.add_argument("--countries", type=int, default=2000, help="количество стран")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="повторов замера времени")
+    args = arg_parser.parse_args()
+    
+    rng = random.Random(0)
+    dicts, dict_bytes = measure_memory(
+        lambda: {f"Страна {i}": make_country_data(i, rng) for i in range(args.countries)}
+    )
+    
+    start = time.perf_counter()
+    records, record_bytes = measure_memory(
+        lambda: {name: as_country_result(country) for name, country in dicts.items()}
+    )
+    convert_ms = (time.perf_counter() - start) * 1000
+    
+    dict_ms = best_time(access_dicts, dicts, args.repeat)
+    record_ms = best_time(access_records, records, args.repeat)
+    
+    print(f"Стран: {args.countries}, периодов: {len(PERIODS)}")
+    print("-" * 60)
+    print(f"{'':<24} {'Словари':>12} {'Записи':>12} {'Выигрыш':>9}")
+    print(f"{'Память, МБ':<24} {dict_bytes / 2**20:>12.1f} {record_bytes / 2**20:>12.1f} "
+          f"{dict_bytes / record_bytes:>8.1f}x")
+    print(f"{'Обращения, мс':<24} {dict_ms:>12.1f} {record_ms:>12.1f} {dict_ms / record_ms:>8.1f}x")
+    print(f"Преобразование при загрузке: {convert_ms:.0f} мс (один раз, под tracemalloc)")
+
+
+if __name__ == "__main__":
+    main()
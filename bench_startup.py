@@ -0,0 +1,99 @@
+"""
+Бенчмарк времени запуска путей, которые не обращаются к сети
+
+Запускает каждый путь в отдельном процессе несколько раз, выводит медиану и
+минимум и завершается с кодом 1, если медиана превышает бюджет или при импорте
+подгружаются тяжелые зависимости (requests, pandas, pytrends, numpy).
+
+Использование:
+    python bench_startup.py
+    python bench_startup.py --runs 20 --budget-ms 100
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Пути CLI без обращения к сети: генерация запросов, план, отчет анализатора
+COMMANDS = {
+    "query_builder": ["query_builder.py"],
+    "main --plan": ["main.py", "--plan"],
+    "analyzer report": ["analyzer.py"],
+}
+
+# Модули, которые не должны импортироваться при загрузке main
+HEAVY_MODULES = ["requests", "pandas", "pytrends", "numpy"]
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(args, runs):
+    """
+    Запускает команду runs раз и возвращает список длительностей в мс
+    
+    Args:
+        args: Аргументы для python
+        runs: Количество запусков
+    
+    Returns:
+        list: Длительности в миллисекундах
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=PROJECT_DIR, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def find_heavy_imports():
+    """Возвращает тяжелые модули, загруженные при импорте main"""
+    code = (
+        "import sys, main; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_DIR, check=True,
+                            capture_output=True, text=True).stdout.strip()
+    return [name for name in output.split(",") if name]
+
+
+def main():
+    """Главная функция бенчмарка"""
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк времени запуска CLI")
+    arg_parser.add_argument("--runs", type=int, default=10, help="запусков на команду")
+    arg_parser.add_argument("--budget-ms", type=float, default=100.0,
+                            help="бюджет медианного времени запуска в мс")
+    args = arg_parser.parse_args()
+    
+    baseline = statistics.median(measure(["-c", "pass"], args.runs))
+    print(f"Интерпретатор без кода: {baseline:.1f} мс (медиана)")
+    print("-" * 60)
+    print(f"{'Команда':<20} {'Медиана, мс':>12} {'Мин, мс':>10} {'Свое, мс':>10}")
+    
+    failed = False
+    for name, command in COMMANDS.items():
+        timings = measure(command, args.runs)
+        median = statistics.median(timings)
+        print(f"{name:<20} {median:>12.1f} {min(timings):>10.1f} {median - baseline:>10.1f}")
+        if median > args.budget_ms:
+            failed = True
+    
+    heavy = find_heavy_imports()
+    print("-" * 60)
+    if heavy:
+        print(f"❌ При импорте main загружаются тяжелые модули: {', '.join(heavy)}")
+        failed = True
+    else:
+        print("✓ Импорт main не загружает requests/pandas/pytrends/numpy")
+    
+    if failed:
+        print(f"❌ Превышен бюджет запуска {args.budget_ms:.0f} мс")
+        sys.exit(1)
+    print(f"✓ Все команды укладываются в {args.budget_ms:.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Запись и воспроизведение HTTP-обмена с Google Trends (кассеты)
+
+Кассета - gzip-файл в формате JSON lines: первая строка - заголовок, далее по
+строке на каждый HTTP-обмен NativeTrendsBackend (cookie, explore с токенами
+виджетов, данные виджетов) с телом ответа, кодом и длительностью. При
+воспроизведении ответы выдаются по ключу (метод, URL, параметры) в порядке
+записи, с исходной или нулевой задержкой, без обращения к сети.
+"""
+import gzip
+import json
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+
+CASSETTE_VERSION = 1
+
+
+class CassetteError(Exception):
+    """В кассете нет ответа на запрос или файл кассеты поврежден"""
+
+
+class ReplayedRequestError(Exception):
+    """Ошибка соединения, записанная в кассету и воспроизведенная"""
+
+
+class CassetteResponse:
+    """Ответ из кассеты (подмножество интерфейса requests.Response)"""
+    
+    __slots__ = ("status_code", "text")
+    
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+
+def _exchange_key(method, url, params):
+    """Ключ сопоставления запроса: метод, URL и параметры в стабильном порядке"""
+    params = {str(k): str(v) for k, v in (params or {}).items()}
+    return json.dumps([method.lower(), url, params], ensure_ascii=False, sort_keys=True)
+
+
+class RecordingSession:
+    """Обертка над requests.Session, записывающая каждый обмен в кассету"""
+    
+    def __init__(self, session, cassette):
+        self._session = session
+        self._cassette = cassette
+        self.headers = session.headers
+    
+    def request(self, method, url, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self._session.request(method, url, params=params, **kwargs)
+        except Exception as e:
+            self._cassette.write_exchange(method, url, params, None, None,
+                                          time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+            raise
+        self._cassette.write_exchange(method, url, params, response.status_code, response.text,
+                                      time.perf_counter() - start)
+        return response
+    
+    def get(self, url, params=None, **kwargs):
+        return self.request("get", url, params=params, **kwargs)
+    
+    def close(self):
+        self._session.close()
+
+
+class ReplaySession:
+    """Сессия, отдающая ответы из кассеты вместо сети"""
+    
+    def __init__(self, cassette):
+        self._cassette = cassette
+        self.headers = {}
+    
+    def request(self, method, url, params=None, **kwargs):
+        return self._cassette.next_response(method, url, params)
+    
+    def get(self, url, params=None, **kwargs):
+        return self.request("get", url, params=params, **kwargs)
+    
+    def close(self):
+        pass
+
+
+class Cassette:
+    """Кассета HTTP-обмена в режиме записи ("record") или воспроизведения ("replay")"""
+    
+    def __init__(self, path, mode, latency="zero"):
+        """
+        Args:
+            path: Путь к файлу кассеты (.jsonl.gz)
+            mode: "record" или "replay"
+            latency: Задержка при воспроизведении: "zero" или "original"
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Неизвестный режим кассеты: {mode}")
+        if latency not in ("zero", "original"):
+            raise ValueError(f"Неизвестный режим задержки: {latency}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.exchanges = 0
+        self._file = None
+        self._replay = defaultdict(deque)
+        
+        if mode == "record":
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+            self._started = time.perf_counter()
+            self._write({"version": CASSETTE_VERSION, "created": datetime.now().isoformat(timespec="seconds")})
+        else:
+            self._load()
+    
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # Сброс после каждой записи: кассета читается даже после аварийного завершения
+        self._file.flush()
+    
+    def _load(self):
+        """Загружает обмены кассеты в очереди по ключу запроса"""
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                header = json.loads(next(f))
+                if header.get("version") != CASSETTE_VERSION:
+                    raise CassetteError(f"Неподдерживаемая версия кассеты: {header.get('version')}")
+                for line in f:
+                    record = json.loads(line)
+                    self._replay[record["key"]].append(record)
+        except (OSError, ValueError, StopIteration) as e:
+            raise CassetteError(f"Не удалось прочитать кассету {self.path}: {e}") from e
+    
+    def write_exchange(self, method, url, params, status, text, elapsed, error=None):
+        """Записывает один HTTP-обмен"""
+        record = {
+            "key": _exchange_key(method, url, params),
+            "offset": round(time.perf_counter() - self._started, 4),
+            "elapsed": round(elapsed, 4),
+            "status": status,
+            "text": text,
+        }
+        if error is not None:
+            record["error"] = error
+        self._write(record)
+        self.exchanges += 1
+    
+    def next_response(self, method, url, params):
+        """
+        Возвращает следующий записанный ответ на запрос
+        
+        Raises:
+            CassetteError: Запрос не записан или записанные ответы закончились
+            ReplayedRequestError: При записи запрос завершился ошибкой соединения
+        """
+        queue = self._replay.get(_exchange_key(method, url, params))
+        if not queue:
+            raise CassetteError(f"В кассете нет ответа на {method.upper()} {url} {params or ''}")
+        record = queue.popleft()
+        self.exchanges += 1
+        
+        if self.latency == "original":
+            time.sleep(record["elapsed"])
+        if "error" in record:
+            raise ReplayedRequestError(record["error"])
+        return CassetteResponse(record["status"], record["text"])
+    
+    def wrap(self, session_factory):
+        """
+        Возвращает сессию для бэкенда
+        
+        Args:
+            session_factory: Функция, создающая настоящую requests.Session
+                             (вызывается только в режиме записи)
+        """
+        if self.mode == "replay":
+            return ReplaySession(self)
+        return RecordingSession(session_factory(), self)
+    
+    @property
+    def remaining(self):
+        """Сколько записанных обменов еще не воспроизведено"""
+        return sum(len(queue) for queue in self._replay.values())
+    
+    def close(self):
+        """Закрывает файл записи"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
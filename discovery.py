@@ -0,0 +1,191 @@
+"""
+Поиск новых запросов через связанные запросы Google Trends
+
+Обход в ширину от вариаций запросов стран: фронтир - очередь с приоритетом
+(сначала меньшая глубина, затем больший вес), термины дедуплицируются после
+нормализации, сетевые запросы ограничены бюджетом, глубина - лимитом. Каждое
+раскрытие идет через GoogleTrendsParser.get_related_queries, поэтому попадает в
+кэш и проходит через общий ограничитель частоты.
+"""
+import heapq
+import re
+
+# Токены, по которым запрос считается VPN-запросом
+VPN_TOKENS = ("впн", "vpn")
+
+# Значение rising ("+5000%", "Прорыв") ограничивается, чтобы не вытеснять top
+RISING_CAP = 500
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_query(query):
+    """
+    Нормализует запрос для дедупликации
+    
+    Нижний регистр, ё -> е, без пунктуации, слова по алфавиту
+    ("ВПН Турция!" и "турция впн" дают один ключ).
+    
+    Args:
+        query: Поисковый запрос
+    
+    Returns:
+        str: Ключ запроса
+    """
+    words = _NON_WORD.sub(" ", query.lower().replace("ё", "е")).split()
+    return " ".join(sorted(words))
+
+
+def is_vpn_query(query):
+    """Запрос содержит VPN-токен"""
+    key = normalize_query(query)
+    return any(token in key for token in VPN_TOKENS)
+
+
+def build_location_index(countries_config):
+    """
+    Строит индекс основ названий для определения страны запроса
+    
+    Args:
+        countries_config: Словарь с конфигурацией стран
+    
+    Returns:
+        list: [(основа, название страны)] по убыванию длины основы
+    """
+    index = []
+    for country_name, data in countries_config.items():
+        names = [country_name, data.get("name_en"), data.get("name_ru_short"),
+                 data.get("adjective_ru"), data.get("adjective_ru_alt"), data.get("adjective_en")]
+        aliases = data.get("name_ru_alt") or []
+        names.extend([aliases] if isinstance(aliases, str) else aliases)
+        for city in data.get("cities", []):
+            if isinstance(city, str):
+                names.append(city)
+            else:
+                names.extend([city.get("ru"), city.get("en")])
+        
+        for name in filter(None, names):
+            for word in normalize_query(name).split():
+                # Основа без окончания: "турецкий" и "турецкая" -> "турец"
+                stem = word[:max(4, len(word) - 2)]
+                if len(stem) >= 3:
+                    index.append((stem, country_name))
+    index.sort(key=lambda item: -len(item[0]))
+    return index
+
+
+def match_location(query, location_index):
+    """Возвращает страну, к которой относится запрос, или None"""
+    for word in normalize_query(query).split():
+        for stem, country_name in location_index:
+            if word.startswith(stem):
+                return country_name
+    return None
+
+
+class DiscoveryCrawler:
+    """Обход связанных запросов в ширину с бюджетом сетевых запросов"""
+    
+    def __init__(self, parser, timeframe, budget, max_depth, geo=None, location_index=None,
+                 vpn_only=True):
+        """
+        Args:
+            parser: GoogleTrendsParser (кэш, ограничитель частоты, бэкенд)
+            timeframe: Период связанных запросов
+            budget: Максимум сетевых запросов (раскрытия из кэша бесплатны)
+            max_depth: Максимальная глубина раскрытия (0 - только исходные запросы)
+            geo: Код геолокации (по умолчанию - геолокация парсера)
+            location_index: Индекс build_location_index или None
+            vpn_only: Раскрывать и выводить только VPN-запросы
+        """
+        self.parser = parser
+        self.timeframe = timeframe
+        self.budget = budget
+        self.max_depth = max_depth
+        self.geo = geo
+        self.location_index = location_index or []
+        self.vpn_only = vpn_only
+        
+        self.frontier = []
+        self.seen = {}
+        self.expanded = 0
+        self.network_requests = 0
+        self._seq = 0
+    
+    def _push(self, query, score, depth, parent, source):
+        """Добавляет запрос во фронтир, если такой ключ еще не встречался"""
+        key = normalize_query(query)
+        if not key or key in self.seen:
+            return
+        self.seen[key] = {
+            "query": query,
+            "score": score,
+            "depth": depth,
+            "parent": parent,
+            "source": source,
+            "country": match_location(query, self.location_index),
+        }
+        if depth <= self.max_depth:
+            self._seq += 1
+            heapq.heappush(self.frontier, (depth, -score, self._seq, key))
+    
+    def add_seeds(self, seeds):
+        """
+        Добавляет исходные запросы
+        
+        Args:
+            seeds: Словарь {query: score}; больший score раскрывается раньше
+        """
+        for query, score in seeds.items():
+            self._push(query, score, 0, None, "seed")
+    
+    def crawl(self, verbose=True):
+        """
+        Раскрывает фронтир, пока не исчерпан бюджет или фронтир
+        
+        Returns:
+            int: Количество раскрытых запросов
+        """
+        while self.frontier and self.network_requests < self.budget:
+            depth, neg_score, _, key = heapq.heappop(self.frontier)
+            entry = self.seen[key]
+            
+            requests_before = self.parser.request_count
+            related = self.parser.get_related_queries(entry["query"], self.timeframe, geo=self.geo) or {}
+            self.network_requests += self.parser.request_count - requests_before
+            self.expanded += 1
+            
+            if verbose:
+                print(f"  [{self.network_requests}/{self.budget}] глубина {depth}: {entry['query']}")
+            
+            for source in ("top", "rising"):
+                for item in related.get(source) or []:
+                    if self.vpn_only and not is_vpn_query(item["query"]):
+                        continue
+                    value = item["value"] if isinstance(item["value"], (int, float)) else RISING_CAP
+                    if source == "rising":
+                        value = min(value, RISING_CAP) / RISING_CAP * 100
+                    # Вес потомка: доля от веса родителя
+                    score = -neg_score * value / 100
+                    self._push(item["query"], score, depth + 1, entry["query"], source)
+        
+        return self.expanded
+    
+    def discoveries(self, known_queries=(), limit=None):
+        """
+        Возвращает найденные запросы, которых нет среди отслеживаемых
+        
+        Args:
+            known_queries: Уже отслеживаемые запросы (вариации стран)
+            limit: Количество результатов (None - все)
+        
+        Returns:
+            list: [{query, score, depth, parent, source, country}] по убыванию веса
+        """
+        known = {normalize_query(query) for query in known_queries}
+        found = [
+            entry for key, entry in self.seen.items()
+            if entry["depth"] > 0 and key not in known
+        ]
+        found.sort(key=lambda entry: -entry["score"])
+        return found[:limit]
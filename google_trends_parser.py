@@ -3,9 +3,16 @@
 """
 import time
 import random
-from pytrends.request import TrendReq
-import pandas as pd
-from config import GEO, CATEGORY, REQUEST_DELAY, REQUEST_DELAY_MIN, REQUEST_DELAY_MAX, TIMEFRAMES
+from contextlib import contextmanager
+from config import (
+    GEO, CATEGORY, REQUEST_DELAY, REQUEST_DELAY_MIN, REQUEST_DELAY_MAX, TIMEFRAMES,
+    MAX_RETRIES, RETRY_INITIAL_DELAY, MAX_QUERIES_PER_REQUEST, TRENDS_BACKEND, REGION_PERIOD,
+)
+from trends_cache import TrendsCache
+from trends_backends import create_backend
+from profiler import NullProfiler
+from rate_limiter import RateLimiter
+from records import CountryResult, PeriodResult
 
 # Список user-agent заголовков для ротации
 USER_AGENTS = [
@@ -21,160 +28,287 @@ USER_AGENTS = [
 class GoogleTrendsParser:
     """Класс для парсинга данных из Google Trends"""
     
-    def __init__(self, geo="RU", category=CATEGORY, delay_min=REQUEST_DELAY_MIN, delay_max=REQUEST_DELAY_MAX):
+    def __init__(self, geo=GEO, category=CATEGORY, delay_min=REQUEST_DELAY_MIN, delay_max=REQUEST_DELAY_MAX,
+                 cache=None, profiler=None, backend=TRENDS_BACKEND, rate_limiter=None,
+                 region_resolution=None, region_period=REGION_PERIOD, cassette=None,
+                 retry_initial_delay=RETRY_INITIAL_DELAY, detector=None, sampler=None, proxy_pool=None,
+                 log=print):
         """
         Инициализация парсера
         
         Args:
-            geo: Код страны для геолокации (RU - Россия)
+            geo: Код страны для геолокации по умолчанию (RU - Россия)
             category: Категория поиска (13 - IT/Интернет)
             delay_min: Минимальная задержка между запросами в секундах
             delay_max: Максимальная задержка между запросами в секундах
+            cache: Кэш ответов (TrendsCache) или None для работы без кэша
+            profiler: Профилировщик фаз (PhaseProfiler) или None
+            backend: Бэкенд Google Trends ("native" или "pytrends")
+            rate_limiter: Общий ограничитель частоты (RateLimiter) или None
+            region_resolution: Региональный режим (REGION или CITY), None - выключен
+            region_period: Период, для которого собираются региональные данные
+            cassette: Кассета записи/воспроизведения HTTP (cassette.Cassette) или None;
+                      поддерживается только бэкендом native
+            retry_initial_delay: Начальная задержка перед повтором (0 - без ожидания)
+            detector: Потоковый детектор аномалий (AnomalyDetector) или None; получает
+                      каждый ряд интереса
+            sampler: Хранилище повторных выборок (resampling.SampleStore) или None;
+                     получает средние каждого ответа из сети
+            proxy_pool: Пул исходящих адресов (proxy_pool.ProxyPool) или None; поддерживается
+                        только бэкендом native, по умолчанию интервал выдерживается для
+                        каждого выхода (ProxyRateLimiter)
+            log: Функция вывода сообщений о ходе работы (по умолчанию print)
         """
         self.geo = geo
         self.category = category
         self.delay_min = delay_min
         self.delay_max = delay_max
+        self.cache = cache
+        self.region_resolution = region_resolution
+        self.region_period = region_period
+        self.retry_initial_delay = retry_initial_delay
+        self.detector = detector
+        self.sampler = sampler
+        self.log = log
         self.request_count = 0
+        self.cache_hits = 0
+        self.proxy_pool = proxy_pool
+        if rate_limiter is None and proxy_pool is not None:
+            from proxy_pool import ProxyRateLimiter
+            rate_limiter = ProxyRateLimiter(proxy_pool, delay_min, delay_max)
+        self.rate_limiter = rate_limiter or RateLimiter(delay_min, delay_max)
+        self.profiler = profiler or NullProfiler()
         self.current_user_agent = random.choice(USER_AGENTS)
-        self.reinit_pytrends()
+        
+        backend_kwargs = {"profiler": self.profiler}
+        if cassette is not None:
+            if backend != "native":
+                raise ValueError("Запись и воспроизведение HTTP поддерживаются только бэкендом native")
+            backend_kwargs["cassette"] = cassette
+        if proxy_pool is not None:
+            if backend != "native":
+                raise ValueError("Пул прокси поддерживается только бэкендом native")
+            backend_kwargs["proxy_pool"] = proxy_pool
+        self.backend = create_backend(backend, self.current_user_agent, **backend_kwargs)
         
     def get_random_delay(self):
         """Возвращает случайную задержку между delay_min и delay_max"""
-        return random.uniform(self.delay_min, self.delay_max)
+        return self.rate_limiter.next_delay()
+    
+    @contextmanager
+    def _request_slot(self, verbose=False, prefetch=None):
+        """
+        Ждет разрешенного ограничителем момента, затем учитывает выполненный запрос
+    
+        Интервал до следующего запроса отсчитывается от отправки этого, поэтому
+        ответ, разбор и обработка результата идут внутри паузы. prefetch (токены
+        explore для запроса) выполняется в начале паузы, а не после нее.
+        """
+        remaining = self.rate_limiter.time_until_next()
+        if remaining > 0 and verbose:
+            self.log(f"    Задержка: {remaining:.1f} сек...")
+        # wait() вызывается всегда: запрос резервируется в общем журнале квоты
+        with self.profiler.phase("sleep"):
+            try:
+                self.rate_limiter.wait(prefetch)
+            except Exception:
+                # Запрос токенов не удался - это тоже обращение к Google
+                self.request_count += 1
+                self.rate_limiter.mark()
+                raise
+        if self.rate_limiter.quota_wait >= 0.1:
+            self.log(f"    Ожидание общей квоты хоста: {self.rate_limiter.quota_wait:.1f} сек")
+        self.rate_limiter.mark()
+        try:
+            yield
+        finally:
+            self.request_count += 1
+    
+    def _prefetch(self, queries, timeframe, geo, category):
+        """Функция получения токенов explore для _request_slot"""
+        return lambda: self.backend.prefetch(queries, timeframe, geo, category)
+    
+    def _category(self, category):
+        """Категория запроса: переданная или категория парсера (0 - все категории)"""
+        return self.category if category is None else category
     
-    def reinit_pytrends(self):
-        """Переинициализация pytrends с новым user-agent"""
-        self.pytrends = TrendReq(hl='ru-RU', tz=180, requests_args={'headers': {'User-Agent': self.current_user_agent}})
+    def reinit_backend(self):
+        """Переинициализация бэкенда с новым user-agent"""
+        self.backend.reset(self.current_user_agent)
     
-    def retry_with_backoff(self, func, max_retries=3, initial_delay=30):
+    def retry_with_backoff(self, func, max_retries=MAX_RETRIES, initial_delay=None):
         """
         Выполняет функцию с экспоненциальной задержкой при ошибках
         
         Args:
             func: Функция для выполнения
             max_retries: Максимальное количество повторов
-            initial_delay: Начальная задержка в секундах
+            initial_delay: Начальная задержка в секундах (по умолчанию - из парсера)
             
         Returns:
             Результат функции или None при неудаче
         """
+        if initial_delay is None:
+            initial_delay = self.retry_initial_delay
         for attempt in range(max_retries):
             try:
                 result = func()
                 if result is not None:
                     return result
             except Exception as e:
-                print(f"    Попытка {attempt + 1}/{max_retries} не удалась: {e}")
+                self.log(f"    Попытка {attempt + 1}/{max_retries} не удалась: {e}")
                 
                 if attempt < max_retries - 1:
                     # Экспоненциальная задержка с jitter
-                    delay = initial_delay * (2 ** attempt) + random.uniform(0, 10)
-                    print(f"    Ждем {delay:.1f} сек перед повторной попыткой...")
+                    delay = initial_delay * (2 ** attempt) + (random.uniform(0, 10) if initial_delay else 0)
+                    self.log(f"    Ждем {delay:.1f} сек перед повторной попыткой...")
                     
                     # Меняем user-agent при каждой повторной попытке
                     self.current_user_agent = random.choice(USER_AGENTS)
-                    self.reinit_pytrends()
-                    print(f"    Новый User-Agent: {self.current_user_agent[:50]}...")
+                    self.reinit_backend()
+                    self.log(f"    Новый User-Agent: {self.current_user_agent[:50]}...")
                     
-                    time.sleep(delay)
+                    with self.profiler.phase("backoff"):
+                        time.sleep(delay)
                 else:
-                    print(f"    Все {max_retries} попыток исчерпаны")
+                    self.log(f"    Все {max_retries} попыток исчерпаны")
                     
         return None
         
-    def get_interest_over_time(self, queries, timeframe):
+    def get_interest_over_time(self, queries, timeframe, geo=None, category=None):
         """
         Получает интерес к запросам во времени
         
         Args:
             queries: Список запросов (максимум 5 за раз)
             timeframe: Период времени (например, "today 3-m")
+            geo: Код геолокации (по умолчанию - геолокация парсера)
+            category: Категория поиска (по умолчанию - категория парсера)
             
         Returns:
-            DataFrame: Данные интереса во времени
+            InterestSeries: Данные интереса во времени
         """
+        geo = geo or self.geo
+        category = self._category(category)
+        prefetch = self._prefetch(queries, timeframe, geo, category)
         try:
-            self.pytrends.build_payload(
-                queries,
-                cat=self.category,
-                timeframe=timeframe,
-                geo=self.geo
-            )
-            data = self.pytrends.interest_over_time()
-            
-            self.request_count += 1
-            if self.request_count > 1:
-                delay = self.get_random_delay()
-                print(f"    Задержка: {delay:.1f} сек...")
-                time.sleep(delay)
+            with self.profiler.phase("interest"), self._request_slot(verbose=True, prefetch=prefetch):
+                data = self.backend.interest_over_time(queries, timeframe, geo, category)
                 
             return data
         except Exception as e:
-            print(f"Ошибка при получении данных для {queries}: {e}")
+            self.log(f"Ошибка при получении данных для {queries}: {e}")
             return None
     
-    def get_interest_by_region(self, queries, timeframe):
+    def get_interest_by_region(self, queries, timeframe, resolution='REGION', geo=None, keyword=None,
+                               category=None):
         """
-        Получает интерес к запросам по регионам
+        Получает интерес к запросам по регионам внутри геолокации
         
         Args:
             queries: Список запросов (максимум 5 за раз)
             timeframe: Период времени
+            resolution: Уровень детализации (REGION - субъекты, CITY - города)
+            geo: Код геолокации (по умолчанию - геолокация парсера)
+            keyword: Запрос из queries, для которого нужна отдельная карта
+            category: Категория поиска (по умолчанию - категория парсера)
             
         Returns:
-            DataFrame: Данные интереса по регионам
+            RegionInterest: Данные интереса по регионам
         """
+        geo = geo or self.geo
+        category = self._category(category)
+        prefetch = self._prefetch(queries, timeframe, geo, category)
         try:
-            self.pytrends.build_payload(
-                queries,
-                cat=self.category,
-                timeframe=timeframe,
-                geo=self.geo
-            )
-            data = self.pytrends.interest_by_region(resolution='COUNTRY')
-            
-            self.request_count += 1
-            if self.request_count > 1:
-                delay = self.get_random_delay()
-                time.sleep(delay)
+            with self.profiler.phase("region"), self._request_slot(prefetch=prefetch):
+                data = self.backend.interest_by_region(queries, timeframe, geo, category,
+                                                       resolution=resolution, keyword=keyword)
                 
             return data
         except Exception as e:
-            print(f"Ошибка при получении региональных данных для {queries}: {e}")
+            self.log(f"Ошибка при получении региональных данных для {queries}: {e}")
+            return None
+    
+    def get_regional_interest(self, queries, timeframe, keyword, resolution='REGION', geo=None, category=None):
+        """
+        Получает региональный интерес к запросу, переиспользуя payload временного ряда
+        
+        Args:
+            queries: Пакет запросов, для которого уже получен временной ряд
+            timeframe: Период времени
+            keyword: Запрос из пакета (обычно топ-запрос страны)
+            resolution: Уровень детализации (REGION или CITY)
+            geo: Код геолокации (по умолчанию - геолокация парсера)
+            category: Категория поиска (по умолчанию - категория парсера)
+            
+        Returns:
+            dict: {resolution, query, codes, names, values} или None
+        """
+        geo = geo or self.geo
+        category = self._category(category)
+        batch = queries[:MAX_QUERIES_PER_REQUEST]
+        cache_key = None
+        if self.cache is not None:
+            cache_key = TrendsCache.make_key(f"region:{resolution}:{keyword}", batch, timeframe, geo, category)
+            with self.profiler.phase("cache"):
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached
+        
+        data = self.get_interest_by_region(batch, timeframe, resolution=resolution, geo=geo, keyword=keyword,
+                                           category=category)
+        if data is None or data.empty or keyword not in data.values:
             return None
+        
+        regions = {
+            "resolution": resolution,
+            "query": keyword,
+            "codes": data.codes,
+            "names": data.names,
+            "values": data.values[keyword].tolist(),
+        }
+        if cache_key is not None:
+            self.cache.set(cache_key, regions)
+        return regions
     
-    def get_related_queries(self, query, timeframe):
+    def get_related_queries(self, query, timeframe, geo=None, category=None):
         """
         Получает связанные запросы
         
         Args:
             query: Поисковый запрос
             timeframe: Период времени
+            geo: Код геолокации (по умолчанию - геолокация парсера)
+            category: Категория поиска (по умолчанию - категория парсера)
             
         Returns:
-            dict: Связанные запросы (rising и top)
+            dict: Связанные запросы {"top": [{query, value}], "rising": [...]}
         """
+        geo = geo or self.geo
+        category = self._category(category)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = TrendsCache.make_key("related", query, timeframe, geo, category)
+            with self.profiler.phase("cache"):
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached
+        
+        prefetch = self._prefetch([query], timeframe, geo, category)
         try:
-            self.pytrends.build_payload(
-                [query],
-                cat=self.category,
-                timeframe=timeframe,
-                geo=self.geo
-            )
-            data = self.pytrends.related_queries()
+            with self.profiler.phase("related"), self._request_slot(prefetch=prefetch):
+                related = self.backend.related_queries(query, timeframe, geo, category)
             
-            self.request_count += 1
-            if self.request_count > 1:
-                delay = self.get_random_delay()
-                time.sleep(delay)
-                
-            return data.get(query, {})
+            if cache_key is not None and related:
+                self.cache.set(cache_key, related)
+            return related
         except Exception as e:
-            print(f"Ошибка при получении связанных запросов для {query}: {e}")
+            self.log(f"Ошибка при получении связанных запросов для {query}: {e}")
             return {}
     
-    def get_average_interest(self, queries, timeframe, use_retry=True):
+    def get_average_interest(self, queries, timeframe, use_retry=True, geo=None, category=None):
         """
         Получает средний интерес к запросам за период
         
@@ -182,40 +316,99 @@ class GoogleTrendsParser:
             queries: Список запросов
             timeframe: Период времени
             use_retry: Использовать ли механизм ретраев
+            geo: Код геолокации (по умолчанию - геолокация парсера)
+            category: Категория поиска (по умолчанию - категория парсера)
             
         Returns:
             dict: {query: average_interest} или None если ошибка
         """
+        averages, _ = self.get_interest_summary(queries, timeframe, use_retry=use_retry, geo=geo,
+                                                category=category)
+        return averages
+    
+    def get_interest_summary(self, queries, timeframe, use_retry=True, geo=None, category=None, refresh=False):
+        """
+        Получает средний интерес к запросам и сам ряд интереса за период
+        
+        Ряд хранится без неполной последней точки; средние и ряд кэшируются
+        отдельно, поэтому кэш из старых запусков (только средние) остается рабочим.
+        
+        Args:
+            queries: Список запросов
+            timeframe: Период времени
+            use_retry: Использовать ли механизм ретраев
+            geo: Код геолокации (по умолчанию - геолокация парсера)
+            category: Категория поиска (по умолчанию - категория парсера)
+            refresh: Не брать ответ из кэша (повторная выборка); новый ответ
+                     сохраняется в кэш
+        
+        Returns:
+            tuple: ({query: average_interest} или None,
+                    {"timestamps": [...], "values": {query: [...]}} или None)
+        """
+        geo = geo or self.geo
+        category = self._category(category)
+        batch = queries[:MAX_QUERIES_PER_REQUEST]
+        cache_key = series_key = None
+        if self.cache is not None:
+            cache_key = TrendsCache.make_key("interest", batch, timeframe, geo, category)
+            series_key = TrendsCache.make_key("series", batch, timeframe, geo, category)
+            with self.profiler.phase("cache"):
+                cached = self.cache.get(cache_key) if not refresh else None
+                cached_series = self.cache.get(series_key) if cached is not None else None
+            if cached is not None:
+                self.cache_hits += 1
+                self._observe_series(cached_series, timeframe, geo, category)
+                return cached, cached_series
+        
         def _get_data():
             try:
-                data = self.get_interest_over_time(queries[:5], timeframe)
+                data = self.get_interest_over_time(batch, timeframe, geo=geo, category=category)
                 
                 if data is None or data.empty:
                     return None
                 
-                # Удаляем столбец isPartial если есть
-                if 'isPartial' in data.columns:
-                    data = data.drop(columns=['isPartial'])
+                with self.profiler.phase("reduce"):
+                    # Вычисляем среднее значение для каждого запроса
+                    averages = {query: data.mean(query) for query in batch}
                 
-                # Вычисляем среднее значение для каждого запроса
-                averages = {}
-                for query in queries[:5]:
-                    if query in data.columns:
-                        averages[query] = data[query].mean()
-                    else:
-                        averages[query] = 0
+                    # Ряд без неполной последней точки
+                    end = len(data.timestamps) - 1 if data.partial else len(data.timestamps)
+                    series = {
+                        "timestamps": list(data.timestamps[:end]),
+                        "values": {query: list(values[:end]) for query, values in data.values.items()}
+                    }
                         
-                return averages
+                return averages, series
             except Exception as e:
-                print(f"Ошибка при вычислении среднего интереса: {e}")
+                self.log(f"Ошибка при вычислении среднего интереса: {e}")
                 return None
         
         if use_retry:
-            return self.retry_with_backoff(_get_data)
+            result = self.retry_with_backoff(_get_data)
         else:
-            return _get_data()
+            result = _get_data()
+    
+        if result is None:
+            return None, None
+        
+        averages, series = result
+        if cache_key is not None:
+            self.cache.set(cache_key, averages)
+            self.cache.set(series_key, series)
+        if self.sampler is not None:
+            self.sampler.observe(TrendsCache.make_key("interest", batch, timeframe, geo, category), averages)
+        self._observe_series(series, timeframe, geo, category)
+        return averages, series
+    
+    def _observe_series(self, series, timeframe, geo, category):
+        """Передает ряд детектору аномалий (повторные точки детектор пропускает сам)"""
+        if self.detector is None or not series:
+            return
+        with self.profiler.phase("anomaly"):
+            self.detector.observe_series(series, timeframe, geo, category)
     
-    def parse_country_queries(self, country_name, queries, timeframes):
+    def parse_country_queries(self, country_name, queries, timeframes, geo=None, category=None):
         """
         Парсит все запросы для одной страны за все периоды
         
@@ -223,96 +416,139 @@ class GoogleTrendsParser:
             country_name: Название страны
             queries: Список запросов для страны
             timeframes: Словарь с периодами {name: value}
+            geo: Код геолокации (по умолчанию - геолокация парсера)
+            category: Категория поиска (по умолчанию - категория парсера)
             
         Returns:
-            dict: Данные по всем запросам и периодам или None если ошибка
+            CountryResult: Результат по периодам с ненулевым интересом или None если ошибка
         """
-        country_data = {
-            "country": country_name,
-            "queries": {}
-        }
-        
-        has_valid_data = False
+        geo = geo or self.geo
+        category = self._category(category)
+        country_result = CountryResult(country_name, geo)
         
         # Получаем данные для каждого периода
         for period_name, period_value in timeframes.items():
-            period_data = {}
+            # Получаем средний интерес и ряд для всех запросов (с ретраями)
+            averages, series = self.get_interest_summary(queries, period_value, use_retry=True, geo=geo,
+                                                         category=category)
             
-            # Получаем средний интерес для всех запросов (с ретраями)
-            averages = self.get_average_interest(queries, period_value, use_retry=True)
+            # Проверяем что есть хотя бы один запрос с положительным значением
+            if not averages or not any(v is not None and v > 0 for v in averages.values()):
+                continue
             
-            if averages:
-                # Проверяем что есть хотя бы один запрос с положительным значением
-                valid_values = [v for v in averages.values() if v is not None and v > 0]
-                
-                if valid_values:
-                    has_valid_data = True
-                    # Находим запрос с максимальным интересом
-                    max_query = max(averages.items(), key=lambda x: x[1] if x[1] is not None else 0)
-                    
-                    period_data = {
-                        "averages": averages,
-                        "max_interest": max_query[1] if max_query[1] is not None else 0,
-                        "top_query": max_query[0],
-                        "all_queries": queries
-                    }
+            # Находим запрос с максимальным интересом
+            top_query = max(averages.items(), key=lambda x: x[1] if x[1] is not None else 0)[0]
                     
-                    # Получаем связанные запросы для топ запроса
-                    related = self.get_related_queries(max_query[0], period_value)
-                    if related:
-                        period_data["related_queries"] = related
+            # Получаем связанные запросы для топ запроса
+            related = self.get_related_queries(top_query, period_value, geo=geo, category=category)
             
-            country_data["queries"][period_name] = period_data
+            # Региональный спрос для топ запроса (токены того же payload)
+            regions = None
+            if self.region_resolution and period_name == self.region_period:
+                regions = self.get_regional_interest(queries, period_value, top_query,
+                                                     resolution=self.region_resolution, geo=geo, category=category)
+            
+            # Ответы преобразуются в компактную запись один раз
+            country_result.periods[period_name] = PeriodResult.from_parts(averages, related, regions, series)
         
         # Если нет валидных данных ни в одном периоде, возвращаем None
-        if not has_valid_data:
-            print(f"    ❌ {country_name}: не удалось получить данные (все запросы с 0)")
+        if not country_result.periods:
+            self.log(f"    ❌ {country_name}: не удалось получить данные (все запросы с 0)")
             return None
         
-        return country_data
+        return country_result
     
-    def parse_all_countries(self, all_queries, timeframes):
+    def parse_all_countries(self, all_queries, timeframes, geo=None, category=None):
         """
         Парсит данные для всех стран
         
         Args:
             all_queries: Словарь {country_name: [queries]}
             timeframes: Словарь с периодами
+            geo: Код геолокации (по умолчанию - геолокация парсера)
+            category: Категория поиска (по умолчанию - категория парсера)
             
         Returns:
             dict: Данные по всем странам
         """
+        category = self._category(category)
         all_data = {}
         total_countries = len(all_queries)
         
-        print(f"Начинаем парсинг {total_countries} стран...")
-        print("=" * 60)
+        self.log(f"Начинаем парсинг {total_countries} стран (геолокация {geo or self.geo}, категория {category})...")
+        self.log("=" * 60)
         
         for idx, (country_name, queries) in enumerate(all_queries.items(), 1):
-            print(f"[{idx}/{total_countries}] Парсим {country_name}...")
+            self.log(f"[{idx}/{total_countries}] Парсим {country_name}...")
             
-            country_data = self.parse_country_queries(country_name, queries, timeframes)
+            requests_before = self.request_count
+            country_data = self.parse_country_queries(country_name, queries, timeframes, geo=geo, category=category)
             all_data[country_name] = country_data
             
-            # Проверяем, есть ли данные
-            if country_data is None:
-                # Сообщение уже выведено в parse_country_queries
-                pass
-            elif any(period_data for period_data in country_data["queries"].values()):
-                print(f"    ✓ {country_name} успешно распаршена")
-            else:
-                print(f"    ⚠ {country_name}: нет данных (возможно, заблокировано)")
+            # Сообщение об отсутствии данных уже выведено в parse_country_queries
+            if country_data is not None:
+                self.log(f"    ✓ {country_name} успешно распаршена")
             
-            # Задержка между странами со случайным значением
-            if idx < total_countries:
+            # Задержка между странами со случайным значением (не нужна, если все взято из кэша)
+            if idx < total_countries and self.request_count > requests_before:
                 delay = self.get_random_delay()
-                print(f"    Задержка между странами: {delay:.1f} сек...")
-                time.sleep(delay)
+                self.log(f"    Задержка между странами: {delay:.1f} сек...")
+                # Пауза выдерживается ограничителем перед следующим сетевым запросом:
+                # подготовка следующей страны и ответы из кэша идут внутри нее
+                self.rate_limiter.defer(delay)
         
-        print("=" * 60)
-        print(f"Парсинг завершен! Всего запросов: {self.request_count}")
+        self.log("=" * 60)
+        self.log(f"Парсинг завершен! Всего запросов: {self.request_count}, из кэша: {self.cache_hits}")
         
         return all_data
+    
+    def parse_all_geos(self, geos, all_queries, timeframes):
+        """
+        Парсит данные для всех стран по нескольким геолокациям
+        
+        Args:
+            geos: Список кодов геолокаций (например, ["RU", "KZ", "BY"])
+            all_queries: Словарь {country_name: [queries]}
+            timeframes: Словарь с периодами
+            
+        Returns:
+            dict: {geo: {country_name: country_data}}
+        """
+        sweep = self.parse_sweep(geos, [self.category], all_queries, timeframes)
+        return {geo: by_category[self.category] for geo, by_category in sweep.items()}
+    
+    def parse_sweep(self, geos, categories, all_queries, timeframes):
+        """
+        Парсит данные для всех стран по геолокациям и категориям
+        
+        Все геолокации и категории проходят через один план, одну сессию, один кэш
+        и один ограничитель частоты, поэтому cookie и интервалы между запросами общие.
+        
+        Args:
+            geos: Список кодов геолокаций (например, ["RU", "KZ", "BY"])
+            categories: Список категорий (например, [13, 0, 5])
+            all_queries: Словарь {country_name: [queries]}
+            timeframes: Словарь с периодами
+        
+        Returns:
+            dict: {geo: {category: {country_name: country_data}}}
+        """
+        from request_plan import build_request_plan, estimate_plan
+        
+        plan = build_request_plan(all_queries, timeframes, geos=geos, categories=categories, cache=self.cache,
+                                  region_resolution=self.region_resolution, region_period=self.region_period)
+        summary = estimate_plan(plan, self.delay_min, self.delay_max)
+        self.log(f"Общий план: {len(geos)} геолокаций × {len(categories)} категорий, "
+                 f"{summary['total_requests']} запросов ({summary['cache_hits']} из кэша)")
+        
+        sweep = {}
+        steps = [(geo, category) for geo in geos for category in categories]
+        for step_idx, (geo, category) in enumerate(steps, 1):
+            self.log(f"\nГеолокация {geo}, категория {category} [{step_idx}/{len(steps)}]")
+            sweep.setdefault(geo, {})[category] = self.parse_all_countries(all_queries, timeframes, geo=geo,
+                                                                           category=category)
+        
+        return sweep
 
 
 if __name__ == "__main__":
@@ -334,10 +570,11 @@ if __name__ == "__main__":
     data = parser.parse_country_queries(test_country, queries, TIMEFRAMES)
     
     print(f"\nРезультаты для {test_country}:")
-    for period, period_data in data["queries"].items():
+    for period in TIMEFRAMES:
+        period_data = data.periods.get(period) if data else None
         if period_data:
             print(f"\nПериод {period}:")
-            print(f"  Топ запрос: {period_data['top_query']}")
-            print(f"  Макс. интерес: {period_data['max_interest']}")
+            print(f"  Топ запрос: {period_data.top_query}")
+            print(f"  Макс. интерес: {period_data.max_interest}")
         else:
             print(f"\nПериод {period}: Нет данных")
\ No newline at end of file
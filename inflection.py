@@ -0,0 +1,99 @@
+"""
+Склонение русских названий стран и городов для шаблонов запросов
+
+Правила покрывают типичные названия: существительные на -ия/-а/-я/-й/-ь/согласную,
+множественное число на -ы и согласованные прилагательные (Южная Корея,
+Объединенные Арабские Эмираты). Неоднозначные случаи задаются исключениями
+или полем name_ru_gen в конфигурации страны.
+"""
+from functools import lru_cache
+
+# Исключения родительного падежа (женский род на -ь и т.п.)
+GENITIVE_EXCEPTIONS = {
+    "Беларусь": "Беларуси",
+    "Казань": "Казани",
+    "Пермь": "Перми",
+    "Тверь": "Твери",
+}
+
+# После этих букв пишется -и, а не -ы (Польша - Польши, Мексика - Мексики)
+_HUSHING_VELAR = set("гкхжшщч")
+_VOWELS = set("аеёиоуыэюя")
+
+# Окончания прилагательных в именительном -> родительном падеже
+_ADJECTIVE_ENDINGS = (
+    ("ая", "ой"),
+    ("яя", "ей"),
+    ("ые", "ых"),
+    ("ие", "их"),
+    ("ый", "ого"),
+    ("ой", "ого"),
+    ("ое", "ого"),
+    ("ее", "его"),
+)
+
+
+def _genitive_adjective(word):
+    """Родительный падеж прилагательного (ий - ого/его по предыдущей букве)"""
+    lower = word.lower()
+    if lower.endswith("ий"):
+        return word[:-2] + ("ого" if lower[-3:-2] in _HUSHING_VELAR else "его")
+    for ending, replacement in _ADJECTIVE_ENDINGS:
+        if lower.endswith(ending):
+            return word[:-len(ending)] + replacement
+    return word
+
+
+def _genitive_noun(word):
+    """Родительный падеж существительного"""
+    if word in GENITIVE_EXCEPTIONS:
+        return GENITIVE_EXCEPTIONS[word]
+    # Аббревиатуры (США, ОАЭ) не склоняются
+    if word.isupper() or len(word) < 3:
+        return word
+    
+    lower = word.lower()
+    last = lower[-1]
+    if lower.endswith("ия"):
+        return word[:-1] + "и"
+    if last == "я":
+        return word[:-1] + "и"
+    if last == "а":
+        return word[:-1] + ("и" if lower[-2] in _HUSHING_VELAR else "ы")
+    if last == "ы":
+        return word[:-1] + "ов"
+    if last in ("й", "ь"):
+        return word[:-1] + "я"
+    # Названия на другие гласные (Перу, Чили, Монако) не склоняются
+    if last in _VOWELS or not last.isalpha():
+        return word
+    return word + "а"
+
+
+@lru_cache(maxsize=4096)
+def genitive(phrase):
+    """
+    Ставит название в родительный падеж ("Турция" - "Турции")
+    
+    Последнее слово склоняется как существительное, предыдущие - как
+    согласованные с ним прилагательные.
+    
+    Args:
+        phrase: Название в именительном падеже
+    
+    Returns:
+        str: Название в родительном падеже
+    """
+    if phrase in GENITIVE_EXCEPTIONS:
+        return GENITIVE_EXCEPTIONS[phrase]
+    words = phrase.split(" ")
+    words[-1] = _genitive_noun(words[-1])
+    words[:-1] = [_genitive_adjective(word) for word in words[:-1]]
+    return " ".join(words)
+
+
+# Преобразования, доступные в шаблонах: {name:gen}, {city:lower}
+INFLECTIONS = {
+    "gen": genitive,
+    "lower": str.lower,
+}
@@ -0,0 +1,494 @@
+"""
+Конфигурация стран из внешнего файла (JSON или YAML)
+
+Файл описывает страны (названия, альтернативные названия, прилагательные,
+города) и, при необходимости, шаблоны запросов вместо config.QUERY_TEMPLATES:
+
+    {
+        "version": 1,
+        "countries": {
+            "Турция": {"name_en": "Turkey", "adjective_ru": "турецкий",
+                       "cities": [{"ru": "Стамбул", "en": "Istanbul"}]}
+        },
+        "templates": {"ru": ["впн {name}", "{adj} впн"]}
+    }
+
+Документ проверяется по схеме (все ошибки с путями к полям сразу). Индекс
+запросов, индекс названий для поиска новых запросов и статическая часть планов
+запросов сохраняются в .cache/locations/<хэш>.json, где хэш считается по
+содержимому файла, шаблонам и коду генерации: при неизменной конфигурации
+запуск читает готовый индекс, не разбирая и не проверяя документ заново.
+
+В долгоживущих процессах LocationConfig.queries не чаще раза в
+LOCATIONS_RELOAD_INTERVAL секунд сверяет время изменения файла и при изменении
+перечитывает его; ошибочная правка не применяется, остается прежняя конфигурация.
+"""
+import glob
+import hashlib
+import json
+import os
+import time
+
+from config import (
+    COUNTRIES, QUERY_TEMPLATES, MAX_QUERIES_PER_REQUEST, LOCATIONS_PATH, LOCATIONS_CACHE_DIR,
+    LOCATIONS_RELOAD_INTERVAL,
+)
+from query_builder import config_hash
+
+DOCUMENT_VERSION = 1
+# Формат скомпилированного файла (увеличивается при изменении его структуры)
+COMPILED_FORMAT = 1
+# Сколько скомпилированных версий конфигурации хранить
+COMPILED_KEEP = 8
+
+# Строковые поля страны
+COUNTRY_STRING_FIELDS = {
+    "name_en", "name_ru_short", "name_ru_gen", "adjective_ru", "adjective_ru_alt", "adjective_en",
+}
+COUNTRY_FIELDS = COUNTRY_STRING_FIELDS | {"name_ru_alt", "cities"}
+CITY_FIELDS = {"ru", "en"}
+
+# Поля шаблонов: общие и доступные внутри повторяющихся групп
+TEMPLATE_FIELDS = {"name", "short", "adj", "adj_alt", "en", "adj_en"}
+TEMPLATE_GROUPS = {"aliases": {"alias"}, "cities": {"city", "city_en"}}
+
+
+class LocationConfigError(ValueError):
+    """Ошибка чтения или проверки конфигурации стран"""
+    
+    def __init__(self, message, errors=()):
+        """
+        Args:
+            message: Общее описание
+            errors: Список ошибок с путями к полям
+        """
+        self.errors = list(errors)
+        details = "".join(f"\n  - {error}" for error in self.errors)
+        super().__init__(f"{message}{details}")
+
+
+def _is_text(value):
+    return isinstance(value, str) and value.strip() != ""
+
+
+def _validate_country(path, data, errors):
+    """Проверяет описание одной страны"""
+    if not isinstance(data, dict):
+        errors.append(f"{path}: ожидается объект с полями страны")
+        return
+    for field in sorted(set(data) - COUNTRY_FIELDS):
+        errors.append(f"{path}.{field}: неизвестное поле (допустимы: {', '.join(sorted(COUNTRY_FIELDS))})")
+    for field in sorted(COUNTRY_STRING_FIELDS & set(data)):
+        if not _is_text(data[field]):
+            errors.append(f"{path}.{field}: ожидается непустая строка")
+    
+    aliases = data.get("name_ru_alt")
+    if aliases is not None and not _is_text(aliases):
+        if not isinstance(aliases, list):
+            errors.append(f"{path}.name_ru_alt: ожидается строка или список строк")
+        else:
+            for idx, alias in enumerate(aliases):
+                if not _is_text(alias):
+                    errors.append(f"{path}.name_ru_alt[{idx}]: ожидается непустая строка")
+    
+    cities = data.get("cities")
+    if cities is None:
+        return
+    if not isinstance(cities, list):
+        errors.append(f"{path}.cities: ожидается список городов")
+        return
+    for idx, city in enumerate(cities):
+        city_path = f"{path}.cities[{idx}]"
+        if _is_text(city):
+            continue
+        if not isinstance(city, dict):
+            errors.append(f"{city_path}: ожидается строка или объект {{\"ru\": ..., \"en\": ...}}")
+            continue
+        for field in sorted(set(city) - CITY_FIELDS):
+            errors.append(f"{city_path}.{field}: неизвестное поле (допустимы: ru, en)")
+        if not _is_text(city.get("ru")):
+            errors.append(f"{city_path}.ru: ожидается непустая строка")
+        if "en" in city and not _is_text(city["en"]):
+            errors.append(f"{city_path}.en: ожидается непустая строка")
+
+
+def _validate_template(path, template, fields, errors):
+    """Проверяет строку шаблона: синтаксис, преобразования и доступные поля"""
+    from query_builder import _compile_template
+    
+    if not _is_text(template):
+        errors.append(f"{path}: ожидается непустая строка шаблона")
+        return
+    try:
+        _, used = _compile_template(template)
+    except ValueError as e:
+        errors.append(f"{path}: {e}")
+        return
+    for field in sorted(used - fields):
+        errors.append(f"{path}: неизвестное поле {{{field}}} в шаблоне '{template}'")
+
+
+def _validate_templates(templates, errors):
+    """Проверяет шаблоны запросов {locale: [...]}"""
+    if not isinstance(templates, dict) or not templates:
+        errors.append("templates: ожидается непустой объект {локаль: [шаблоны]}")
+        return
+    for locale, locale_templates in templates.items():
+        locale_path = f"templates.{locale}"
+        if not isinstance(locale_templates, list):
+            errors.append(f"{locale_path}: ожидается список шаблонов")
+            continue
+        for idx, template in enumerate(locale_templates):
+            template_path = f"{locale_path}[{idx}]"
+            if not isinstance(template, dict):
+                _validate_template(template_path, template, TEMPLATE_FIELDS, errors)
+                continue
+            group = template.get("each")
+            if group not in TEMPLATE_GROUPS:
+                errors.append(f"{template_path}.each: ожидается одна из групп {', '.join(sorted(TEMPLATE_GROUPS))}")
+                continue
+            for field in sorted(set(template) - {"each", "templates"}):
+                errors.append(f"{template_path}.{field}: неизвестное поле (допустимы: each, templates)")
+            group_templates = template.get("templates")
+            if not isinstance(group_templates, list) or not group_templates:
+                errors.append(f"{template_path}.templates: ожидается непустой список шаблонов")
+                continue
+            for group_idx, group_template in enumerate(group_templates):
+                _validate_template(f"{template_path}.templates[{group_idx}]", group_template,
+                                   TEMPLATE_FIELDS | TEMPLATE_GROUPS[group], errors)
+
+
+def validate_document(document):
+    """
+    Проверяет документ конфигурации стран
+    
+    Args:
+        document: Разобранный JSON/YAML
+    
+    Returns:
+        list: Ошибки с путями к полям (пустой список - документ корректен)
+    """
+    errors = []
+    if not isinstance(document, dict):
+        return ["ожидается объект с полями version, countries, templates"]
+    
+    for field in sorted(set(document) - {"version", "countries", "templates"}):
+        errors.append(f"{field}: неизвестное поле (допустимы: version, countries, templates)")
+    version = document.get("version", DOCUMENT_VERSION)
+    if version != DOCUMENT_VERSION:
+        errors.append(f"version: поддерживается версия {DOCUMENT_VERSION}, получено {version!r}")
+    
+    countries = document.get("countries")
+    if not isinstance(countries, dict) or not countries:
+        errors.append("countries: ожидается непустой объект {название страны: описание}")
+    else:
+        for country_name, data in countries.items():
+            if not _is_text(country_name):
+                errors.append(f"countries: название страны должно быть непустой строкой ({country_name!r})")
+                continue
+            _validate_country(f"countries.{country_name}", data, errors)
+    
+    if "templates" in document:
+        _validate_templates(document["templates"], errors)
+    return errors
+
+
+def read_document(path):
+    """
+    Читает документ конфигурации (YAML по расширению .yaml/.yml, иначе JSON)
+    
+    Returns:
+        tuple: (document, сырое содержимое в байтах)
+    """
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError as e:
+        raise LocationConfigError(f"Не удалось прочитать конфигурацию стран {path}: {e}") from e
+    
+    try:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as e:
+                raise LocationConfigError(f"Для {path} нужен пакет PyYAML (pip install pyyaml)") from e
+            document = yaml.safe_load(raw.decode("utf-8"))
+        else:
+            document = json.loads(raw.decode("utf-8"))
+    except LocationConfigError:
+        raise
+    except Exception as e:
+        raise LocationConfigError(f"Не удалось разобрать {path}: {e}") from e
+    return document, raw
+
+
+def _code_fingerprint():
+    """Хэш кода генерации запросов и индекса названий: изменение правил обновляет кэш"""
+    import discovery
+    import inflection
+    import query_builder
+    
+    digest = hashlib.sha1()
+    for module in (query_builder, inflection, discovery):
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def content_hash(raw=None, document=None):
+    """
+    Хэш конфигурации для кэша скомпилированных данных
+    
+    Args:
+        raw: Сырое содержимое файла (байты)
+        document: Документ (для встроенной конфигурации, если raw не задан)
+    
+    Returns:
+        str: Хэш
+    """
+    digest = hashlib.sha1()
+    digest.update(f"{COMPILED_FORMAT}:{_code_fingerprint()}:{config_hash(QUERY_TEMPLATES)}:".encode("utf-8"))
+    digest.update(raw if raw is not None else config_hash(document).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def compile_document(document):
+    """
+    Компилирует проверенный документ: индекс запросов и индекс названий
+    
+    Returns:
+        dict: {"countries", "queries", "location_index", "plans"}
+    """
+    from discovery import build_location_index
+    from query_builder import generate_all_queries
+    
+    countries = document["countries"]
+    queries = generate_all_queries(countries, document.get("templates"))
+    return {
+        "countries": countries,
+        "queries": {country_name: list(queries[country_name]) for country_name in countries},
+        "location_index": build_location_index(countries),
+        "plans": {},
+    }
+
+
+def plan_signature(timeframes, geos, categories):
+    """Ключ статической части плана внутри скомпилированной конфигурации"""
+    return config_hash([timeframes, list(geos), list(categories), MAX_QUERIES_PER_REQUEST])
+
+
+class LocationConfig:
+    """Конфигурация стран с кэшем скомпилированных данных и горячей перезагрузкой"""
+    
+    def __init__(self, path=LOCATIONS_PATH, cache_dir=LOCATIONS_CACHE_DIR,
+                 reload_interval=LOCATIONS_RELOAD_INTERVAL, log=print):
+        """
+        Args:
+            path: Файл конфигурации (JSON/YAML); None - встроенные config.COUNTRIES
+            cache_dir: Директория скомпилированных конфигураций (None - без кэша)
+            reload_interval: Как часто проверять изменение файла, секунд (None - не проверять)
+            log: Функция вывода сообщений
+        """
+        self.path = path
+        self.cache_dir = cache_dir
+        self.reload_interval = reload_interval
+        self.log = log
+        # Увеличивается при каждой примененной перезагрузке
+        self.generation = 0
+        self.from_cache = False
+        self._stat = None
+        self._checked = time.monotonic()
+        self._state = self._load()
+    
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+    
+    def _compiled_path(self, config_key):
+        return os.path.join(self.cache_dir, f"{config_key}.json")
+    
+    def _read_compiled(self, config_key):
+        """Читает скомпилированную конфигурацию из кэша или возвращает None"""
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._compiled_path(config_key), encoding="utf-8") as f:
+                compiled = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if compiled.get("format") != COMPILED_FORMAT or compiled.get("hash") != config_key:
+            return None
+        return compiled
+    
+    def _write_compiled(self, state):
+        """Сохраняет скомпилированную конфигурацию (атомарная замена) и удаляет старые версии"""
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._compiled_path(state["hash"])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"format": COMPILED_FORMAT, **state}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        
+        compiled_files = sorted(glob.glob(os.path.join(self.cache_dir, "*.json")), key=os.path.getmtime)
+        for old_path in compiled_files[:-COMPILED_KEEP]:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+    
+    def _load(self):
+        """
+        Загружает конфигурацию: из кэша по хэшу содержимого или с проверкой и компиляцией
+        
+        Returns:
+            dict: Состояние {"hash", "countries", "queries", "location_index", "plans"}
+        """
+        if self.path is None:
+            document, raw = {"countries": COUNTRIES, "templates": QUERY_TEMPLATES}, None
+        else:
+            self._stat = self._file_stat()
+            document, raw = None, read_document(self.path)[1]
+        
+        config_key = content_hash(raw, document)
+        compiled = self._read_compiled(config_key)
+        self.from_cache = compiled is not None
+        if compiled is not None:
+            compiled.pop("format")
+            compiled["location_index"] = [tuple(entry) for entry in compiled["location_index"]]
+            return compiled
+        
+        if document is None:
+            document, _ = read_document(self.path)
+        errors = validate_document(document)
+        if errors:
+            raise LocationConfigError(f"Ошибки в конфигурации стран {self.path or 'config.COUNTRIES'}:", errors)
+        
+        state = {"hash": config_key, **compile_document(document)}
+        empty = [country_name for country_name, queries in state["queries"].items() if not queries]
+        if empty:
+            raise LocationConfigError("Шаблоны не дают ни одного запроса для стран:",
+                                      [f"countries.{country_name}" for country_name in empty])
+        self._write_compiled(state)
+        return state
+    
+    def reload_if_changed(self):
+        """
+        Перечитывает файл, если он изменился с последней загрузки
+        
+        Returns:
+            bool: True, если применена новая конфигурация
+        """
+        if self.path is None:
+            return False
+        try:
+            stat = self._file_stat()
+        except OSError as e:
+            self.log(f"⚠️  Конфигурация стран недоступна, используется прежняя: {e}")
+            return False
+        if stat == self._stat:
+            return False
+        
+        try:
+            state = self._load()
+        except LocationConfigError as e:
+            # Запоминаем версию файла, чтобы не повторять ошибку при каждой проверке
+            self._stat = stat
+            self.log(f"⚠️  Конфигурация стран не перезагружена: {e}")
+            return False
+        if state["hash"] == self._state["hash"]:
+            return False
+        
+        self._state = state
+        self.generation += 1
+        self.log(f"Конфигурация стран перезагружена: {len(state['queries'])} стран ({self.path})")
+        return True
+    
+    def maybe_reload(self):
+        """Проверяет изменение файла не чаще раза в reload_interval секунд"""
+        if self.reload_interval is None:
+            return False
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return False
+        self._checked = now
+        return self.reload_if_changed()
+    
+    @property
+    def hash(self):
+        """Хэш текущей конфигурации"""
+        return self._state["hash"]
+    
+    @property
+    def countries(self):
+        """Описание стран {country_name: {...}}"""
+        self.maybe_reload()
+        return self._state["countries"]
+    
+    @property
+    def queries(self):
+        """Индекс запросов {country_name: [queries]}"""
+        self.maybe_reload()
+        return self._state["queries"]
+    
+    @property
+    def location_index(self):
+        """Индекс названий для discovery: [(основа, название страны)]"""
+        self.maybe_reload()
+        return self._state["location_index"]
+    
+    def plan_skeleton(self, timeframes, geos, categories):
+        """
+        Статическая часть плана запросов (кэшируется вместе с конфигурацией)
+        
+        Args:
+            timeframes: Словарь с периодами {name: value}
+            geos: Коды геолокаций
+            categories: Категории поиска
+        
+        Returns:
+            list: Результат request_plan.build_plan_skeleton
+        """
+        from request_plan import build_plan_skeleton
+        
+        state = self._state
+        signature = plan_signature(timeframes, geos, categories)
+        skeleton = state["plans"].get(signature)
+        if skeleton is None:
+            skeleton = build_plan_skeleton(state["queries"], timeframes, geos, categories)
+            state["plans"][signature] = skeleton
+            self._write_compiled(state)
+        return [(*row[:5], tuple(row[5]), row[6]) for row in skeleton]
+
+
+def export_builtin(path):
+    """Сохраняет встроенные config.COUNTRIES и config.QUERY_TEMPLATES в файл JSON"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": DOCUMENT_VERSION, "countries": COUNTRIES, "templates": QUERY_TEMPLATES},
+                  f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    arg_parser = argparse.ArgumentParser(description="Проверка и экспорт конфигурации стран")
+    arg_parser.add_argument("path", nargs="?", default=LOCATIONS_PATH,
+                            help="файл конфигурации (по умолчанию config.LOCATIONS_PATH или встроенная)")
+    arg_parser.add_argument("--export", metavar="PATH",
+                            help="сохранить встроенную конфигурацию в JSON для дальнейшего редактирования")
+    args = arg_parser.parse_args()
+    
+    if args.export:
+        export_builtin(args.export)
+        print(f"Встроенная конфигурация сохранена: {args.export} ({len(COUNTRIES)} стран)")
+    else:
+        try:
+            locations = LocationConfig(args.path, reload_interval=None)
+        except LocationConfigError as e:
+            raise SystemExit(str(e))
+        queries = locations.queries
+        source = "кэш" if locations.from_cache else "компиляция"
+        print(f"Конфигурация {args.path or 'config.COUNTRIES'}: {len(queries)} стран, "
+              f"{sum(len(v) for v in queries.values())} запросов ({source}, хэш {locations.hash[:12]})")
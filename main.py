@@ -2,17 +2,27 @@
 Главный файл для запуска SEO-парсера
 Анализирует спрос на VPN по локациям в России
 """
-from query_builder import generate_all_queries
-from google_trends_parser import GoogleTrendsParser
-from analyzer import SEOAnalyzer
-from config import COUNTRIES, TIMEFRAMES
+import argparse
 
+from locations import LocationConfig, LocationConfigError
+from analyzer import SEOAnalyzer, MultiGeoAnalyzer, MultiCategoryAnalyzer
+from request_plan import build_request_plan, estimate_plan, format_duration
+from trends_cache import TrendsCache
+from profiler import PhaseProfiler, NullProfiler
+from config import (
+    TIMEFRAMES, GEO, GEOS, CATEGORIES, CATEGORY_NAMES, REGION_PERIOD, REQUEST_DELAY_MIN, REQUEST_DELAY_MAX,
+    DISCOVERY_BUDGET, DISCOVERY_MAX_DEPTH, DISCOVERY_PERIOD, NOWCAST_TIMEFRAME, NOWCAST_CACHE_TTL,
+    ANOMALY_STATE_PATH, LOCATIONS_PATH, BACKFILL_WORKERS, MAX_QUERIES_PER_REQUEST, RESAMPLE_PERIOD,
+    RESAMPLE_STATE_PATH, PROXIES, QUOTA_WINDOWS,
+)
 
-def print_header():
+
+def print_header(geos=None):
     """Выводит заголовок"""
+    location = "Россия" if not geos or list(geos) == ["RU"] else ", ".join(geos)
     print("=" * 80)
     print(" " * 20 + "АНАЛИЗ СПРОСА НА VPN ПО ЛОКАЦИЯМ")
-    print(" " * 30 + "Россия | Google Trends")
+    print(" " * 30 + f"{location} | Google Trends")
     print("=" * 80)
 
 
@@ -21,10 +31,17 @@ def print_separator():
     print("-" * 80)
 
 
-def print_top_countries(analyzer):
+def format_category(category):
+    """Категория с названием: '13 (Интернет и телеком)'"""
+    name = CATEGORY_NAMES.get(category)
+    return f"{category} ({name})" if name else str(category)
+
+
+def print_top_countries(analyzer, geo=None, category=None):
     """Выводит топ стран по популярности"""
     print("\n" + "=" * 80)
-    print("ТОП-20 СТРАН ПО СПРОСУ (3 месяца)")
+    print("ТОП-20 СТРАН ПО СПРОСУ (3 месяца)" + (f" | геолокация {geo}" if geo else "")
+          + (f" | категория {format_category(category)}" if category is not None else ""))
     print("=" * 80)
     
     top_3m = analyzer.get_top_countries("3_months", limit=20)
@@ -45,18 +62,14 @@ def print_period_comparison(analyzer):
     print("=" * 80)
     
     top_3m = analyzer.get_top_countries("3_months", limit=10)
-    top_1m = analyzer.get_top_countries("1_month", limit=10)
     
     print(f"{'Страна':<20} {'1 месяц':<15} {'3 месяца':<15} {'Изменение':<15} {'Тренд'}")
     print("-" * 80)
     
-    # Создаем словарь для быстрого доступа
-    top_1m_dict = {c["country"]: c["interest"] for c in top_1m}
-    
-    for country_3m in top_3m[:10]:
+    for country_3m in top_3m:
         country = country_3m["country"]
         interest_3m = country_3m["interest"]
-        interest_1m = top_1m_dict.get(country, 0)
+        interest_1m = analyzer.get_interest(country, "1_month")
         
         if interest_3m > 0 and interest_1m > 0:
             change = ((interest_1m - interest_3m) / interest_3m) * 100
@@ -76,6 +89,21 @@ def print_period_comparison(analyzer):
             print(f"{country:<20} {interest_1m:<15.2f} {interest_3m:<15.2f} {change_str:<15} {trend}")
 
 
+def format_trend_change(trend):
+    """Изменение тренда в процентах; * - наклон по дневному ряду статистически значим"""
+    mark = "*" if trend.get("significant") else ""
+    return f"{trend['change_percent']:+.1f}%{mark}"
+
+
+def format_wow(trend):
+    """Изменение неделя к неделе (только для тренда по дневному ряду)"""
+    if "wow_percent" not in trend:
+        return "-"
+    if trend["wow_percent"] is None:
+        return "N/A"
+    return f"{trend['wow_percent']:+.1f}%"
+
+
 def print_rising_countries(analyzer):
     """Выводит страны с растущим спросом"""
     print("\n" + "=" * 80)
@@ -84,12 +112,15 @@ def print_rising_countries(analyzer):
     
     rising = analyzer.get_rising_countries(limit=10)
     
-    print(f"{'Страна':<20} {'1 месяц':<15} {'3 месяца':<15} {'Рост':<15}")
+    print(f"{'Страна':<20} {'1 месяц':<15} {'3 месяца':<15} {'Рост':<15} {'Нед/нед'}")
     print("-" * 80)
     
     for country in rising:
-        print(f"{country['country']:<20} {country['interest_1m']:<15} "
-              f"{country['interest_3m']:<15} +{country['change_percent']:.1f}%")
+        print(f"{country['country']:<20} {country['interest_1m']:<15.2f} "
+              f"{country['interest_3m']:<15.2f} {format_trend_change(country):<15} {format_wow(country)}")
+    
+    if any(country.get("significant") for country in rising):
+        print("\n* тренд по дневному ряду статистически значим (|t| >= 2)")
 
 
 def print_falling_countries(analyzer):
@@ -101,12 +132,12 @@ def print_falling_countries(analyzer):
     falling = analyzer.get_falling_countries(limit=10)
     
     if falling:
-        print(f"{'Страна':<20} {'1 месяц':<15} {'3 месяца':<15} {'Падение':<15}")
+        print(f"{'Страна':<20} {'1 месяц':<15} {'3 месяца':<15} {'Падение':<15} {'Нед/нед'}")
         print("-" * 80)
         
         for country in falling:
-            print(f"{country['country']:<20} {country['interest_1m']:<15} "
-                  f"{country['interest_3m']:<15} {country['change_percent']:.1f}%")
+            print(f"{country['country']:<20} {country['interest_1m']:<15.2f} "
+                  f"{country['interest_3m']:<15.2f} {format_trend_change(country):<15} {format_wow(country)}")
     else:
         print("Нет данных о падающем спросе")
 
@@ -150,6 +181,27 @@ def print_country_details(analyzer, country_name, period="3_months"):
         print(f"Нет данных для {country_name}")
 
 
+def print_regional_demand(analyzer, period=REGION_PERIOD, countries_limit=5):
+    """Выводит регионы, формирующие спрос (только если собраны региональные данные)"""
+    regional = analyzer.get_regional_demand(period, limit=15)
+    if not regional:
+        return
+    
+    print("\n" + "=" * 80)
+    print(f"РЕГИОНАЛЬНЫЙ СПРОС ({period})")
+    print("=" * 80)
+    print(f"{'№':<4} {'Регион':<35} {'Спрос':>8}   {'Лидирующая страна'}")
+    print_separator()
+    for idx, region in enumerate(regional, 1):
+        print(f"{idx:<4} {region['region']:<35} {region['demand']:>8.1f}   {region['top_country']}")
+    
+    for country in analyzer.get_top_countries(period, limit=countries_limit):
+        regions = analyzer.get_top_regions(country["country"], period, limit=5)
+        if regions:
+            names = ", ".join(f"{r['region']} ({r['interest']:.0f})" for r in regions)
+            print(f"\n  {country['country']}: {names}")
+
+
 def print_recommendations(analyzer):
     """Выводит рекомендации по добавлению серверов"""
     print("\n" + "=" * 80)
@@ -162,7 +214,7 @@ def print_recommendations(analyzer):
     print("\n🔥 КРИТИЧЕСКИЙ ПРИОРИТЕТ (высокий спрос + рост):")
     critical = []
     for country in rising:
-        interest = next((c["interest"] for c in top_3m if c["country"] == country["country"]), 0)
+        interest = analyzer.get_interest(country["country"], "3_months")
         if interest > 50:
             critical.append((country["country"], interest, country["change_percent"]))
     
@@ -173,7 +225,8 @@ def print_recommendations(analyzer):
         print("  Нет стран с критическим приоритетом")
     
     print("\n✅ ВЫСОКИЙ ПРИОРИТЕТ (высокий спрос):")
-    high = [c for c in top_3m[:10] if not any(r["country"] == c["country"] for r in critical)]
+    critical_names = {country for country, _, _ in critical}
+    high = [c for c in top_3m[:10] if c["country"] not in critical_names]
     for country in high:
         print(f"  • {country['country']:<20} (спрос: {country['interest']})")
     
@@ -183,66 +236,714 @@ def print_recommendations(analyzer):
         print(f"  • {country['country']:<20} (спрос: {country['interest']})")
 
 
+def print_geo_comparison(multi_analyzer, period="3_months", limit=20):
+    """Выводит сводный рейтинг стран по всем геолокациям"""
+    geos = multi_analyzer.geos
+    print("\n" + "=" * 80)
+    print(f"СВОДНЫЙ РЕЙТИНГ ПО ГЕОЛОКАЦИЯМ ({period})")
+    print("=" * 80)
+    
+    header = f"{'№':<4} {'Страна':<20} {'Среднее':>8}" + "".join(f" {geo:>7}" for geo in geos)
+    print(header)
+    print_separator()
+    
+    for idx, country in enumerate(multi_analyzer.get_top_countries(period, limit=limit), 1):
+        cells = "".join(f" {country['geos'].get(geo, 0):>7.1f}" for geo in geos)
+        print(f"{idx:<4} {country['country']:<20} {country['interest']:>8.2f}{cells}")
+
+
+def print_category_comparison(multi_analyzer, geo, period="3_months", limit=20):
+    """Выводит места стран в рейтингах категорий относительно базовой (первой) категории"""
+    categories = multi_analyzer.categories
+    print("\n" + "=" * 80)
+    print(f"СРАВНЕНИЕ КАТЕГОРИЙ ({period}) | геолокация {geo} | база - категория {format_category(categories[0])}")
+    print("=" * 80)
+    
+    header = f"{'Страна':<20}" + "".join(f" {'кат. ' + str(category):>14}" for category in categories)
+    print(header)
+    print_separator()
+    
+    for country in multi_analyzer.compare_categories(period, limit=limit):
+        cells = []
+        for category in categories:
+            rank = country["rank"].get(category)
+            if rank is None:
+                cells.append(f" {'-':>14}")
+                continue
+            shift = country["rank_shift"].get(category)
+            shift_str = f" ({shift:+d})" if shift else ""
+            cells.append(f" {f'#{rank}{shift_str}':>9} {country['interest'][category]:>4.0f}")
+        print(f"{country['country']:<20}" + "".join(cells))
+    print("\nМесто в рейтинге категории, в скобках - сдвиг относительно базовой, затем популярность")
+
+
+def print_plan(summary):
+    """Выводит план запросов и оценку длительности"""
+    print("\n" + "=" * 80)
+    print("ПЛАН ЗАПРОСОВ (без обращения к сети)")
+    print("=" * 80)
+    
+    print(f"Геолокаций: {summary['geos']}, категорий: {summary['categories']}, стран: {summary['countries']}, "
+          f"периодов: {summary['periods']}")
+    print(f"Запросов интереса:        {summary['interest_requests']}")
+    print(f"Запросов связанных:       {summary['related_requests']}")
+    if summary["region_requests"]:
+        print(f"Запросов по регионам:     {summary['region_requests']}")
+    print(f"Всего запросов:           {summary['total_requests']}")
+    print(f"  из кэша:                {summary['cache_hits']}")
+    print(f"  в сеть:                 {summary['network_requests']}")
+    print(f"Ретраи (в худшем случае): до {summary['retry_requests_max']} запросов")
+    print_separator()
+    print(f"Задержки между запросами: {format_duration(summary['sleep_seconds'])}")
+    if summary["quota_floor_seconds"]:
+        print(f"Минимум по квоте хоста:   {format_duration(summary['quota_floor_seconds'])}")
+    print(f"Оценка длительности:      {format_duration(summary['estimated_seconds'])}")
+    print(f"В худшем случае:          {format_duration(summary['worst_case_seconds'])}")
+
+
+def print_anomalies(detector):
+    """Выводит оповещения потокового детектора о всплесках и провалах спроса"""
+    if detector is None:
+        return
+    from datetime import datetime
+    
+    print("\n" + "=" * 80)
+    print(f"АНОМАЛИИ СПРОСА (новых точек: {detector.points}, рядов: {len(detector.streams)})")
+    print("=" * 80)
+    if not detector.alerts:
+        print("Всплесков и провалов не обнаружено")
+        return
+    
+    print(f"{'':<3}{'Запрос':<30} {'Гео':<4} {'Кат.':>4} {'Период':<11} {'Дата':<12} {'Знач.':>6} {'Ожид.':>6} {'z':>6}")
+    print_separator()
+    for alert in sorted(detector.alerts, key=lambda a: -abs(a["robust_z"])):
+        mark = "↑" if alert["kind"] == "spike" else "↓"
+        date = datetime.fromtimestamp(alert["timestamp"]).strftime("%d.%m %H:%M")
+        print(f"{mark:<3}{alert['query']:<30} {alert['geo']:<4} {alert['category']:>4} {alert['timeframe']:<11} {date:<12} "
+              f"{alert['value']:>6.0f} {alert['expected']:>6.1f} {alert['robust_z']:>+6.1f}")
+
+
+def print_confidence(rankings, scheduler):
+    """Выводит рейтинг с доверительными интервалами и риском перестановки соседей"""
+    from resampling import flip_probability
+    
+    for (geo, category), cells in rankings.items():
+        ranking = scheduler.rank(cells)[:scheduler.top]
+        print("\n" + "=" * 80)
+        print(f"ТОЧНОСТЬ РЕЙТИНГА ({geo}, категория {format_category(category)}, {RESAMPLE_PERIOD}, "
+              f"ДИ {scheduler.store.confidence:.0%})")
+        print("=" * 80)
+        print(f"{'№':<4}{'Страна':<30} {'Интерес':>8} {'Интервал':>14} {'Выборок':>8} {'Риск':>6}")
+        print_separator()
+        for idx, (name, estimate) in enumerate(ranking):
+            risk = ""
+            if idx + 1 < len(ranking):
+                risk = f"{flip_probability(estimate, ranking[idx + 1][1]):.0%}"
+            interval = f"{estimate['low']:.1f}-{estimate['high']:.1f}"
+            print(f"{idx + 1:<4}{name:<30} {estimate['score']:>8.1f} {interval:>14} {estimate['samples']:>8} {risk:>6}")
+        print("Риск - вероятность того, что страна и следующая за ней стоят в обратном порядке")
+
+
+def print_proxy_pool(proxy_pool):
+    """Выводит состояние выходов пула прокси"""
+    if proxy_pool is None:
+        return
+    
+    print("\n" + "=" * 80)
+    print(f"ИСХОДЯЩИЕ АДРЕСА ({len(proxy_pool)})")
+    print("=" * 80)
+    print(f"{'Выход':<40} {'Запросов':>8} {'Ошибок':>7} {'Блок.':>6} {'Задержка':>9} {'Состояние':>12}")
+    print_separator()
+    for egress in proxy_pool.summary():
+        latency = f"{egress['latency'] * 1000:.0f} мс" if egress["latency"] is not None else "-"
+        state = f"карантин {egress['quarantine']:.0f}с" if egress["quarantine"] else "активен"
+        print(f"{egress['name']:<40} {egress['requests']:>8} {egress['errors']:>7} {egress['blocks']:>6} "
+              f"{latency:>9} {state:>12}")
+
+
 def print_timestamp(analyzer):
     """Выводит время анализа"""
     print(f"\nВремя анализа: {analyzer.analyzed.get('timestamp', 'N/A')}")
 
 
-def main():
-    """Главная функция"""
-    print_header()
+def parse_args(argv=None):
+    """Разбирает аргументы командной строки"""
+    arg_parser = argparse.ArgumentParser(description="Анализ спроса на VPN по локациям (Google Trends)")
+    arg_parser.add_argument("--plan", action="store_true",
+                            help="показать план запросов и оценку времени без обращения к сети")
+    arg_parser.add_argument("--geo", default=",".join(GEOS), metavar="CODES",
+                            help="коды геолокаций через запятую, например RU,KZ,BY,UZ (по умолчанию из config.GEOS)")
+    arg_parser.add_argument("--locations", default=LOCATIONS_PATH, metavar="PATH",
+                            help="файл конфигурации стран JSON/YAML (по умолчанию config.LOCATIONS_PATH или встроенная)")
+    arg_parser.add_argument("--backfill", action="store_true",
+                            help="пересчитать аналитику сохраненных запусков текущим анализатором (без сети)")
+    arg_parser.add_argument("--backfill-all", action="store_true",
+                            help="пересчитать все запуски, а не только посчитанные старым кодом (включает --backfill)")
+    arg_parser.add_argument("--backfill-workers", type=int, default=BACKFILL_WORKERS, metavar="N",
+                            help="процессов для --backfill (по умолчанию по числу ядер)")
+    arg_parser.add_argument("--no-history", action="store_true",
+                            help="не сохранять запуск в историю")
+    arg_parser.add_argument("--categories", default=",".join(map(str, CATEGORIES)), metavar="IDS",
+                            help="категории Google Trends через запятую, например 13,0,5 (по умолчанию из config.CATEGORIES)")
+    arg_parser.add_argument("--regions", nargs="?", const="REGION", choices=["REGION", "CITY"],
+                            help="собрать спрос по регионам (REGION) или городам (CITY) для топ-запросов")
+    arg_parser.add_argument("--nowcast", action="store_true",
+                            help="почасовой мониторинг: ряды \"now 7-d\", текущий спрос и всплески (для cron раз в час)")
+    arg_parser.add_argument("--discover", action="store_true",
+                            help="искать новые VPN-запросы обходом связанных запросов вместо анализа")
+    arg_parser.add_argument("--discover-budget", type=int, default=DISCOVERY_BUDGET, metavar="N",
+                            help=f"бюджет сетевых запросов поиска (по умолчанию {DISCOVERY_BUDGET})")
+    arg_parser.add_argument("--discover-depth", type=int, default=DISCOVERY_MAX_DEPTH, metavar="N",
+                            help=f"глубина обхода связанных запросов (по умолчанию {DISCOVERY_MAX_DEPTH})")
+    cassette_group = arg_parser.add_mutually_exclusive_group()
+    cassette_group.add_argument("--record", default=None, metavar="PATH",
+                                help="записать весь HTTP-обмен с Google Trends в кассету (.jsonl.gz), без кэша")
+    cassette_group.add_argument("--replay", default=None, metavar="PATH",
+                                help="воспроизвести кассету без сети, кэша и задержек ограничителя")
+    arg_parser.add_argument("--replay-latency", choices=["zero", "original"], default="zero",
+                            help="задержка ответов при воспроизведении: нулевая или как при записи")
+    arg_parser.add_argument("--proxies", default=",".join(PROXIES), metavar="URLS|PATH",
+                            help="пул исходящих адресов: URL прокси через запятую или файл со списком "
+                                 "(direct - собственный адрес хоста)")
+    arg_parser.add_argument("--no-quota", action="store_true",
+                            help="не использовать общий журнал квоты хоста (config.QUOTA_WINDOWS)")
+    arg_parser.add_argument("--no-anomaly", action="store_true",
+                            help=f"не обновлять потоковый детектор аномалий ({ANOMALY_STATE_PATH})")
+    arg_parser.add_argument("--resample", type=int, default=0, metavar="N",
+                            help="до N повторных запросов к странам, порядок которых в рейтинге "
+                                 "может определяться шумом выборки Trends")
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help="не использовать кэш ответов Google Trends")
+    arg_parser.add_argument("--profile", action="store_true",
+                            help="профилировать фазы запуска и вывести таблицу по фазам")
+    arg_parser.add_argument("--profile-folded", default="profile.folded", metavar="PATH",
+                            help="файл folded stacks для flamegraph (по умолчанию profile.folded)")
+    arg_parser.add_argument("--profile-cprofile", default=None, metavar="PATH",
+                            help="дополнительно сохранить дамп cProfile")
+    args = arg_parser.parse_args(argv)
+    args.backfill = args.backfill or args.backfill_all
+    args.geos = [geo.strip().upper() for geo in args.geo.split(",") if geo.strip()] or [GEO]
+    try:
+        categories = [int(category) for category in args.categories.split(",") if category.strip()]
+    except ValueError:
+        arg_parser.error(f"категории должны быть числами: {args.categories}")
+    args.categories = list(dict.fromkeys(categories)) or list(CATEGORIES)
+    args.proxy_urls = []
+    if args.proxies:
+        from proxy_pool import ProxyConfigError, load_proxies
+        try:
+            args.proxy_urls = load_proxies(args.proxies)
+        except ProxyConfigError as e:
+            arg_parser.error(str(e))
+    return args
+
+
+def run(args, profiler):
+    """
+    Выполняет запуск: генерация запросов, парсинг, анализ и отчет
+    
+    Args:
+        args: Аргументы командной строки
+        profiler: Профилировщик фаз (PhaseProfiler или NullProfiler)
+    """
+    if args.backfill:
+        with profiler.phase("backfill"):
+            run_backfill(args)
+        return
     
     # Генерируем запросы
     print("\nГенерация поисковых запросов...")
-    all_queries = generate_all_queries(COUNTRIES)
+    with profiler.phase("queries"):
+        try:
+            # Запуск CLI короткий: файл читается один раз, без горячей перезагрузки
+            locations = LocationConfig(args.locations, reload_interval=None)
+        except LocationConfigError as e:
+            raise SystemExit(f"❌ {e}")
+        all_queries = locations.queries
     total_queries = sum(len(v) for v in all_queries.values())
-    print(f"✓ Сгенерировано {len(all_queries)} стран с {total_queries} вариациями запросов")
+    source = "из кэша конфигурации" if locations.from_cache else "сгенерировано"
+    print(f"✓ {len(all_queries)} стран с {total_queries} вариациями запросов ({source})")
     
-    # Создаем парсер
+    # Кассета фиксирует полный обмен, поэтому кэш при записи и воспроизведении не используется
+    cassette_path = args.record or args.replay
+    if args.no_cache or cassette_path:
+        cache = None
+    else:
+        # Часовые данные устаревают за час: кэш только защищает от повторного запуска
+        cache = TrendsCache(ttl=NOWCAST_CACHE_TTL) if args.nowcast else TrendsCache()
+    
+    if args.plan:
+        with profiler.phase("plan"):
+            skeleton = locations.plan_skeleton(TIMEFRAMES, args.geos, args.categories)
+            plan = build_request_plan(all_queries, TIMEFRAMES, cache=cache, region_resolution=args.regions,
+                                      skeleton=skeleton)
+            egresses = 1
+            if args.proxy_urls:
+                from proxy_pool import count_hosts
+                egresses = count_hosts(args.proxy_urls)
+            # Без журнала квоты ее окна не ограничивают длительность
+            quota_windows = () if args.no_quota else QUOTA_WINDOWS
+            summary = estimate_plan(plan, quota_windows=quota_windows, egresses=egresses)
+        print_plan(summary)
+        return
+    
+    cassette = None
+    if cassette_path:
+        from cassette import Cassette
+        cassette = Cassette(cassette_path, "record" if args.record else "replay", latency=args.replay_latency)
+        action = "Запись" if args.record else "Воспроизведение"
+        print(f"{action} HTTP-обмена: {cassette_path}")
+    
+    try:
+        run_with_parser(args, profiler, locations, cache, cassette)
+    finally:
+        if cassette is not None:
+            cassette.close()
+            if args.record:
+                print(f"\nЗаписано обменов: {cassette.exchanges} ({cassette_path})")
+            else:
+                print(f"\nВоспроизведено обменов: {cassette.exchanges}, не использовано: {cassette.remaining}")
+
+
+def run_with_parser(args, profiler, locations, cache, cassette):
+    """Создает парсер, собирает данные и выводит отчет"""
+    # Создаем парсер (импортируется здесь: тянет HTTP-клиент, не нужный для --plan)
     print("\nИнициализация парсера Google Trends...")
-    parser = GoogleTrendsParser()
+    with profiler.phase("init"):
+        from google_trends_parser import GoogleTrendsParser
+        from rate_limiter import RateLimiter
+        if args.replay:
+            # Ответы приходят из кассеты: интервалы, квота и ожидание перед повтором не нужны;
+            # повтор старых данных не должен менять состояние детектора аномалий
+            parser_kwargs = {"rate_limiter": RateLimiter(0, 0), "retry_initial_delay": 0}
+        else:
+            ledger = None
+            if not args.no_quota:
+                from quota_ledger import QuotaLedger
+                ledger = QuotaLedger()
+                print(f"Общая квота хоста: {ledger.identity} ({ledger.path})")
+            parser_kwargs = {"rate_limiter": RateLimiter(REQUEST_DELAY_MIN, REQUEST_DELAY_MAX, ledger=ledger)}
+            if args.proxy_urls:
+                # Интервал и квота выдерживаются для каждого выхода пула отдельно
+                from proxy_pool import ProxyPool, ProxyRateLimiter
+                proxy_pool = ProxyPool(args.proxy_urls)
+                parser_kwargs["proxy_pool"] = proxy_pool
+                parser_kwargs["rate_limiter"] = ProxyRateLimiter(proxy_pool, REQUEST_DELAY_MIN, REQUEST_DELAY_MAX,
+                                                                 ledger=ledger)
+                print(f"Пул исходящих адресов: {len(proxy_pool)}")
+            if not args.no_anomaly:
+                from anomaly_detector import AnomalyDetector
+                parser_kwargs["detector"] = AnomalyDetector()
+            # Каждый ответ сети - выборка для оценки шума Trends
+            from resampling import SampleStore
+            parser_kwargs["sampler"] = SampleStore()
+        parser = GoogleTrendsParser(geo=args.geos[0], category=args.categories[0], cache=cache, profiler=profiler,
+                                    region_resolution=args.regions, cassette=cassette, **parser_kwargs)
     print("✓ Парсер готов")
     
+    try:
+        run_mode(parser, locations, args, profiler)
+        print_proxy_pool(parser.proxy_pool)
+    finally:
+        if parser.detector is not None:
+            parser.detector.save()
+        if parser.sampler is not None:
+            parser.sampler.save()
+
+
+def run_mode(parser, locations, args, profiler):
+    """Выполняет выбранный режим: поиск запросов, почасовой мониторинг или полный анализ"""
+    all_queries = locations.queries
+    if args.discover:
+        with profiler.phase("discover"):
+            run_discovery(parser, all_queries, args, locations.location_index)
+        return
+    
+    if args.nowcast:
+        with profiler.phase("nowcast"):
+            run_nowcast(parser, all_queries, args)
+        print_anomalies(parser.detector)
+        return
+    
     # Парсим данные
     print_separator()
-    all_data = parser.parse_all_countries(all_queries, TIMEFRAMES)
+    category = parser.category
+    with profiler.phase("parse"):
+        if len(args.categories) > 1:
+            sweep = parser.parse_sweep(args.geos, args.categories, all_queries, TIMEFRAMES)
+        elif len(args.geos) > 1:
+            sweep = {geo: {category: data}
+                     for geo, data in parser.parse_all_geos(args.geos, all_queries, TIMEFRAMES).items()}
+        else:
+            sweep = {args.geos[0]: {category: parser.parse_all_countries(all_queries, TIMEFRAMES)}}
     
     # Удаляем страны без данных (None)
-    valid_data = {k: v for k, v in all_data.items() if v is not None}
-    invalid_countries = [k for k, v in all_data.items() if v is None]
+    valid_sweep = {}
+    for geo, by_category in sweep.items():
+        for data_category, all_data in by_category.items():
+            valid_sweep.setdefault(geo, {})[data_category] = {k: v for k, v in all_data.items() if v is not None}
+            invalid_countries = [k for k, v in all_data.items() if v is None]
+            
+            if invalid_countries:
+                labels = []
+                if len(sweep) > 1:
+                    labels.append(f"геолокация {geo}")
+                if len(by_category) > 1:
+                    labels.append(f"категория {data_category}")
+                suffix = f" ({', '.join(labels)})" if labels else ""
+                print(f"\n⚠️  Не удалось получить данные для следующих стран{suffix}:")
+                for country in invalid_countries:
+                    print(f"    • {country}")
+    
+    rankings = None
+    if args.resample > 0 and parser.sampler is not None:
+        print_separator()
+        with profiler.phase("resample"):
+            rankings = run_resampling(parser, valid_sweep, all_queries, args.resample)
+    
+    # Анализаторы по парам (геолокация, категория) для истории запусков
+    if len(args.categories) > 1:
+        analyzers = {
+            (geo, sweep_category): multi_analyzer.get_analyzer(sweep_category)
+            for geo, multi_analyzer in report_categories(valid_sweep, all_queries, profiler).items()
+            for sweep_category in multi_analyzer.categories
+        }
+    elif len(valid_sweep) > 1:
+        multi_analyzer = report_multi_geo({geo: by_category[category] for geo, by_category in valid_sweep.items()},
+                                          all_queries, profiler)
+        analyzers = {(geo, category): multi_analyzer.get_analyzer(geo) for geo in multi_analyzer.geos}
+    else:
+        analyzers = {(args.geos[0], category): report_single_geo(valid_sweep[args.geos[0]][category],
+                                                                 all_queries, profiler)}
+    
+    # Повтор кассеты не добавляет запуск в историю
+    if not args.replay and not args.no_history:
+        with profiler.phase("history"):
+            save_history(analyzers)
+    
+    if rankings:
+        from resampling import ResamplingScheduler
+        print_confidence(rankings, ResamplingScheduler(parser.sampler))
     
-    if invalid_countries:
-        print(f"\n⚠️  Не удалось получить данные для следующих стран:")
-        for country in invalid_countries:
-            print(f"    • {country}")
+    print_anomalies(parser.detector)
     
+    print("\n" + "=" * 80)
+    print("Анализ завершен!")
+    print("=" * 80)
+
+
+def run_resampling(parser, valid_sweep, all_queries, budget):
+    """
+    Повторно запрашивает страны, порядок которых в рейтинге может определяться шумом
+    
+    Интерес в valid_sweep заменяется средним по всем выборкам ячейки.
+    
+    Args:
+        parser: GoogleTrendsParser с SampleStore
+        valid_sweep: {geo: {category: {country: CountryResult}}} (изменяется на месте)
+        all_queries: Словарь {country_name: [queries]}
+        budget: Максимум дополнительных запросов
+    
+    Returns:
+        dict: {(geo, category): {country: (cell_key, queries)}} - рейтинги с выборками
+    """
+    from records import as_country_result
+    from resampling import ResamplingScheduler, resampled_period
+    
+    store = parser.sampler
+    timeframe = TIMEFRAMES[RESAMPLE_PERIOD]
+    rankings = {}
+    for geo, by_category in valid_sweep.items():
+        for category, all_data in by_category.items():
+            cells = {}
+            for country, data in all_data.items():
+                result = all_data[country] = as_country_result(data)
+                period = result.periods.get(RESAMPLE_PERIOD)
+                if period is None:
+                    continue
+                queries = all_queries[country][:MAX_QUERIES_PER_REQUEST]
+                cell_key = TrendsCache.make_key("interest", queries, timeframe, geo, category)
+                if store.samples(cell_key) == 0:
+                    # Ответ взят из кэша: учитываем его как первую выборку
+                    store.observe(cell_key, dict(zip(period.queries, period.interests)))
+                cells[country] = (cell_key, queries)
+            rankings[(geo, category)] = cells
+    
+    print(f"Повторные выборки ({RESAMPLE_PERIOD}), бюджет: {budget} запросов")
+    scheduler = ResamplingScheduler(store)
+    failed = set()
+    spent = 0
+    while spent < budget:
+        pick = scheduler.next_pick(rankings, exclude=failed)
+        if pick is None:
+            print("✓ Порядок стран устойчив к шуму выборки")
+            break
+        (geo, category), country, benefit = pick
+        cell_key, queries = rankings[(geo, category)][country]
+        spent += 1
+        print(f"  [{spent}/{budget}] {country} ({geo}, кат. {category}): "
+              f"выборка {store.samples(cell_key) + 1}, польза {benefit:.3f}")
+        averages, _ = parser.get_interest_summary(queries, timeframe, geo=geo, category=category, refresh=True)
+        if averages is None:
+            # Без новой выборки ячейку выбирали бы снова
+            print(f"    ❌ {country}: повторный запрос не удался, страна исключена из повторов")
+            failed.add(((geo, category), country))
+    else:
+        print(f"Бюджет повторов исчерпан ({budget})")
+    
+    # Интерес стран - среднее по всем выборкам
+    for (geo, category), cells in rankings.items():
+        all_data = valid_sweep[geo][category]
+        for country, (cell_key, queries) in cells.items():
+            estimate = store.estimate(cell_key, queries)
+            if estimate is not None and estimate["samples"] > 1:
+                periods = all_data[country].periods
+                periods[RESAMPLE_PERIOD] = resampled_period(periods[RESAMPLE_PERIOD], estimate)
+    return rankings
+
+
+def save_history(analyzers):
+    """
+    Сохраняет результаты и аналитику запуска в историю (для последующего --backfill)
+    
+    Args:
+        analyzers: {(geo, category): SEOAnalyzer}
+    """
+    from run_history import HistoryStore, analysis_fingerprint
+    
+    store = HistoryStore()
+    run_id = store.new_run_id()
+    fingerprint = analysis_fingerprint()
+    for (geo, category), analyzer in analyzers.items():
+        store.save(run_id, geo, category, analyzer, fingerprint)
+    print(f"\nЗапуск сохранен в историю: {run_id} ({len(analyzers)} шардов, {store.directory})")
+
+
+def run_backfill(args):
+    """Пересчитывает аналитику всех сохраненных запусков текущим анализатором в пуле процессов"""
+    from run_history import HistoryStore, backfill
+    
+    store = HistoryStore()
+    print(f"\nПересчет истории запусков: {store.directory}")
+    print_separator()
+    summary = backfill(store, workers=args.backfill_workers, recompute_all=args.backfill_all)
+    
+    print("\n" + "=" * 80)
+    print("ПЕРЕСЧЕТ ИСТОРИИ")
+    print("=" * 80)
+    if not summary["shards"] and not summary["failed"]:
+        print(f"Пересчитывать нечего: {summary['total_shards']} шардов посчитаны текущим анализатором")
+        print("(--backfill-all - пересчитать все)")
+        return
+    
+    elapsed = summary["elapsed"] or 1e-9
+    print(f"Шардов пересчитано:     {summary['shards']} из {summary['total_shards']}")
+    if summary["failed"]:
+        print(f"С ошибками:             {len(summary['failed'])}")
+    print(f"Стран:                  {summary['countries']}")
+    print(f"Процессов:              {summary['workers']}")
+    print(f"Время:                  {elapsed:.2f} сек")
+    print(f"Пропускная способность: {summary['shards'] / elapsed:.1f} шардов/с, "
+          f"{summary['countries'] / elapsed:.0f} стран/с, {summary['bytes'] / elapsed / 1e6:.1f} МБ/с")
+    # Отношение суммарного времени процессов к общему - фактическое распараллеливание
+    print(f"Ускорение:              {summary['worker_seconds'] / elapsed:.1f}x")
+
+
+def run_discovery(parser, all_queries, args, location_index):
+    """
+    Ищет новые VPN-запросы обходом связанных запросов от вариаций стран
+    
+    Args:
+        parser: GoogleTrendsParser
+        all_queries: Словарь {country_name: [queries]}
+        args: Аргументы командной строки
+        location_index: Индекс названий стран (LocationConfig.location_index)
+    """
+    from discovery import DiscoveryCrawler
+    
+    # Исходные запросы по кругу: сначала первые вариации всех стран, затем вторые и т.д.
+    seeds = {}
+    for country_queries in all_queries.values():
+        for position, query in enumerate(country_queries):
+            seeds.setdefault(query, 100 - position)
+    
+    crawler = DiscoveryCrawler(parser, TIMEFRAMES[DISCOVERY_PERIOD], args.discover_budget, args.discover_depth,
+                               geo=args.geos[0], location_index=location_index)
+    crawler.add_seeds(seeds)
+    
+    print(f"\nПоиск новых запросов: бюджет {args.discover_budget} запросов, глубина {args.discover_depth}")
+    print_separator()
+    crawler.crawl()
+    
+    known = [query for country_queries in all_queries.values() for query in country_queries]
+    found = crawler.discoveries(known, limit=50)
+    
+    print("\n" + "=" * 80)
+    print(f"НОВЫЕ ЗАПРОСЫ (раскрыто {crawler.expanded}, в сеть {crawler.network_requests}, "
+          f"в очереди {len(crawler.frontier)})")
+    print("=" * 80)
+    if not found:
+        print("Новых запросов не найдено")
+        return
+    
+    print(f"{'№':<4} {'Запрос':<40} {'Вес':>6} {'Гл.':>4}  {'Тип':<7} {'Страна'}")
+    print_separator()
+    for idx, entry in enumerate(found, 1):
+        print(f"{idx:<4} {entry['query']:<40} {entry['score']:>6.1f} {entry['depth']:>4}  "
+              f"{entry['source']:<7} {entry['country'] or '-'}")
+
+
+def run_nowcast(parser, all_queries, args):
+    """
+    Обновляет часовые ряды стран и выводит текущий спрос и всплески по геолокациям
+    
+    Args:
+        parser: GoogleTrendsParser
+        all_queries: Словарь {country_name: [queries]}
+        args: Аргументы командной строки
+    """
+    from nowcast import NowcastStore, collect_nowcast, detect_spikes
+    
+    store = NowcastStore()
+    for geo in args.geos:
+        print(f"\nЧасовые ряды ({NOWCAST_TIMEFRAME}), геолокация {geo}")
+        print_separator()
+        new_hours = collect_nowcast(parser, all_queries, store, geo, NOWCAST_TIMEFRAME)
+        print(f"✓ Новых часов: {new_hours}, запросов: {parser.request_count}, из кэша: {parser.cache_hits}")
+        
+        countries = store.series(geo)
+        names = list(countries)
+        results = detect_spikes([countries[name] for name in names])
+        print_nowcast(geo, names, results)
+
+
+def print_nowcast(geo, names, results):
+    """Выводит текущий спрос по странам: сначала всплески, затем по отношению к ожидаемому"""
+    from datetime import datetime
+    
+    rows = [(name, result) for name, result in zip(names, results) if result is not None]
+    rows.sort(key=lambda row: (not row[1]["spike"], -row[1]["ratio"]))
+    
+    last_hour = next((result["last_hour"] for _, result in rows), None)
+    updated = datetime.fromtimestamp(last_hour).strftime("%d.%m %H:00") if last_hour else "N/A"
+    print("\n" + "=" * 80)
+    print(f"ТЕКУЩИЙ СПРОС ПО ЧАСАМ | геолокация {geo} | данные до {updated}")
+    print("=" * 80)
+    print(f"{'Страна':<20} {'Сейчас':>8} {'Ожидание':>9} {'Отн.':>7} {'z':>7} {'Сут/сут':>9}  {'Всплеск'}")
+    print_separator()
+    for name, result in rows:
+        spike = f"⚠ {result['spike_hours']} ч" if result["spike"] else ""
+        day_change = result["day_change_percent"]
+        day_change = f"{day_change:+.1f}%" if day_change is not None else "N/A"
+        print(f"{name:<20} {result['current']:>8.1f} {result['expected']:>9.1f} {result['ratio']:>6.2f}x "
+              f"{result['z']:>7.1f} {day_change:>9}  {spike}")
+    
+    spikes = [name for name, result in rows if result["spike"]]
+    if spikes:
+        print(f"\n⚠️  Всплеск спроса: {', '.join(spikes)}")
+
+
+def report_single_geo(valid_data, all_queries, profiler):
+    """Анализирует данные одной геолокации и выводит полный отчет (возвращает SEOAnalyzer)"""
     # Анализируем только валидные данные
     print("\nАнализ полученных данных...")
-    analyzer = SEOAnalyzer(valid_data, all_queries)
-    analyzed = analyzer.analyze_all_countries()
+    with profiler.phase("analyze"):
+        analyzer = SEOAnalyzer(valid_data, all_queries)
+        analyzed = analyzer.analyze_all_countries()
     print(f"✓ Проанализировано {len(analyzed['countries'])} стран с валидными данными")
     
-    # Выводим результаты
-    print_top_countries(analyzer)
-    print_period_comparison(analyzer)
-    print_rising_countries(analyzer)
-    print_falling_countries(analyzer)
+    with profiler.phase("report"):
+        # Выводим результаты
+        print_top_countries(analyzer)
+        print_period_comparison(analyzer)
+        print_rising_countries(analyzer)
+        print_falling_countries(analyzer)
+        
+        # Детали по топ-3 странам
+        top_3 = analyzer.get_top_countries("3_months", limit=3)
+        for country in top_3:
+            print_country_details(analyzer, country["country"])
+        
+        # Региональный спрос
+        print_regional_demand(analyzer)
+        
+        # Рекомендации
+        print_recommendations(analyzer)
+        
+        # Таймстамп
+        print_timestamp(analyzer)
     
-    # Детали по топ-3 странам
-    top_3 = analyzer.get_top_countries("3_months", limit=3)
-    for country in top_3:
-        print_country_details(analyzer, country["country"])
+    return analyzer
+
+
+def report_multi_geo(valid_geo_data, all_queries, profiler):
+    """Анализирует данные нескольких геолокаций и выводит рейтинги по каждой и сводный (возвращает MultiGeoAnalyzer)"""
+    print("\nАнализ полученных данных...")
+    with profiler.phase("analyze"):
+        multi_analyzer = MultiGeoAnalyzer(valid_geo_data, all_queries)
+        analyzed = multi_analyzer.analyze_all()
+    for geo, geo_analyzed in analyzed.items():
+        print(f"✓ {geo}: проанализировано {len(geo_analyzed['countries'])} стран с валидными данными")
     
-    # Рекомендации
-    print_recommendations(analyzer)
+    with profiler.phase("report"):
+        for geo in multi_analyzer.geos:
+            print_top_countries(multi_analyzer.get_analyzer(geo), geo=geo)
+        
+        print_geo_comparison(multi_analyzer)
+        print_timestamp(multi_analyzer.get_analyzer(multi_analyzer.geos[0]))
     
-    # Таймстамп
-    print_timestamp(analyzer)
+    return multi_analyzer
+
+
+def report_categories(valid_sweep, all_queries, profiler):
+    """
+    Анализирует данные по категориям в каждой геолокации и выводит рейтинги и сравнение
     
-    print("\n" + "=" * 80)
-    print("Анализ завершен!")
-    print("=" * 80)
+    Returns:
+        dict: {geo: MultiCategoryAnalyzer}
+    """
+    print("\nАнализ полученных данных...")
+    analyzers = {}
+    with profiler.phase("analyze"):
+        for geo, by_category in valid_sweep.items():
+            analyzers[geo] = MultiCategoryAnalyzer(by_category, all_queries)
+            for category, analyzed in analyzers[geo].analyze_all().items():
+                print(f"✓ {geo}, категория {category}: проанализировано {len(analyzed['countries'])} стран")
+    
+    with profiler.phase("report"):
+        for geo, multi_analyzer in analyzers.items():
+            for category in multi_analyzer.categories:
+                print_top_countries(multi_analyzer.get_analyzer(category), geo=geo, category=category)
+            print_category_comparison(multi_analyzer, geo)
+        
+        first = next(iter(analyzers.values()))
+        print_timestamp(first.get_analyzer(first.categories[0]))
+    
+    return analyzers
+
+
+def main(argv=None):
+    """Главная функция"""
+    args = parse_args(argv)
+    print_header(args.geos)
+    
+    if not args.profile:
+        run(args, NullProfiler())
+        return
+    
+    profiler = PhaseProfiler(cprofile_path=args.profile_cprofile)
+    profiler.start()
+    try:
+        with profiler.phase("main"):
+            run(args, profiler)
+    finally:
+        profiler.stop()
+        profiler.print_report()
+        profiler.write_folded(args.profile_folded)
+        print(f"\nFolded stacks для flamegraph: {args.profile_folded}")
+        if args.profile_cprofile:
+            print(f"Дамп cProfile: {args.profile_cprofile}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,307 @@
+"""
+Почасовой мониторинг спроса (nowcast) по данным Google Trends "now 7-d"
+
+Для каждой страны один пакетный запрос (до 5 вариаций) дает часовой ряд за 7
+дней; спрос страны - сумма вариаций пакета. Ряды накапливаются в хранилище
+(.cache/nowcast): каждый новый ответ нормирован Google заново (максимум окна =
+100), поэтому история пересчитывается в масштаб нового ответа по медиане
+отношений в пересекающихся часах, и запуск раз в час добавляет только новые
+точки.
+
+Анализ векторизован по матрице NumPy (страны × часы): текущий уровень -
+скользящее среднее последних часов, ожидаемый - медиана тех же часов суток за
+прошлые дни (суточная сезонность), шум - MAD разностей "час к тому же часу
+вчера". Всплеск - робастный z-score выше порога при кратном росте.
+"""
+import json
+import os
+import statistics
+import warnings
+
+import numpy as np
+
+from config import (
+    NOWCAST_DIR, NOWCAST_HISTORY_HOURS, NOWCAST_RECENT_HOURS, NOWCAST_BASELINE_DAYS,
+    NOWCAST_SPIKE_Z, NOWCAST_SPIKE_RATIO,
+)
+
+HOUR = 3600
+DAY_HOURS = 24
+# Нормирующий множитель MAD для нормального распределения
+MAD_SCALE = 1.4826
+# Минимальный шум: значения Trends - целые 0-100
+MIN_NOISE = 1.0
+
+
+def country_demand(series):
+    """
+    Суммирует вариации пакета в ряд спроса страны
+    
+    Args:
+        series: {"timestamps": [...], "values": {query: [...]}}
+    
+    Returns:
+        tuple: (timestamps, values)
+    """
+    columns = list(series["values"].values())
+    values = [sum(column[idx] for column in columns) for idx in range(len(series["timestamps"]))]
+    return list(series["timestamps"]), values
+
+
+def merge_series(old, timestamps, values, history_hours=NOWCAST_HISTORY_HOURS):
+    """
+    Добавляет новый ответ к накопленному ряду
+    
+    История переводится в масштаб нового ответа по медиане отношений в общих
+    часах. Если общих часов нет (перерыв больше 7 дней), масштабы несравнимы и
+    история заменяется новым ответом.
+    
+    Args:
+        old: Накопленный ряд {"timestamps": [...], "values": [...]} или None
+        timestamps: Время точек нового ответа
+        values: Значения нового ответа
+        history_hours: Сколько часов истории хранить
+    
+    Returns:
+        tuple: (ряд, количество новых часов)
+    """
+    stored = dict(zip(old["timestamps"], old["values"])) if old else {}
+    ratios = [value / stored[ts] for ts, value in zip(timestamps, values)
+              if stored.get(ts, 0) > 0 and value > 0]
+    if ratios:
+        factor = statistics.median(ratios)
+        merged = {ts: value * factor for ts, value in stored.items()}
+    else:
+        merged = {}
+    
+    last_stored = max(stored) if stored else None
+    new_hours = sum(1 for ts in timestamps if last_stored is None or ts > last_stored)
+    merged.update(zip(timestamps, values))
+    if not merged:
+        return {"timestamps": [], "values": []}, 0
+    
+    cutoff = max(merged) - history_hours * HOUR
+    merged_timestamps = sorted(ts for ts in merged if ts > cutoff)
+    return {
+        "timestamps": merged_timestamps,
+        "values": [round(merged[ts], 3) for ts in merged_timestamps],
+    }, new_hours
+
+
+class NowcastStore:
+    """Накопленные часовые ряды спроса стран, по файлу JSON на геолокацию"""
+    
+    def __init__(self, directory=NOWCAST_DIR, history_hours=NOWCAST_HISTORY_HOURS):
+        """
+        Args:
+            directory: Директория хранилища
+            history_hours: Сколько часов истории хранить
+        """
+        self.directory = directory
+        self.history_hours = history_hours
+        self._geos = {}
+    
+    def _path(self, geo):
+        return os.path.join(self.directory, f"{geo}.json")
+    
+    def series(self, geo):
+        """Возвращает ряды геолокации {country: {"timestamps": [...], "values": [...]}}"""
+        if geo not in self._geos:
+            try:
+                with open(self._path(geo), encoding="utf-8") as f:
+                    self._geos[geo] = json.load(f)
+            except (OSError, ValueError):
+                self._geos[geo] = {}
+        return self._geos[geo]
+    
+    def merge(self, geo, country, timestamps, values):
+        """
+        Добавляет ответ "now 7-d" к ряду страны
+        
+        Returns:
+            int: Количество новых часов
+        """
+        countries = self.series(geo)
+        countries[country], new_hours = merge_series(countries.get(country), timestamps, values,
+                                                     self.history_hours)
+        return new_hours
+    
+    def save(self, geo):
+        """Сохраняет ряды геолокации (атомарная замена файла)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(geo)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.series(geo), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def collect_nowcast(parser, all_queries, store, geo, timeframe):
+    """
+    Получает часовые ряды всех стран и добавляет их в хранилище
+    
+    Ответы идут через кэш парсера (с коротким TTL), поэтому повторный запуск в
+    течение часа не обращается к сети.
+    
+    Args:
+        parser: GoogleTrendsParser
+        all_queries: Словарь {country_name: [queries]}
+        store: NowcastStore
+        geo: Код геолокации
+        timeframe: Период ("now 7-d")
+    
+    Returns:
+        int: Количество новых часов по всем странам
+    """
+    total_new = 0
+    for idx, (country_name, queries) in enumerate(all_queries.items(), 1):
+        _, series = parser.get_interest_summary(queries, timeframe, geo=geo)
+        if not series or not series["timestamps"]:
+            print(f"  [{idx}/{len(all_queries)}] {country_name}: нет данных")
+            continue
+        new_hours = store.merge(geo, country_name, *country_demand(series))
+        total_new += new_hours
+        print(f"  [{idx}/{len(all_queries)}] {country_name}: +{new_hours} ч")
+    store.save(geo)
+    return total_new
+
+
+def build_hourly_matrix(series_list, hours):
+    """
+    Раскладывает ряды на общую часовую сетку
+    
+    Точки внутри одного часа усредняются (пересэмплирование), отсутствующие часы
+    заполняются NaN. Сетка заканчивается последним часом среди всех рядов.
+    
+    Args:
+        series_list: Список {"timestamps": [...], "values": [...]}
+        hours: Длина сетки в часах
+    
+    Returns:
+        tuple: (matrix n × hours, время последнего часа сетки или None)
+    """
+    last = [series["timestamps"][-1] for series in series_list if series["timestamps"]]
+    if not last:
+        return np.full((len(series_list), hours), np.nan), None
+    end = max(last) // HOUR
+    start = end - hours + 1
+    
+    sums = np.zeros((len(series_list), hours))
+    counts = np.zeros((len(series_list), hours))
+    for row, series in enumerate(series_list):
+        columns = np.asarray(series["timestamps"], dtype=np.int64) // HOUR - start
+        inside = (columns >= 0) & (columns < hours)
+        values = np.asarray(series["values"], dtype=float)
+        np.add.at(sums[row], columns[inside], values[inside])
+        np.add.at(counts[row], columns[inside], 1)
+    
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan), int(end * HOUR)
+
+
+def rolling_mean(matrix, window):
+    """
+    Скользящее среднее по строкам без учета пропусков (через накопленные суммы)
+    
+    Returns:
+        ndarray: n × (T - window + 1); столбец j - среднее часов [j, j + window)
+    """
+    valid = ~np.isnan(matrix)
+    zero = np.zeros((matrix.shape[0], 1))
+    sums = np.concatenate([zero, np.cumsum(np.where(valid, matrix, 0.0), axis=1)], axis=1)
+    counts = np.concatenate([zero, np.cumsum(valid, axis=1)], axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (sums[:, window:] - sums[:, :-window]) / (counts[:, window:] - counts[:, :-window])
+
+
+def seasonal_expected(matrix, days):
+    """
+    Ожидаемое значение часа - медиана того же часа суток за предыдущие days дней
+    
+    Returns:
+        ndarray: n × (T - 24 * days), выровнено по последним столбцам матрицы
+    """
+    width = matrix.shape[1] - DAY_HOURS * days
+    lags = np.stack([
+        matrix[:, DAY_HOURS * (days - lag):DAY_HOURS * (days - lag) + width]
+        for lag in range(1, days + 1)
+    ])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanmedian(lags, axis=0)
+
+
+def noise_scale(matrix, recent):
+    """Робастная оценка шума: MAD разностей "час - тот же час вчера" без последних часов"""
+    history = matrix[:, :matrix.shape[1] - recent]
+    diffs = history[:, DAY_HOURS:] - history[:, :-DAY_HOURS]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        # Разность двух независимых точек имеет дисперсию 2 sigma^2
+        scale = MAD_SCALE * np.nanmedian(np.abs(diffs), axis=1) / np.sqrt(2)
+    return np.fmax(np.nan_to_num(scale, nan=MIN_NOISE), MIN_NOISE)
+
+
+def trailing_run(flags):
+    """Длина серии True в конце каждой строки"""
+    return np.cumprod(flags[:, ::-1], axis=1).sum(axis=1)
+
+
+def detect_spikes(series_list, recent=NOWCAST_RECENT_HOURS, days=NOWCAST_BASELINE_DAYS,
+                  spike_z=NOWCAST_SPIKE_Z, spike_ratio=NOWCAST_SPIKE_RATIO):
+    """
+    Оценивает текущий спрос и всплески для всех рядов за один проход
+    
+    Args:
+        series_list: Список {"timestamps": [...], "values": [...]}
+        recent: Сколько последних часов усредняется в текущий уровень
+        days: За сколько прошлых дней берется медиана того же часа
+        spike_z: Порог робастного z-score
+        spike_ratio: Минимальное отношение текущего уровня к ожидаемому
+    
+    Returns:
+        list: Для каждого ряда словарь или None (мало данных):
+              current - среднее последних recent часов; expected - ожидаемое среднее;
+              ratio - current / expected; z - робастный z-score; day_change_percent -
+              последние 24 часа к предыдущим 24, % (None - не вычисляется);
+              spike - флаг всплеска;
+              spike_hours - сколько последних часов подряд держится всплеск;
+              last_hour - время последнего часа сетки
+    """
+    if not series_list:
+        return []
+    
+    hours = DAY_HOURS * (days + 1)
+    matrix, last_hour = build_hourly_matrix(series_list, hours)
+    expected = seasonal_expected(matrix, days)
+    scale = noise_scale(matrix, recent)
+    
+    # Скользящие средние уровня и ожидания за recent часов по последним суткам
+    current = rolling_mean(matrix[:, -DAY_HOURS:], recent)
+    baseline = rolling_mean(expected, recent)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (current - baseline) / scale[:, None]
+        ratio = np.where(baseline > 0, current / baseline, np.where(current > 0, np.inf, np.nan))
+    flags = (z >= spike_z) & (ratio >= spike_ratio)
+    spike_hours = trailing_run(flags)
+    
+    daily = rolling_mean(matrix, DAY_HOURS)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        day_change = (daily[:, -1] - daily[:, -1 - DAY_HOURS]) / daily[:, -1 - DAY_HOURS] * 100
+    
+    results = []
+    for row in range(len(series_list)):
+        if not np.isfinite(current[row, -1]) or not np.isfinite(baseline[row, -1]):
+            results.append(None)
+            continue
+        results.append({
+            "current": float(current[row, -1]),
+            "expected": float(baseline[row, -1]),
+            "ratio": float(ratio[row, -1]),
+            "z": float(z[row, -1]),
+            "day_change_percent": float(day_change[row]) if np.isfinite(day_change[row]) else None,
+            "spike": bool(flags[row, -1]),
+            "spike_hours": int(spike_hours[row]),
+            "last_hour": last_hour,
+        })
+    return results
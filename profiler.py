@@ -0,0 +1,170 @@
+"""
+Профилирование фаз работы парсера и анализатора
+"""
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class NullProfiler:
+    """Профилировщик-заглушка: фазы ничего не измеряют"""
+    
+    enabled = False
+    
+    def phase(self, name):
+        """Возвращает пустой контекстный менеджер"""
+        return nullcontext()
+
+
+class PhaseProfiler:
+    """
+    Собирает время (wall/cpu) и пик памяти по вложенным фазам
+    
+    Фазы вкладываются друг в друга, статистика агрегируется по полному пути
+    фазы (например, main;parse;interest;http). Пик - наибольший прирост памяти
+    под tracemalloc от начала фазы до любого момента внутри нее (максимум по
+    вызовам), поэтому фаза, которая выделяет и освобождает память, тоже видна.
+    """
+    
+    enabled = True
+    
+    def __init__(self, trace_memory=True, cprofile_path=None):
+        """
+        Инициализация профилировщика
+        
+        Args:
+            trace_memory: Считать пик памяти через tracemalloc
+            cprofile_path: Путь для дампа cProfile (None - не использовать cProfile)
+        """
+        self.trace_memory = trace_memory
+        self.cprofile_path = cprofile_path
+        self.stats = {}
+        self._stack = []
+        self._profile = None
+        # tracemalloc подключается в start(), чтобы не замедлять импорт
+        self._tracemalloc = None
+    
+    def start(self):
+        """Включает трассировку памяти и cProfile"""
+        if self.trace_memory:
+            import tracemalloc
+            
+            self._tracemalloc = tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        if self.cprofile_path:
+            import cProfile
+            
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+    
+    def stop(self):
+        """Выключает сбор и сохраняет дамп cProfile"""
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.cprofile_path)
+            self._profile = None
+        if self._tracemalloc is not None and self._tracemalloc.is_tracing():
+            self._tracemalloc.stop()
+    
+    def _memory(self):
+        """Текущий и пиковый объем памяти под tracemalloc (байты)"""
+        if self._tracemalloc is not None and self._tracemalloc.is_tracing():
+            return self._tracemalloc.get_traced_memory()
+        return 0, 0
+    
+    def _reset_peak(self):
+        """
+        Сбрасывает пик tracemalloc к текущему объему
+        
+        Пик, достигнутый до сброса, сохраняется во внешней фазе.
+        
+        Returns:
+            int: Текущий объем памяти (байты)
+        """
+        current, peak = self._memory()
+        if self._stack:
+            outer = self._stack[-1][1]
+            outer["peak"] = max(outer["peak"], peak)
+        if self._tracemalloc is not None and self._tracemalloc.is_tracing():
+            self._tracemalloc.reset_peak()
+        return current
+    
+    @contextmanager
+    def phase(self, name):
+        """
+        Измеряет фазу
+        
+        Args:
+            name: Название фазы
+        """
+        path = tuple(frame_name for frame_name, _ in self._stack) + (name,)
+        mem_start = self._reset_peak()
+        frame = {"children_wall": 0.0, "peak": mem_start}
+        self._stack.append((name, frame))
+        
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            peak = max(frame["peak"], self._memory()[1])
+            self._stack.pop()
+            
+            entry = self.stats.setdefault(path, {
+                "calls": 0, "wall": 0.0, "cpu": 0.0, "self_wall": 0.0, "peak": 0
+            })
+            entry["calls"] += 1
+            entry["wall"] += wall
+            entry["cpu"] += cpu
+            entry["self_wall"] += wall - frame["children_wall"]
+            entry["peak"] = max(entry["peak"], peak - mem_start)
+            
+            if self._stack:
+                outer = self._stack[-1][1]
+                outer["children_wall"] += wall
+                outer["peak"] = max(outer["peak"], peak)
+    
+    def report(self):
+        """
+        Возвращает статистику по фазам в порядке дерева
+        
+        Returns:
+            list: Список словарей {path, calls, wall, cpu, self_wall, peak, share}
+        """
+        total = sum(entry["wall"] for path, entry in self.stats.items() if len(path) == 1)
+        rows = []
+        for path in sorted(self.stats):
+            entry = self.stats[path]
+            rows.append({
+                "path": path,
+                **entry,
+                "share": entry["wall"] / total * 100 if total > 0 else 0.0,
+            })
+        return rows
+    
+    def print_report(self):
+        """Выводит таблицу по фазам"""
+        print("\n" + "=" * 80)
+        print("ПРОФИЛЬ ПО ФАЗАМ")
+        print("=" * 80)
+        print(f"{'Фаза':<32} {'Вызовы':>7} {'Wall, с':>10} {'CPU, с':>10} {'%':>6} {'Пик, КБ':>11}")
+        print("-" * 80)
+        for row in self.report():
+            label = "  " * (len(row["path"]) - 1) + row["path"][-1]
+            print(f"{label:<32} {row['calls']:>7} {row['wall']:>10.3f} {row['cpu']:>10.3f} "
+                  f"{row['share']:>6.1f} {row['peak'] / 1024:>11.1f}")
+    
+    def write_folded(self, path):
+        """
+        Сохраняет профиль в формате folded stacks (flamegraph.pl, speedscope)
+        
+        Args:
+            path: Путь к файлу; значения - собственное время фазы в микросекундах
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, entry in sorted(self.stats.items()):
+                micros = int(entry["self_wall"] * 1_000_000)
+                if micros > 0:
+                    f.write(f"{';'.join(stack)} {micros}\n")
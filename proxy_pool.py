@@ -0,0 +1,396 @@
+"""
+Пул исходящих адресов (HTTP/SOCKS-прокси) для запросов к Google Trends
+
+Для каждого выхода пул ведет здоровье: скользящие средние задержки ответа и доли
+ошибок, счетчик ошибок подряд и момент, до которого выход на карантине. Ответ
+429/403 означает, что Google ограничил адрес, - выход сразу уходит на карантин,
+и каждая следующая блокировка удваивает его срок. Ошибки соединения уводят выход
+на карантин после PROXY_MAX_FAILURES подряд.
+
+Выход для запроса выбирается случайно с весом (1 - доля ошибок)^2 / задержка среди
+здоровых выходов, у которых истек собственный интервал между запросами. Интервал
+выдерживается для каждого адреса отдельно (ProxyRateLimiter), поэтому N выходов
+дают до N раз больше запросов в минуту при том же темпе для каждого адреса.
+Интервал и квота относятся к хосту: несколько прокси одного сервера (например,
+HTTP- и SOCKS-порт) выходят в сеть с одного IP и делят один бюджет.
+"""
+import random
+import time
+from urllib.parse import urlsplit
+
+from config import (
+    PROXY_QUARANTINE, PROXY_QUARANTINE_MAX, PROXY_MAX_FAILURES, PROXY_EWMA_ALPHA, PROXY_INITIAL_LATENCY,
+    REQUEST_TIMEOUT,
+)
+from rate_limiter import RateLimiter
+
+# Собственный адрес хоста в списке выходов
+DIRECT = "direct"
+PROXY_SCHEMES = ("http", "https", "socks4", "socks4a", "socks5", "socks5h")
+# Ответы, означающие ограничение адреса со стороны Google
+BLOCKED_STATUSES = (403, 429)
+
+
+class ProxyConfigError(ValueError):
+    """Ошибка в списке прокси"""
+
+
+class Egress:
+    """Один исходящий адрес: прокси или собственный адрес хоста"""
+    
+    __slots__ = ("url", "name", "host", "latency", "error_rate", "requests", "errors", "blocks",
+                 "consecutive", "strikes", "quarantined_until")
+    
+    def __init__(self, url):
+        """
+        Args:
+            url: URL прокси (scheme://[user:password@]host:port) или DIRECT
+        """
+        self.url = None if url == DIRECT else url
+        if self.url is None:
+            self.name = self.host = DIRECT
+        else:
+            parts = urlsplit(url)
+            # Логин и пароль не попадают в вывод и журнал квоты
+            self.name = f"{parts.scheme}://{parts.hostname}:{parts.port}"
+            self.host = parts.hostname
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.blocks = 0
+        self.consecutive = 0
+        self.strikes = 0
+        self.quarantined_until = 0.0
+    
+    @property
+    def identity(self):
+        """Идентификатор адреса в журнале квоты: хост прокси (None - адрес хоста)"""
+        return None if self.url is None else f"proxy:{self.host}"
+    
+    @property
+    def proxies(self):
+        """Словарь proxies для requests.Session"""
+        return {} if self.url is None else {"http": self.url, "https": self.url}
+    
+    def quarantined(self, now=None):
+        """Находится ли выход на карантине"""
+        return self.quarantined_until > (time.monotonic() if now is None else now)
+    
+    def weight(self, default_latency=PROXY_INITIAL_LATENCY):
+        """Вес выбора: быстрые выходы без ошибок выбираются чаще"""
+        latency = self.latency if self.latency is not None else default_latency
+        return (1.0 - self.error_rate) ** 2 / max(latency, 0.05) + 1e-6
+
+
+def parse_proxy_url(url):
+    """
+    Проверяет URL прокси
+    
+    Args:
+        url: scheme://[user:password@]host:port или DIRECT
+    
+    Returns:
+        str: URL без пробелов
+    
+    Raises:
+        ProxyConfigError: Неизвестная схема, нет хоста или порта
+    """
+    url = url.strip()
+    if url == DIRECT:
+        return url
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError as e:
+        raise ProxyConfigError(f"некорректный адрес прокси {url!r}: {e}") from None
+    if parts.scheme not in PROXY_SCHEMES:
+        raise ProxyConfigError(f"прокси {url!r}: схема должна быть одной из {', '.join(PROXY_SCHEMES)}")
+    if not parts.hostname or port is None:
+        raise ProxyConfigError(f"прокси {url!r}: нужны хост и порт")
+    return url
+
+
+def count_hosts(urls):
+    """Число разных исходящих IP (хостов) в списке выходов"""
+    return len({Egress(parse_proxy_url(url)).host for url in urls})
+
+
+def load_proxies(spec):
+    """
+    Читает список выходов из строки или файла
+    
+    Args:
+        spec: URL через запятую или путь к файлу (по одному URL в строке, # - комментарий)
+    
+    Returns:
+        list: Проверенные URL без повторов
+    
+    Raises:
+        ProxyConfigError: Ошибка в одном из адресов
+    """
+    try:
+        with open(spec, encoding="utf-8") as f:
+            items = [line.split("#", 1)[0] for line in f]
+    except OSError:
+        items = spec.split(",")
+    urls = [parse_proxy_url(item) for item in items if item.strip()]
+    
+    if any(urlsplit(url).scheme.startswith("socks") for url in urls if url != DIRECT):
+        try:
+            import socks
+        except ImportError as e:
+            raise ProxyConfigError("Для SOCKS-прокси нужен пакет PySocks (pip install requests[socks])") from e
+    return list(dict.fromkeys(urls))
+
+
+class ProxyPool:
+    """Выходы с оценкой здоровья, карантином и взвешенным выбором"""
+    
+    def __init__(self, urls, quarantine=PROXY_QUARANTINE, quarantine_max=PROXY_QUARANTINE_MAX,
+                 max_failures=PROXY_MAX_FAILURES, alpha=PROXY_EWMA_ALPHA, log=print):
+        """
+        Args:
+            urls: URL прокси (DIRECT - собственный адрес хоста)
+            quarantine: Срок первого карантина в секундах
+            quarantine_max: Максимальный срок карантина
+            max_failures: Ошибок соединения подряд до карантина
+            alpha: Вес нового наблюдения в скользящих средних
+            log: Функция вывода сообщений
+        """
+        if not urls:
+            raise ProxyConfigError("пул прокси пуст")
+        self.egresses = [Egress(parse_proxy_url(url)) for url in dict.fromkeys(urls)]
+        self.quarantine = quarantine
+        self.quarantine_max = quarantine_max
+        self.max_failures = max_failures
+        self.alpha = alpha
+        self.log = log
+        # Момент, с которого разрешен следующий запрос, по хостам: выходы одного
+        # сервера делят интервал
+        self.next_allowed = {egress.host: 0.0 for egress in self.egresses}
+        # Выход текущего запроса (назначается ProxyRateLimiter.wait)
+        self.current = self.egresses[0]
+    
+    def __len__(self):
+        return len(self.egresses)
+    
+    def ready_at(self, egress):
+        """Момент, с которого хост выхода может отправить следующий запрос"""
+        return self.next_allowed[egress.host]
+    
+    def mark(self, egress, delay):
+        """Следующий запрос через хост выхода - не раньше чем через delay секунд"""
+        self.next_allowed[egress.host] = time.monotonic() + delay
+    
+    def healthy(self, now=None):
+        """Выходы не на карантине"""
+        now = time.monotonic() if now is None else now
+        return [egress for egress in self.egresses if not egress.quarantined(now)]
+    
+    def _default_latency(self):
+        """Задержка для выходов без наблюдений: средняя по остальным"""
+        known = [egress.latency for egress in self.egresses if egress.latency is not None]
+        return sum(known) / len(known) if known else PROXY_INITIAL_LATENCY
+    
+    def choose(self, now=None):
+        """
+        Выбирает выход для следующего запроса
+        
+        Среди здоровых выходов с истекшим интервалом - случайно по весу; если все
+        ждут интервала - тот, что освободится первым; если все на карантине - тот,
+        чей карантин кончится раньше (ожидание выдерживает ProxyRateLimiter).
+        
+        Returns:
+            Egress: Выбранный выход
+        """
+        now = time.monotonic() if now is None else now
+        healthy = self.healthy(now)
+        if not healthy:
+            return min(self.egresses, key=lambda egress: egress.quarantined_until)
+        
+        ready = [egress for egress in healthy if self.ready_at(egress) <= now]
+        if not ready:
+            return min(healthy, key=self.ready_at)
+        default_latency = self._default_latency()
+        weights = [egress.weight(default_latency) for egress in ready]
+        return random.choices(ready, weights=weights)[0]
+    
+    def _observe(self, egress, failed, latency=None):
+        egress.requests += 1
+        egress.error_rate += self.alpha * (float(failed) - egress.error_rate)
+        if latency is not None:
+            if egress.latency is None:
+                egress.latency = latency
+            else:
+                egress.latency += self.alpha * (latency - egress.latency)
+    
+    def _quarantine(self, egress, reason):
+        """Отправляет выход на карантин; каждый следующий карантин вдвое длиннее"""
+        egress.strikes += 1
+        duration = min(self.quarantine * 2 ** (egress.strikes - 1), self.quarantine_max)
+        egress.quarantined_until = time.monotonic() + duration
+        egress.consecutive = 0
+        self.log(f"    Выход {egress.name} на карантине {duration:.0f} сек: {reason}")
+    
+    def report_success(self, egress, latency):
+        """
+        Учитывает успешный ответ
+        
+        Args:
+            egress: Выход
+            latency: Длительность запроса в секундах
+        """
+        self._observe(egress, False, latency)
+        egress.consecutive = 0
+        # Выход, переживший карантин, постепенно возвращает доверие
+        egress.strikes = max(egress.strikes - 1, 0)
+    
+    def report_failure(self, egress, status_code=None, latency=None):
+        """
+        Учитывает ошибку запроса
+        
+        Args:
+            egress: Выход
+            status_code: HTTP-код ответа (None - ошибка соединения или таймаут)
+            latency: Длительность запроса, если ответ был получен
+        """
+        self._observe(egress, True, latency)
+        egress.errors += 1
+        egress.consecutive += 1
+        if status_code in BLOCKED_STATUSES:
+            egress.blocks += 1
+            self._quarantine(egress, f"Google вернул код {status_code}")
+        elif egress.consecutive >= self.max_failures:
+            self._quarantine(egress, f"{egress.consecutive} ошибок подряд")
+    
+    def summary(self):
+        """
+        Состояние выходов для отчета
+        
+        Returns:
+            list: [{"name", "requests", "errors", "blocks", "latency", "error_rate", "quarantine"}]
+        """
+        now = time.monotonic()
+        return [
+            {
+                "name": egress.name,
+                "requests": egress.requests,
+                "errors": egress.errors,
+                "blocks": egress.blocks,
+                "latency": egress.latency,
+                "error_rate": egress.error_rate,
+                "quarantine": max(egress.quarantined_until - now, 0.0),
+            }
+            for egress in self.egresses
+        ]
+
+
+class ProxyRateLimiter(RateLimiter):
+    """
+    Ограничитель частоты с отдельным интервалом для каждого хоста пула
+    
+    Перед запросом выбирает выход (pool.current), резервирует запрос в журнале
+    квоты под идентификатором его хоста и ждет конца его карантина и интервала
+    хоста. defer задает общую паузу для всех выходов (пауза между странами).
+    """
+    
+    def __init__(self, pool, delay_min, delay_max, ledger=None):
+        """
+        Args:
+            pool: ProxyPool
+            delay_min: Минимальный интервал между запросами одного выхода
+            delay_max: Максимальный интервал между запросами одного выхода
+            ledger: Общий журнал квоты (QuotaLedger) или None
+        """
+        super().__init__(delay_min, delay_max, ledger=ledger)
+        self.pool = pool
+    
+    def _ready_at(self, egress):
+        return max(self._next_allowed, self.pool.ready_at(egress), egress.quarantined_until)
+    
+    def time_until_next(self):
+        """Сколько секунд осталось до момента, когда освободится хотя бы один выход"""
+        now = time.monotonic()
+        return max(min(self._ready_at(egress) for egress in self.pool.egresses) - now, 0.0)
+    
+    def wait(self, prefetch=None):
+        """
+        Выбирает выход, резервирует квоту под его адрес и ждет его интервала
+        
+        prefetch сам отправляет запрос через выбранный выход, поэтому выполняется
+        только после карантина и интервала хоста; с паузой перекрывается лишь
+        общая для всех выходов часть ожидания (defer).
+        """
+        egress = self.pool.current = self.pool.choose()
+        self.quota_wait = self.ledger.acquire(egress.identity) if self.ledger is not None else 0.0
+        waited = 0.0
+        if prefetch is not None:
+            waited = max(max(self.pool.ready_at(egress), egress.quarantined_until) - time.monotonic(), 0.0)
+            if waited > 0:
+                time.sleep(waited)
+            prefetch()
+        
+        remaining = max(self._ready_at(egress) - time.monotonic(), 0.0)
+        if remaining > 0:
+            time.sleep(remaining)
+        return waited + remaining + self.quota_wait
+    
+    def mark(self):
+        """Отмечает отправку запроса через текущий выход"""
+        self.pool.mark(self.pool.current, self.next_delay())
+
+
+def probe(pool, url=None, timeout=REQUEST_TIMEOUT, log=print):
+    """
+    Отправляет по одному запросу через каждый выход и учитывает результат в пуле
+    
+    Args:
+        pool: ProxyPool
+        url: Адрес проверки (по умолчанию - страница Trends)
+        timeout: Таймаут запроса
+        log: Функция вывода сообщений
+    
+    Returns:
+        dict: {имя выхода: HTTP-код или None при ошибке соединения}
+    """
+    import requests
+    
+    if url is None:
+        from trends_backends import BASE_TRENDS_URL
+        url = f"{BASE_TRENDS_URL}/explore/"
+    results = {}
+    for egress in pool.egresses:
+        start = time.perf_counter()
+        try:
+            response = requests.get(url, proxies=egress.proxies, timeout=timeout)
+        except requests.RequestException as e:
+            pool.report_failure(egress)
+            results[egress.name] = None
+            log(f"❌ {egress.name}: {e}")
+            continue
+        latency = time.perf_counter() - start
+        results[egress.name] = response.status_code
+        if response.status_code == 200:
+            pool.report_success(egress, latency)
+            log(f"✓ {egress.name}: {latency * 1000:.0f} мс")
+        else:
+            pool.report_failure(egress, response.status_code, latency)
+            log(f"❌ {egress.name}: код {response.status_code}")
+    return results
+
+
+if __name__ == "__main__":
+    # Проверка выходов: по одному запросу через каждый
+    import argparse
+    
+    from config import PROXIES
+    
+    arg_parser = argparse.ArgumentParser(description="Проверка выходов пула прокси")
+    arg_parser.add_argument("proxies", nargs="?", default=None, metavar="URLS|PATH",
+                            help="URL прокси через запятую или файл со списком (по умолчанию config.PROXIES)")
+    arg_parser.add_argument("--url", default=None,
+                            help="адрес проверки (по умолчанию - страница Google Trends)")
+    args = arg_parser.parse_args()
+    pool = ProxyPool(load_proxies(args.proxies) if args.proxies else PROXIES)
+    probe(pool, args.url)
@@ -1,72 +1,231 @@
 """
 Генератор вариаций поисковых запросов для каждой страны
+
+Запросы строятся по декларативным шаблонам из config.QUERY_TEMPLATES. Шаблоны
+компилируются один раз и кэшируются по хэшу конфигурации; вариации страны
+генерируются лениво при первом обращении.
 """
+import hashlib
+import json
+import re
+from collections.abc import Mapping
+
+from inflection import INFLECTIONS
+
+# {поле} или {поле:преобразование}
+_PLACEHOLDER = re.compile(r"\{(\w+)(?::(\w+))?\}")
+
+# Скомпилированные наборы шаблонов по хэшу конфигурации
+_ENGINES = {}
+
+
+def config_hash(config):
+    """Стабильный хэш JSON-совместимой конфигурации"""
+    payload = json.dumps(config, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
 
 
-def generate_query_variations(country_name, country_data):
+def _compile_template(template):
+    """
+    Компилирует строку шаблона в список частей
+    
+    Returns:
+        tuple: (parts, fields) - части (литерал или (поле, преобразование))
+               и множество используемых полей
+    """
+    parts = []
+    fields = set()
+    position = 0
+    for match in _PLACEHOLDER.finditer(template):
+        if match.start() > position:
+            parts.append(template[position:match.start()])
+        field, transform = match.group(1), match.group(2)
+        if transform is not None and transform not in INFLECTIONS:
+            raise ValueError(f"Неизвестное преобразование '{transform}' в шаблоне '{template}'")
+        parts.append((field, transform))
+        fields.add(field)
+        position = match.end()
+    if position < len(template):
+        parts.append(template[position:])
+    return tuple(parts), frozenset(fields)
+
+
+def _country_fields(country_name, country_data):
+    """Поля шаблонов страны (без повторяющихся групп)"""
+    fields = {
+        "name": country_name,
+        "short": country_data.get("name_ru_short"),
+        "adj": country_data.get("adjective_ru"),
+        "adj_alt": country_data.get("adjective_ru_alt"),
+        "en": country_data.get("name_en"),
+        "adj_en": country_data.get("adjective_en"),
+    }
+    return {key: value for key, value in fields.items() if value}
+
+
+def _country_groups(country_data):
+    """Повторяющиеся группы полей: альтернативные названия и города"""
+    aliases = country_data.get("name_ru_alt") or []
+    if isinstance(aliases, str):
+        aliases = [aliases]
+    
+    cities = []
+    for city in country_data.get("cities", []):
+        if isinstance(city, str):
+            city = {"ru": city}
+        cities.append({key: value for key, value in (("city", city.get("ru")), ("city_en", city.get("en")))
+                       if value})
+    
+    return {
+        "aliases": [{"alias": alias} for alias in aliases],
+        "cities": cities,
+    }
+
+
+class QueryTemplateEngine:
+    """Скомпилированный набор шаблонов запросов"""
+    
+    def __init__(self, templates):
+        """
+        Args:
+            templates: Словарь {locale: [шаблон или {"each": группа, "templates": [...]}]}
+        """
+        self.templates = templates
+        self.hash = config_hash(templates)
+        self._program = []
+        for locale_templates in templates.values():
+            for template in locale_templates:
+                if isinstance(template, dict):
+                    compiled = tuple(_compile_template(t) for t in template["templates"])
+                    self._program.append((template["each"], compiled))
+                else:
+                    self._program.append((None, (_compile_template(template),)))
+        self._variations = {}
+        # Последний результат по стране: повторный доступ без хэширования данных
+        self._last = {}
+    
+    @staticmethod
+    def _render(parts, fields, overrides):
+        """Подставляет поля в скомпилированный шаблон"""
+        chunks = []
+        for part in parts:
+            if isinstance(part, str):
+                chunks.append(part)
+                continue
+            field, transform = part
+            value = fields[field]
+            if transform is not None:
+                value = overrides.get((field, transform)) or INFLECTIONS[transform](value)
+            chunks.append(value)
+        return "".join(chunks)
+    
+    def iter_variations(self, country_name, country_data):
+        """
+        Лениво генерирует вариации запросов страны в порядке шаблонов без повторов
+        
+        Args:
+            country_name: Название страны на русском
+            country_data: Словарь с данными страны
+        
+        Yields:
+            str: Запрос
+        """
+        fields = _country_fields(country_name, country_data)
+        # Явно заданные формы важнее правил склонения
+        overrides = {("name", "gen"): country_data.get("name_ru_gen")}
+        groups = _country_groups(country_data)
+        seen = set()
+        
+        for group, compiled in self._program:
+            items = groups.get(group, ()) if group else (None,)
+            for item in items:
+                item_fields = {**fields, **item} if item else fields
+                for parts, used in compiled:
+                    if not used <= item_fields.keys():
+                        continue
+                    query = self._render(parts, item_fields, overrides)
+                    if query not in seen:
+                        seen.add(query)
+                        yield query
+    
+    def variations(self, country_name, country_data):
+        """Список вариаций страны (кэшируется по хэшу данных страны)"""
+        last = self._last.get(country_name)
+        if last is not None and last[0] is country_data:
+            return last[1]
+        
+        key = (country_name, config_hash(country_data))
+        cached = self._variations.get(key)
+        if cached is None:
+            cached = self._variations[key] = list(self.iter_variations(country_name, country_data))
+        self._last[country_name] = (country_data, cached)
+        return cached
+
+
+def get_engine(templates=None):
+    """
+    Возвращает скомпилированный набор шаблонов (кэш по хэшу конфигурации)
+    
+    Args:
+        templates: Шаблоны запросов (по умолчанию - config.QUERY_TEMPLATES)
+    
+    Returns:
+        QueryTemplateEngine: Набор шаблонов
+    """
+    if templates is None:
+        from config import QUERY_TEMPLATES
+        templates = QUERY_TEMPLATES
+    key = config_hash(templates)
+    engine = _ENGINES.get(key)
+    if engine is None:
+        engine = _ENGINES[key] = QueryTemplateEngine(templates)
+    return engine
+
+
+def generate_query_variations(country_name, country_data, templates=None):
     """
     Генерирует все возможные вариации запросов для страны
     
     Args:
         country_name: Название страны на русском
         country_data: Словарь с данными страны
-        
+        templates: Шаблоны запросов (по умолчанию - config.QUERY_TEMPLATES)
+    
     Returns:
         list: Список всех вариаций запросов
     """
-    name_en = country_data["name_en"]
-    adjective_ru = country_data["adjective_ru"]
-    adjective_en = country_data["adjective_en"]
-    
-    variations = []
-    
-    # Русские запросы с основным названием страны
-    variations.append(f"впн {country_name}")
-    variations.append(f"{country_name} впн")
-    variations.append(f"{adjective_ru} впн")
-    variations.append(f"впн для {country_name}")
-    
-    # Альтернативное название страны (если есть)
-    if "name_ru_alt" in country_data:
-        alt_name = country_data["name_ru_alt"]
-        variations.append(f"впн {alt_name}")
-        variations.append(f"{alt_name} впн")
-        variations.append(f"впн для {alt_name}")
+    return get_engine(templates).variations(country_name, country_data)
+
+
+class QueryVariations(Mapping):
+    """Словарь {country_name: [queries]}, вариации страны генерируются при первом обращении"""
     
-    # Краткая форма (если есть)
-    if "name_ru_short" in country_data:
-        variations.append(f"{country_data['name_ru_short']} впн")
+    def __init__(self, countries_config, engine):
+        self._countries = countries_config
+        self._engine = engine
     
-    # Альтернативные формы прилагательных (если есть)
-    if "adjective_ru_alt" in country_data:
-        variations.append(f"{country_data['adjective_ru_alt']} впн")
+    def __getitem__(self, country_name):
+        return self._engine.variations(country_name, self._countries[country_name])
     
-    # Английские запросы
-    variations.append(f"vpn {name_en}")
-    variations.append(f"{name_en} vpn")
-    variations.append(f"{adjective_en} vpn")
-    variations.append(f"vpn for {name_en}")
+    def __iter__(self):
+        return iter(self._countries)
     
-    return variations
+    def __len__(self):
+        return len(self._countries)
 
 
-def generate_all_queries(countries_config):
+def generate_all_queries(countries_config, templates=None):
     """
     Генерирует все запросы для всех стран
     
     Args:
         countries_config: Словарь с конфигурацией стран
-        
+        templates: Шаблоны запросов (по умолчанию - config.QUERY_TEMPLATES)
+    
     Returns:
-        dict: {country_name: [query1, query2, ...]}
+        QueryVariations: Ленивый словарь {country_name: [query1, query2, ...]}
     """
-    all_queries = {}
-    
-    for country_name, country_data in countries_config.items():
-        variations = generate_query_variations(country_name, country_data)
-        all_queries[country_name] = variations
-        
-    return all_queries
+    return QueryVariations(countries_config, get_engine(templates))
 
 
 if __name__ == "__main__":
@@ -88,4 +247,4 @@ if __name__ == "__main__":
         print(f"  - {query}")
     
     print(f"\nВсего стран: {len(all_queries)}")
-    print(f"Всего вариаций запросов: {sum(len(v) for v in all_queries.values())}")
\ No newline at end of file
+    print(f"Всего вариаций запросов: {sum(len(v) for v in all_queries.values())}")
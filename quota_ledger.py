@@ -0,0 +1,149 @@
+"""
+Общий журнал квоты запросов к Google Trends для всех процессов хоста
+
+Каждый запрос регистрируется в SQLite (режим WAL) с идентификатором исходящего
+адреса. Запрос - логический запрос парсера (слот ограничителя частоты), который
+включает до двух HTTP-обращений: токены explore и данные виджета. Перед отправкой
+процесс резервирует место во всех скользящих окнах (например, 20 запросов в минуту
+и 1200 в час) в одной транзакции BEGIN IMMEDIATE, поэтому cron-задачи и ручные
+запуски на одном сервере делят один бюджет, а не складываются в поток 429.
+"""
+import os
+import socket
+import sqlite3
+import time
+
+from config import QUOTA_DB_PATH, QUOTA_WINDOWS
+
+# Как часто удалять записи старше самого длинного окна
+PRUNE_INTERVAL = 300
+
+
+def detect_egress_identity():
+    """
+    Определяет исходящий адрес хоста без отправки пакетов
+    
+    UDP-сокет "подключается" к внешнему адресу, и ОС выбирает интерфейс
+    маршрута по умолчанию; если сети нет, используется имя хоста.
+    
+    Returns:
+        str: IP-адрес или имя хоста
+    """
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(("8.8.8.8", 80))
+            return sock.getsockname()[0]
+    except OSError:
+        return socket.gethostname()
+
+
+class QuotaLedger:
+    """Журнал запросов со скользящими окнами, общий для процессов через SQLite WAL"""
+    
+    def __init__(self, path=QUOTA_DB_PATH, identity=None, windows=QUOTA_WINDOWS):
+        """
+        Args:
+            path: Путь к файлу базы
+            identity: Идентификатор исходящего адреса (по умолчанию - определяется автоматически)
+            windows: Список (длина окна в секундах, максимум запросов в окне)
+        """
+        self.path = path
+        self.identity = identity or detect_egress_identity()
+        self.windows = sorted(windows)
+        self._last_prune = 0.0
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Транзакции управляются вручную (BEGIN IMMEDIATE). Соединение может
+        # использоваться из разных потоков, но не одновременно (AsyncRateLimiter)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS requests (identity TEXT NOT NULL, ts REAL NOT NULL, pid INTEGER)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS requests_identity_ts ON requests (identity, ts)")
+    
+    def _wait_for(self, identity, now):
+        """Сколько ждать до свободного места во всех окнах (внутри транзакции)"""
+        wait = 0.0
+        for window, limit in self.windows:
+            # Момент, когда из окна выйдет запрос, освобождающий место
+            row = self._conn.execute(
+                "SELECT ts FROM requests WHERE identity = ? AND ts > ? ORDER BY ts DESC LIMIT 1 OFFSET ?",
+                (identity, now - window, limit - 1),
+            ).fetchone()
+            if row is not None:
+                wait = max(wait, row[0] + window - now)
+        return wait
+    
+    def try_reserve(self, identity=None):
+        """
+        Резервирует запрос, если во всех окнах есть место
+        
+        Args:
+            identity: Идентификатор исходящего адреса (по умолчанию - адрес журнала)
+        
+        Returns:
+            float: 0, если запрос зарезервирован, иначе сколько секунд подождать
+        """
+        identity = identity or self.identity
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            wait = self._wait_for(identity, now)
+            if wait <= 0:
+                self._conn.execute("INSERT INTO requests (identity, ts, pid) VALUES (?, ?, ?)",
+                                   (identity, now, os.getpid()))
+            if now - self._last_prune > PRUNE_INTERVAL:
+                self._conn.execute("DELETE FROM requests WHERE ts < ?", (now - self.windows[-1][0],))
+                self._last_prune = now
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return max(wait, 0.0)
+    
+    def acquire(self, identity=None, sleep=time.sleep):
+        """
+        Ждет свободного места в квоте и резервирует запрос
+        
+        Returns:
+            float: Сколько секунд пришлось ждать
+        """
+        waited = 0.0
+        while True:
+            wait = self.try_reserve(identity)
+            if wait <= 0:
+                return waited
+            sleep(wait)
+            waited += wait
+    
+    def usage(self, identity=None):
+        """
+        Возвращает загрузку окон
+        
+        Returns:
+            list: [(окно в секундах, запросов в окне, лимит)]
+        """
+        identity = identity or self.identity
+        now = time.time()
+        return [
+            (window, self._conn.execute(
+                "SELECT COUNT(*) FROM requests WHERE identity = ? AND ts > ?", (identity, now - window)
+            ).fetchone()[0], limit)
+            for window, limit in self.windows
+        ]
+    
+    def close(self):
+        """Закрывает соединение с базой"""
+        self._conn.close()
+
+
+if __name__ == "__main__":
+    # Текущая загрузка квоты этого хоста
+    ledger = QuotaLedger()
+    print(f"Журнал квоты: {ledger.path}, исходящий адрес: {ledger.identity}")
+    for window, count, limit in ledger.usage():
+        print(f"  окно {window:>6} сек: {count:>5} из {limit}")
@@ -0,0 +1,101 @@
+"""
+Инкрементальный индекс рейтинга стран
+"""
+from bisect import bisect_left, insort
+
+
+class RankingIndex:
+    """
+    Отсортированный по убыванию индекс {ключ: оценка}
+    
+    Обновление одной записи - бинарный поиск O(log n) (плюс сдвиг массива,
+    выполняемый memmove), поиск по ключу - O(1), топ-K - срез O(K).
+    """
+    
+    def __init__(self):
+        self._scores = {}
+        self._items = {}
+        # Пары (-оценка, ключ): по возрастанию = по убыванию оценки
+        self._order = []
+    
+    def __len__(self):
+        return len(self._scores)
+    
+    def __contains__(self, key):
+        return key in self._scores
+    
+    def update(self, key, score, item):
+        """
+        Добавляет или обновляет запись
+        
+        Args:
+            key: Ключ записи (название страны)
+            score: Оценка для сортировки
+            item: Данные, возвращаемые в рейтинге
+        """
+        if key in self._scores:
+            self._remove_order(key)
+        self._scores[key] = score
+        self._items[key] = item
+        insort(self._order, (-score, key))
+    
+    def remove(self, key):
+        """Удаляет запись, если она есть"""
+        if key in self._scores:
+            self._remove_order(key)
+            del self._scores[key]
+            del self._items[key]
+    
+    def _remove_order(self, key):
+        """Удаляет ключ из отсортированного массива"""
+        pos = bisect_left(self._order, (-self._scores[key], key))
+        del self._order[pos]
+    
+    def get(self, key, default=None):
+        """Возвращает данные записи по ключу"""
+        return self._items.get(key, default)
+    
+    def score(self, key, default=None):
+        """Возвращает оценку записи по ключу"""
+        return self._scores.get(key, default)
+    
+    def top(self, limit=None, min_score=None):
+        """
+        Возвращает записи с наибольшими оценками
+        
+        Args:
+            limit: Количество записей (None - все)
+            min_score: Возвращать только записи с оценкой строго больше
+        
+        Returns:
+            list: Данные записей по убыванию оценки
+        """
+        result = []
+        for neg_score, key in self._order[:limit]:
+            if min_score is not None and -neg_score <= min_score:
+                break
+            result.append(self._items[key])
+        return result
+    
+    def bottom(self, limit=None, max_score=None):
+        """
+        Возвращает записи с наименьшими оценками
+        
+        Args:
+            limit: Количество записей (None - все)
+            max_score: Возвращать только записи с оценкой строго меньше
+        
+        Returns:
+            list: Данные записей по возрастанию оценки
+        """
+        tail = self._order if limit is None else self._order[-limit:] if limit > 0 else []
+        result = []
+        for neg_score, key in reversed(tail):
+            if max_score is not None and -neg_score >= max_score:
+                break
+            result.append(self._items[key])
+        return result
+    
+    def items(self):
+        """Возвращает все записи по убыванию оценки"""
+        return [self._items[key] for _, key in self._order]
@@ -0,0 +1,71 @@
+"""
+Ограничитель частоты запросов к Google Trends
+"""
+import random
+import time
+
+
+class RateLimiter:
+    """
+    Выдерживает случайный интервал между запросами
+    
+    Один экземпляр используется всеми запросами процесса (все геолокации и
+    периоды), поэтому интервал соблюдается для всего потока запросов. С журналом
+    квоты (QuotaLedger) каждый запрос дополнительно резервируется в общем для
+    всех процессов хоста бюджете.
+    
+    Интервал отсчитывается от отправки запроса (mark вызывается перед ним), поэтому
+    ожидание ответа, разбор и обработка результата идут внутри паузы, а не после нее.
+    """
+    
+    def __init__(self, delay_min, delay_max, ledger=None):
+        """
+        Инициализация ограничителя
+        
+        Args:
+            delay_min: Минимальный интервал между запросами в секундах
+            delay_max: Максимальный интервал между запросами в секундах
+            ledger: Общий журнал квоты (QuotaLedger) или None
+        """
+        self.delay_min = delay_min
+        self.delay_max = delay_max
+        self.ledger = ledger
+        self.quota_wait = 0.0
+        self._next_allowed = 0.0
+    
+    def next_delay(self):
+        """Возвращает случайный интервал между delay_min и delay_max"""
+        return random.uniform(self.delay_min, self.delay_max)
+    
+    def time_until_next(self):
+        """Сколько секунд осталось до разрешенного момента следующего запроса"""
+        return max(self._next_allowed - time.monotonic(), 0.0)
+    
+    def wait(self, prefetch=None):
+        """
+        Резервирует запрос в журнале квоты и ждет разрешенного момента для него
+        
+        Args:
+            prefetch: Работа, которую нужно сделать до запроса (например, получить
+                      токены explore); выполняется в начале паузы после резервирования
+                      квоты, ее время вычитается из паузы
+        
+        Returns:
+            float: Сколько секунд пришлось ждать (quota_wait - из них из-за общей квоты)
+        """
+        self.quota_wait = self.ledger.acquire() if self.ledger is not None else 0.0
+        if prefetch is not None:
+            prefetch()
+        
+        remaining = self.time_until_next()
+        if remaining > 0:
+            time.sleep(remaining)
+        return remaining + self.quota_wait
+    
+    def mark(self):
+        """Отмечает отправку запроса и назначает момент следующего"""
+        self._next_allowed = time.monotonic() + self.next_delay()
+    
+    def defer(self, delay):
+        """Следующий запрос - не раньше чем через delay секунд от текущего момента"""
+        self._next_allowed = max(self._next_allowed, time.monotonic() + delay)
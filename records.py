@@ -0,0 +1,201 @@
+"""
+Компактные записи результатов парсинга
+
+Результат страны хранится как набор объектов со __slots__ вместо вложенных
+словарей: интерес к вариациям запросов - array('d') рядом с кортежем запросов,
+связанные запросы - кортежи RelatedQuery, ряды - InterestSeries. Словари из
+парсера и кэша преобразуются в записи один раз при загрузке (CountryResult.from_dict).
+"""
+from array import array
+
+from trends_backends import InterestSeries
+
+
+class RelatedQuery:
+    """Связанный запрос и его значение (top - 0-100, rising - прирост в %)"""
+    
+    __slots__ = ("query", "value")
+    
+    def __init__(self, query, value):
+        self.query = query
+        self.value = value
+    
+    def to_dict(self):
+        """Словарь {query, value} (формат кэша)"""
+        return {"query": self.query, "value": self.value}
+
+
+class RegionResult:
+    """Региональный интерес к одному запросу"""
+    
+    __slots__ = ("resolution", "query", "codes", "names", "values")
+    
+    def __init__(self, resolution, query, codes, names, values):
+        """
+        Args:
+            resolution: Уровень детализации (REGION или CITY)
+            query: Запрос, для которого получена карта
+            codes: Кортеж кодов регионов
+            names: Кортеж названий регионов
+            values: array('d') интереса в порядке регионов
+        """
+        self.resolution = resolution
+        self.query = query
+        self.codes = codes
+        self.names = names
+        self.values = values
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Создает запись из словаря get_regional_interest"""
+        return cls(data["resolution"], data["query"], tuple(data["codes"]),
+                   tuple(data["names"]), array("d", data["values"]))
+    
+    def to_dict(self):
+        """Словарь в формате get_regional_interest"""
+        return {
+            "resolution": self.resolution,
+            "query": self.query,
+            "codes": list(self.codes),
+            "names": list(self.names),
+            "values": self.values.tolist(),
+        }
+
+
+class PeriodResult:
+    """Результат страны за один период"""
+    
+    __slots__ = ("queries", "interests", "top_query", "max_interest",
+                 "related_top", "related_rising", "regions", "series")
+    
+    def __init__(self, queries, interests, related_top=(), related_rising=(), regions=None, series=None):
+        """
+        Args:
+            queries: Кортеж запросов пакета
+            interests: array('d') среднего интереса в порядке queries
+            related_top: Кортеж RelatedQuery (top)
+            related_rising: Кортеж RelatedQuery (rising)
+            regions: RegionResult или None
+            series: InterestSeries или None
+        """
+        self.queries = queries
+        self.interests = interests
+        self.related_top = related_top
+        self.related_rising = related_rising
+        self.regions = regions
+        self.series = series
+        
+        # Топ-запрос считается один раз при создании
+        top = max(range(len(interests)), key=interests.__getitem__, default=None)
+        self.top_query = queries[top] if top is not None else None
+        self.max_interest = interests[top] if top is not None else 0
+    
+    @classmethod
+    def from_parts(cls, averages, related=None, regions=None, series=None):
+        """
+        Создает запись из ответов парсера (в формате кэша)
+        
+        Args:
+            averages: Словарь {query: average_interest}
+            related: Словарь {"top": [{query, value}], "rising": [...]} или None
+            regions: Словарь get_regional_interest или None
+            series: Словарь {"timestamps": [...], "values": {query: [...]}} или None
+        
+        Returns:
+            PeriodResult: Запись периода
+        """
+        related = related or {}
+        return cls(
+            tuple(averages),
+            array("d", (value or 0 for value in averages.values())),
+            tuple(RelatedQuery(q["query"], q["value"]) for q in related.get("top") or ()),
+            tuple(RelatedQuery(q["query"], q["value"]) for q in related.get("rising") or ()),
+            RegionResult.from_dict(regions) if regions else None,
+            InterestSeries(
+                array("q", series["timestamps"]),
+                {query: array("d", values) for query, values in series["values"].items()},
+            ) if series else None,
+        )
+    
+    @property
+    def averages(self):
+        """Словарь {query: average_interest}"""
+        return dict(zip(self.queries, self.interests))
+    
+    def top_series(self):
+        """Ряд топ-запроса {"timestamps", "values"} для trend_engine или None"""
+        if self.series is None:
+            return None
+        values = self.series.values.get(self.top_query)
+        if not values:
+            return None
+        return {"timestamps": self.series.timestamps, "values": values}
+    
+    def to_dict(self):
+        """Словарь в формате parse_country_queries"""
+        data = {
+            "averages": self.averages,
+            "max_interest": self.max_interest,
+            "top_query": self.top_query,
+            "related_queries": {
+                "top": [q.to_dict() for q in self.related_top],
+                "rising": [q.to_dict() for q in self.related_rising],
+            },
+        }
+        if self.regions is not None:
+            data["regions"] = self.regions.to_dict()
+        if self.series is not None:
+            data["series"] = {
+                "timestamps": self.series.timestamps.tolist(),
+                "values": {query: values.tolist() for query, values in self.series.values.items()},
+            }
+        return data
+
+
+class CountryResult:
+    """Результат страны: периоды с ненулевым интересом"""
+    
+    __slots__ = ("country", "geo", "periods")
+    
+    def __init__(self, country, geo=None, periods=None):
+        """
+        Args:
+            country: Название страны
+            geo: Код геолокации
+            periods: Словарь {period_name: PeriodResult}
+        """
+        self.country = country
+        self.geo = geo
+        self.periods = periods if periods is not None else {}
+    
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Создает запись из словаря parse_country_queries (старый формат результатов)
+        
+        Периоды без данных или с нулевым интересом пропускаются.
+        """
+        result = cls(data["country"], data.get("geo"))
+        for period_name, period_data in data["queries"].items():
+            if not period_data or not period_data.get("averages"):
+                continue
+            period = PeriodResult.from_parts(period_data["averages"], period_data.get("related_queries"),
+                                             period_data.get("regions"), period_data.get("series"))
+            if period.max_interest > 0:
+                result.periods[period_name] = period
+        return result
+    
+    def to_dict(self):
+        """Словарь в формате parse_country_queries"""
+        return {
+            "country": self.country,
+            "geo": self.geo,
+            "queries": {name: period.to_dict() for name, period in self.periods.items()},
+        }
+
+
+def as_country_result(data):
+    """Возвращает CountryResult, преобразуя словарь старого формата при необходимости"""
+    if isinstance(data, CountryResult):
+        return data
+    return CountryResult.from_dict(data)
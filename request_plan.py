@@ -0,0 +1,192 @@
+"""
+План запросов к Google Trends и оценка длительности запуска
+"""
+from collections import namedtuple
+
+from config import (
+    GEO, CATEGORY, REQUEST_DELAY_MIN, REQUEST_DELAY_MAX, MAX_RETRIES, RETRY_INITIAL_DELAY,
+    MAX_QUERIES_PER_REQUEST, REQUEST_LATENCY_ESTIMATE, REGION_PERIOD, QUOTA_WINDOWS,
+)
+from trends_cache import TrendsCache
+
+# Один запрос плана: kind - "interest", "related" или "region"; для related/region
+# запрос может быть неизвестен (None), пока не получен ответ interest того же периода
+PlanItem = namedtuple(
+    "PlanItem",
+    ["kind", "country", "period", "timeframe", "queries", "geo", "category", "cached"],
+)
+
+
+def build_plan_skeleton(all_queries, timeframes, geos=(GEO,), categories=(CATEGORY,)):
+    """
+    Строит статическую часть плана: interest-запросы с ключами кэша
+    
+    Зависит только от запросов и параметров запуска, поэтому может кэшироваться
+    вместе с конфигурацией стран (locations.LocationConfig).
+    
+    Args:
+        all_queries: Словарь {country_name: [queries]}
+        timeframes: Словарь с периодами {name: value}
+        geos: Коды геолокаций
+        categories: Категории поиска
+    
+    Returns:
+        list: [(geo, category, country, period, timeframe, batch, interest_key)]
+              в порядке выполнения (геолокации × категории × страны × периоды)
+    """
+    skeleton = []
+    for geo in geos:
+        for category in categories:
+            for country_name, queries in all_queries.items():
+                batch = tuple(queries[:MAX_QUERIES_PER_REQUEST])
+                for period_name, timeframe in timeframes.items():
+                    skeleton.append((geo, category, country_name, period_name, timeframe, batch,
+                                     TrendsCache.make_key("interest", batch, timeframe, geo, category)))
+    return skeleton
+
+
+def build_request_plan(all_queries, timeframes, geos=(GEO,), category=CATEGORY, cache=None,
+                       region_resolution=None, region_period=REGION_PERIOD, categories=None, skeleton=None):
+    """
+    Строит полный план запросов в том порядке, в котором их выполнит парсер
+    
+    Args:
+        all_queries: Словарь {country_name: [queries]}
+        timeframes: Словарь с периодами {name: value}
+        geos: Коды геолокаций (геолокации × категории × страны × периоды)
+        category: Категория поиска (если не задан список categories)
+        cache: Кэш ответов (TrendsCache) для учета уже полученных данных
+        region_resolution: Региональный режим (REGION или CITY), None - выключен
+        region_period: Период, для которого собираются региональные данные
+        categories: Список категорий для сравнения в одном запуске
+        skeleton: Готовая статическая часть плана (build_plan_skeleton) для тех же
+                  запросов и параметров
+    
+    Returns:
+        list: Список PlanItem
+    """
+    if skeleton is None:
+        skeleton = build_plan_skeleton(all_queries, timeframes, geos, categories or (category,))
+    plan = []
+    
+    for geo, category, country_name, period_name, timeframe, batch, interest_key in skeleton:
+        averages = cache.get(interest_key) if cache is not None else None
+        
+        plan.append(PlanItem("interest", country_name, period_name, timeframe, batch,
+                             geo, category, averages is not None))
+        
+        # Связанные запросы и регионы берутся только для топ-запроса с ненулевым интересом
+        top_query = None
+        if averages is not None:
+            top_query, top_value = max(averages.items(), key=lambda x: x[1] or 0)
+            if not top_value:
+                continue
+        
+        related_cached = top_query is not None and cache.has(
+            TrendsCache.make_key("related", top_query, timeframe, geo, category)
+        )
+        plan.append(PlanItem("related", country_name, period_name, timeframe,
+                             (top_query,) if top_query else None, geo, category, related_cached))
+        
+        if region_resolution and period_name == region_period:
+            region_cached = top_query is not None and cache.has(TrendsCache.make_key(
+                f"region:{region_resolution}:{top_query}", batch, timeframe, geo, category
+            ))
+            plan.append(PlanItem("region", country_name, period_name, timeframe,
+                                 (top_query,) if top_query else None, geo, category, region_cached))
+    
+    return plan
+
+
+def estimate_plan(plan, delay_min=REQUEST_DELAY_MIN, delay_max=REQUEST_DELAY_MAX,
+                  latency=REQUEST_LATENCY_ESTIMATE, max_retries=MAX_RETRIES,
+                  initial_delay=RETRY_INITIAL_DELAY, quota_windows=QUOTA_WINDOWS, egresses=1):
+    """
+    Оценивает число запросов и длительность выполнения плана
+    
+    Повторяет логику задержек GoogleTrendsParser: интервал между отправками сетевых
+    запросов (ответ и обработка идут внутри него) и пауза между странами, сделавшими
+    хотя бы один запрос; эта пауза отсчитывается от ответа последнего запроса страны.
+    
+    Args:
+        plan: Список PlanItem
+        delay_min: Минимальная задержка между запросами
+        delay_max: Максимальная задержка между запросами
+        latency: Средняя длительность одного HTTP-запроса
+        max_retries: Максимальное количество попыток для interest-запроса
+        initial_delay: Начальная задержка перед повтором
+        quota_windows: Окна общей квоты хоста [(секунды, лимит)]; время не может
+                       быть меньше, чем нужно для прохождения запросов через квоту
+                       (пусто - без квоты)
+        egresses: Число исходящих IP (разных хостов пула прокси): интервал и квота
+                  выдерживаются для каждого хоста отдельно
+    
+    Returns:
+        dict: Сводка по плану
+    """
+    # С пулом адресов запросы чередуются между выходами, у каждого свой интервал
+    mean_delay = (delay_min + delay_max) / 2 / egresses
+    
+    interest_items = [item for item in plan if item.kind == "interest"]
+    related_items = [item for item in plan if item.kind == "related"]
+    region_items = [item for item in plan if item.kind == "region"]
+    network_items = [item for item in plan if not item.cached]
+    
+    # Задержка между странами выдерживается внутри каждой пары геолокация-категория
+    # (кроме последней страны пары)
+    units = list(dict.fromkeys((item.geo, item.category, item.country) for item in plan))
+    last_units = {(geo, category): (geo, category, country) for geo, category, country in units}
+    network_units = set((item.geo, item.category, item.country) for item in network_items)
+    
+    requests = len(network_items)
+    country_delays = len(network_units - set(last_units.values()))
+    
+    sleep_seconds = max(requests - 1, 0) * mean_delay
+    estimated_seconds = (max(requests - 1, 0) * max(mean_delay, latency)
+                         + (country_delays + min(requests, 1)) * latency)
+    
+    # Нижняя граница по квоте: каждые limit запросов занимают целое окно
+    quota_floor = max(
+        (max(requests - 1, 0) // (limit * egresses) * window for window, limit in quota_windows or ()), default=0
+    )
+    estimated_seconds = max(estimated_seconds, quota_floor)
+    
+    # Худший случай: каждый сетевой interest-запрос исчерпывает все попытки
+    network_interest = sum(1 for item in interest_items if not item.cached)
+    retry_requests = network_interest * (max_retries - 1)
+    backoff_per_item = sum(initial_delay * (2 ** attempt) + 5 for attempt in range(max_retries - 1))
+    worst_seconds = (
+        estimated_seconds
+        + retry_requests * latency
+        + network_interest * backoff_per_item
+    )
+    
+    return {
+        "geos": len(dict.fromkeys(item.geo for item in plan)),
+        "categories": len(dict.fromkeys(item.category for item in plan)),
+        "countries": len(dict.fromkeys(item.country for item in plan)),
+        "periods": len(dict.fromkeys(item.period for item in plan)),
+        "interest_requests": len(interest_items),
+        "related_requests": len(related_items),
+        "region_requests": len(region_items),
+        "total_requests": len(plan),
+        "cache_hits": len(plan) - requests,
+        "network_requests": requests,
+        "retry_requests_max": retry_requests,
+        "sleep_seconds": sleep_seconds,
+        "quota_floor_seconds": quota_floor,
+        "estimated_seconds": estimated_seconds,
+        "worst_case_seconds": worst_seconds,
+    }
+
+
+def format_duration(seconds):
+    """Форматирует длительность в виде 'Ч ч ММ мин СС сек'"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours} ч {minutes:02d} мин"
+    if minutes:
+        return f"{minutes} мин {seconds:02d} сек"
+    return f"{seconds} сек"
@@ -0,0 +1,297 @@
+"""
+Оценка шума выборки Google Trends и повторные запросы там, где он влияет на рейтинг
+
+Google считает интерес по выборке поисковых запросов, поэтому один и тот же
+payload в разных обращениях дает немного разные значения, и страны с близкой
+популярностью меняются местами от запуска к запуску. Для каждого пакета
+(ячейка - ключ кэша interest: пакет, период, геолокация, категория) копятся
+среднее и дисперсия средних по Уэлфорду для каждого запроса. Пока выборок мало,
+дисперсия сжимается к априорной пуассоновской модели var = phi * value (у малых
+объемов относительный шум больше); phi оценивается по всем ячейкам с повторами.
+
+Планировщик берет соседние пары рейтинга, считает вероятность того, что их
+порядок определен шумом, и запрашивает повторно ту страну, дополнительная
+выборка которой сильнее всего сузит неопределенность спорных пар. Страны с
+далеко разнесенными оценками повторно не запрашиваются.
+"""
+import json
+import math
+import os
+import time
+from array import array
+from statistics import NormalDist
+
+from config import (
+    RESAMPLE_STATE_PATH, RESAMPLE_MAX_AGE, RESAMPLE_PRIOR_DISPERSION, RESAMPLE_PRIOR_WEIGHT,
+    RESAMPLE_CONFIDENCE, RESAMPLE_TOP, RESAMPLE_MIN_FLIP, RESAMPLE_MAX_SAMPLES,
+)
+
+STATE_VERSION = 1
+# Сколько степеней свободы повторов нужно, чтобы доверять оценке phi по данным
+MIN_POOLED_DF = 10
+
+
+def flip_probability(first, second):
+    """
+    Вероятность того, что истинный порядок двух оценок обратный наблюдаемому
+    
+    Args:
+        first: Оценка {"score", "se"} выше в рейтинге
+        second: Оценка {"score", "se"} ниже в рейтинге
+    
+    Returns:
+        float: 0-0.5
+    """
+    spread = math.hypot(first["se"], second["se"])
+    if spread == 0:
+        return 0.0
+    gap = abs(first["score"] - second["score"])
+    return 0.5 * math.erfc(gap / spread / math.sqrt(2))
+
+
+class SampleStore:
+    """Повторные выборки средних интереса по ячейкам и оценка их дисперсии"""
+    
+    def __init__(self, path=RESAMPLE_STATE_PATH, max_age=RESAMPLE_MAX_AGE,
+                 prior_dispersion=RESAMPLE_PRIOR_DISPERSION, prior_weight=RESAMPLE_PRIOR_WEIGHT,
+                 confidence=RESAMPLE_CONFIDENCE):
+        """
+        Args:
+            path: Файл состояния (None - без сохранения)
+            max_age: Сколько секунд выборки ячейки считаются выборками одних и тех же
+                     данных (потом окно "today 3-m" сдвигается и ячейка начинается заново)
+            prior_dispersion: Априорное phi в модели var = phi * value
+            prior_weight: Вес априорной дисперсии в наблюдениях
+            confidence: Уровень доверительных интервалов
+        """
+        self.path = path
+        self.max_age = max_age
+        self.prior_dispersion = prior_dispersion
+        self.prior_weight = prior_weight
+        self.confidence = confidence
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        # {cell_key: {"started": ts, "queries": {query: [n, mean, m2]}}}
+        self.cells = {}
+        # Накопленные суммы для phi по сброшенным ячейкам: [sum m2, sum (n - 1) * mean, sum (n - 1)]
+        self.pooled = [0.0, 0.0, 0]
+        self._load()
+    
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get("version") == STATE_VERSION:
+            self.cells = state["cells"]
+            self.pooled = state["pooled"]
+    
+    def save(self):
+        """Сохраняет состояние (атомарная замена файла)"""
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        now = time.time()
+        for cell_key in [key for key, cell in self.cells.items() if now - cell["started"] > self.max_age]:
+            self._retire(cell_key)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": STATE_VERSION, "cells": self.cells, "pooled": self.pooled},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+    
+    def _retire(self, cell_key):
+        """Удаляет устаревшую ячейку, сохраняя ее вклад в оценку phi"""
+        for n, mean, m2 in self.cells.pop(cell_key)["queries"].values():
+            if n > 1 and mean > 0:
+                self.pooled[0] += m2
+                self.pooled[1] += (n - 1) * mean
+                self.pooled[2] += n - 1
+    
+    def observe(self, cell_key, averages):
+        """
+        Добавляет выборку средних одного обращения к Trends
+        
+        Args:
+            cell_key: Ключ ячейки (TrendsCache.make_key("interest", ...))
+            averages: {query: average_interest}
+        """
+        now = time.time()
+        cell = self.cells.get(cell_key)
+        if cell is not None and now - cell["started"] > self.max_age:
+            self._retire(cell_key)
+            cell = None
+        if cell is None:
+            cell = self.cells[cell_key] = {"started": now, "queries": {}}
+        
+        for query, value in averages.items():
+            stats = cell["queries"].setdefault(query, [0, 0.0, 0.0])
+            value = value or 0.0
+            stats[0] += 1
+            delta = value - stats[1]
+            stats[1] += delta / stats[0]
+            stats[2] += delta * (value - stats[1])
+    
+    def samples(self, cell_key):
+        """Количество выборок ячейки (0 - выборок нет или они устарели)"""
+        cell = self.cells.get(cell_key)
+        if cell is None or time.time() - cell["started"] > self.max_age:
+            return 0
+        return max((stats[0] for stats in cell["queries"].values()), default=0)
+    
+    def dispersion(self):
+        """Оценка phi (var = phi * value) по повторам всех ячеек или априорное значение"""
+        m2_sum, weight, df = self.pooled
+        for cell in self.cells.values():
+            for n, mean, m2 in cell["queries"].values():
+                if n > 1 and mean > 0:
+                    m2_sum += m2
+                    weight += (n - 1) * mean
+                    df += n - 1
+        if df < MIN_POOLED_DF:
+            return self.prior_dispersion
+        return m2_sum / weight
+    
+    def estimate(self, cell_key, queries, dispersion=None):
+        """
+        Оценка интереса страны (топ-запрос пакета) с доверительным интервалом
+        
+        Args:
+            cell_key: Ключ ячейки
+            queries: Запросы пакета
+            dispersion: phi (по умолчанию - dispersion())
+        
+        Returns:
+            dict: {"score", "se", "low", "high", "samples", "means": {query: mean}} или None
+        """
+        cell = self.cells.get(cell_key)
+        if cell is None:
+            return None
+        stats = {query: cell["queries"][query] for query in queries if query in cell["queries"]}
+        if not stats:
+            return None
+        phi = self.dispersion() if dispersion is None else dispersion
+        
+        top_query = max(stats, key=lambda query: stats[query][1])
+        n, mean, m2 = stats[top_query]
+        # Дисперсия выборки, сжатая к априорной phi * value
+        prior_var = phi * max(mean, 1.0)
+        variance = (m2 + self.prior_weight * prior_var) / (n - 1 + self.prior_weight)
+        se = math.sqrt(variance / n)
+        return {
+            "score": mean,
+            "se": se,
+            "low": max(mean - self.z * se, 0.0),
+            "high": min(mean + self.z * se, 100.0),
+            "samples": n,
+            "means": {query: query_stats[1] for query, query_stats in stats.items()},
+        }
+
+
+class ResamplingScheduler:
+    """Выбор следующей ячейки для повторного запроса по неопределенности рейтинга"""
+    
+    def __init__(self, store, top=RESAMPLE_TOP, min_flip=RESAMPLE_MIN_FLIP, max_samples=RESAMPLE_MAX_SAMPLES):
+        """
+        Args:
+            store: SampleStore
+            top: Размер рейтинга, порядок внутри которого важен (и граница входа в него)
+            min_flip: Пары с меньшей вероятностью перестановки считаются устойчивыми
+            max_samples: Максимум выборок одной ячейки (равные по спросу страны
+                         иначе забрали бы весь бюджет)
+        """
+        self.store = store
+        self.top = top
+        self.min_flip = min_flip
+        self.max_samples = max_samples
+    
+    def rank(self, cells):
+        """
+        Оценки ячеек по убыванию интереса
+        
+        Args:
+            cells: {name: (cell_key, queries)} - ячейки одного рейтинга
+        
+        Returns:
+            list: [(name, estimate)]
+        """
+        phi = self.store.dispersion()
+        estimates = []
+        for name, (cell_key, queries) in cells.items():
+            estimate = self.store.estimate(cell_key, queries, phi)
+            if estimate is not None:
+                estimates.append((name, estimate))
+        estimates.sort(key=lambda item: -item[1]["score"])
+        return estimates
+    
+    def contested_pairs(self, ranking):
+        """
+        Соседние пары рейтинга, порядок которых может определяться шумом
+        
+        Returns:
+            list: [(верхний, нижний, вероятность перестановки)] для пар в пределах
+                  top (включая пару на границе топа)
+        """
+        pairs = []
+        for idx in range(min(len(ranking) - 1, self.top)):
+            (upper, upper_est), (lower, lower_est) = ranking[idx], ranking[idx + 1]
+            probability = flip_probability(upper_est, lower_est)
+            if probability >= self.min_flip:
+                pairs.append((upper, lower, probability))
+        return pairs
+    
+    def next_pick(self, rankings, exclude=()):
+        """
+        Выбирает ячейку, повторная выборка которой сильнее всего уменьшит неопределенность
+        
+        Польза выборки страны - сумма по ее спорным парам: вероятность перестановки
+        пары, умноженная на долю дисперсии разности, которую снимет еще одна выборка
+        (se^2 / (n + 1) от se^2 + se_соседа^2).
+        
+        Args:
+            rankings: {ranking_id: {name: (cell_key, queries)}}
+            exclude: Пары (ranking_id, name), которые не запрашивать повторно
+        
+        Returns:
+            tuple: (ranking_id, name, польза) или None, если все пары устойчивы
+        """
+        best = None
+        for ranking_id, cells in rankings.items():
+            ranking = self.rank(cells)
+            estimates = dict(ranking)
+            benefit = {}
+            for upper, lower, probability in self.contested_pairs(ranking):
+                pair_var = estimates[upper]["se"] ** 2 + estimates[lower]["se"] ** 2
+                for name in (upper, lower):
+                    estimate = estimates[name]
+                    if estimate["samples"] >= self.max_samples or (ranking_id, name) in exclude:
+                        continue
+                    reduction = estimate["se"] ** 2 / (estimate["samples"] + 1)
+                    benefit[name] = benefit.get(name, 0.0) + probability * reduction / pair_var
+            for name, value in benefit.items():
+                if best is None or value > best[2]:
+                    best = (ranking_id, name, value)
+        return best
+
+
+def resampled_period(period, estimate):
+    """
+    PeriodResult с интересом, усредненным по всем выборкам ячейки
+    
+    Args:
+        period: Исходный PeriodResult
+        estimate: Результат SampleStore.estimate
+    
+    Returns:
+        PeriodResult: Новая запись (связанные запросы, регионы и ряд - исходные)
+    """
+    from records import PeriodResult
+    
+    interests = array("d", (estimate["means"].get(query, value)
+                            for query, value in zip(period.queries, period.interests)))
+    return PeriodResult(period.queries, interests, period.related_top, period.related_rising,
+                        period.regions, period.series)
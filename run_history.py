@@ -0,0 +1,259 @@
+"""
+История запусков: исходные результаты стран и аналитика по геолокациям
+
+Каждый полный запуск сохраняет результаты по каждой паре геолокация-категория в
+.cache/history/<run_id>/<geo>-<category>.raw.json, а рейтинги и тренды
+анализатора - рядом, в .analysis.json. Пара (запуск, геолокация, категория) -
+шард, единица пересчета: backfill раздает шарды пулу процессов, каждый процесс
+пересчитывает аналитику текущим SEOAnalyzer и записывает ее обратно, не трогая
+исходные данные.
+
+В аналитике хранится отпечаток кода анализатора, поэтому после изменения метрики
+backfill пересчитывает только шарды, посчитанные старым кодом.
+"""
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from config import HISTORY_DIR, BACKFILL_WORKERS
+
+RAW_SUFFIX = ".raw.json"
+ANALYSIS_SUFFIX = ".analysis.json"
+# Модули, от которых зависит результат анализа
+ANALYSIS_MODULES = ("analyzer", "trend_engine", "ranking_index", "records")
+
+# Шард истории: один запуск, одна геолокация, одна категория
+Shard = namedtuple("Shard", ["run_id", "geo", "category", "raw_path", "analysis_path"])
+
+
+def analysis_fingerprint():
+    """Хэш кода анализатора: изменение метрик делает сохраненную аналитику устаревшей"""
+    import importlib
+    
+    digest = hashlib.sha1()
+    for name in ANALYSIS_MODULES:
+        with open(importlib.import_module(name).__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    """Записывает JSON атомарной заменой файла"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def summarize_analysis(analyzer, fingerprint):
+    """
+    Сохраняемая часть результата анализатора
+    
+    Args:
+        analyzer: SEOAnalyzer после analyze_all_countries
+        fingerprint: Отпечаток кода анализатора
+    
+    Returns:
+        dict: Рейтинги по периодам, тренды и метаданные
+    """
+    analyzed = analyzer.analyzed
+    return {
+        "fingerprint": fingerprint,
+        "computed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "countries": len(analyzed["countries"]),
+        "ranking": analyzed["ranking"],
+        "trends": analyzed["trends"],
+    }
+
+
+class HistoryStore:
+    """Хранилище истории запусков в виде JSON-файлов по шардам"""
+    
+    def __init__(self, directory=HISTORY_DIR):
+        """
+        Args:
+            directory: Директория истории
+        """
+        self.directory = directory
+    
+    @staticmethod
+    def new_run_id():
+        """
+        Идентификатор запуска по текущему времени (сортируется хронологически)
+        
+        Микросекунды и PID не дают двум запускам, завершившимся в одну секунду,
+        записать шарды в одну директорию.
+        """
+        return f"{datetime.now().strftime('%Y%m%dT%H%M%S.%f')}-{os.getpid()}"
+    
+    def _shard(self, run_id, geo, category):
+        base = os.path.join(self.directory, run_id, f"{geo}-{category}")
+        return Shard(run_id, geo, category, base + RAW_SUFFIX, base + ANALYSIS_SUFFIX)
+    
+    def save(self, run_id, geo, category, analyzer, fingerprint=None):
+        """
+        Сохраняет результаты и аналитику одной пары геолокация-категория
+        
+        Args:
+            run_id: Идентификатор запуска
+            geo: Код геолокации
+            category: Категория поиска
+            analyzer: SEOAnalyzer после analyze_all_countries
+            fingerprint: Отпечаток кода анализатора (по умолчанию - текущий)
+        
+        Returns:
+            Shard: Сохраненный шард
+        """
+        from records import as_country_result
+        
+        shard = self._shard(run_id, geo, category)
+        os.makedirs(os.path.dirname(shard.raw_path), exist_ok=True)
+        _write_json(shard.raw_path, {
+            "run_id": run_id,
+            "geo": geo,
+            "category": category,
+            "countries": {name: as_country_result(data).to_dict() for name, data in analyzer.all_data.items()},
+        })
+        _write_json(shard.analysis_path, summarize_analysis(analyzer, fingerprint or analysis_fingerprint()))
+        return shard
+    
+    def shards(self):
+        """
+        Все шарды истории
+        
+        Returns:
+            list: Список Shard по запускам (от старых к новым)
+        """
+        try:
+            run_ids = sorted(os.listdir(self.directory))
+        except OSError:
+            return []
+        shards = []
+        for run_id in run_ids:
+            run_dir = os.path.join(self.directory, run_id)
+            if not os.path.isdir(run_dir):
+                continue
+            for filename in sorted(os.listdir(run_dir)):
+                if not filename.endswith(RAW_SUFFIX):
+                    continue
+                geo, _, category = filename[:-len(RAW_SUFFIX)].rpartition("-")
+                shards.append(self._shard(run_id, geo, int(category)))
+        return shards
+    
+    @staticmethod
+    def load_analysis(shard):
+        """Аналитика шарда или None, если ее нет"""
+        try:
+            with open(shard.analysis_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def stale_shards(self, fingerprint=None):
+        """Шарды без аналитики или с аналитикой, посчитанной другим кодом анализатора"""
+        fingerprint = fingerprint or analysis_fingerprint()
+        return [
+            shard for shard in self.shards()
+            if (self.load_analysis(shard) or {}).get("fingerprint") != fingerprint
+        ]
+
+
+def recompute_shard(shard, fingerprint):
+    """
+    Пересчитывает аналитику шарда текущим анализатором (выполняется в процессе пула)
+    
+    Args:
+        shard: Shard
+        fingerprint: Отпечаток кода анализатора
+    
+    Returns:
+        dict: {"shard", "countries", "bytes", "seconds"}
+    """
+    from analyzer import SEOAnalyzer
+    
+    start = time.perf_counter()
+    with open(shard.raw_path, encoding="utf-8") as f:
+        raw = json.load(f)
+    analyzer = SEOAnalyzer(raw["countries"])
+    analyzer.analyze_all_countries()
+    _write_json(shard.analysis_path, summarize_analysis(analyzer, fingerprint))
+    return {
+        "shard": shard,
+        "countries": len(raw["countries"]),
+        "bytes": os.path.getsize(shard.raw_path),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def backfill(store, workers=BACKFILL_WORKERS, recompute_all=False, log=print):
+    """
+    Пересчитывает аналитику истории в пуле процессов
+    
+    Шарды раздаются по одному, крупные - первыми, чтобы процессы заканчивали
+    одновременно. Ошибка одного шарда не останавливает остальные.
+    
+    Args:
+        store: HistoryStore
+        workers: Количество процессов (None - по числу ядер)
+        recompute_all: Пересчитать все шарды, а не только устаревшие
+        log: Функция вывода сообщений
+    
+    Returns:
+        dict: Сводка: шарды, страны, ошибки, время и пропускная способность
+    """
+    fingerprint = analysis_fingerprint()
+    all_shards = store.shards()
+    shards = all_shards if recompute_all else store.stale_shards(fingerprint)
+    shards.sort(key=lambda shard: os.path.getsize(shard.raw_path), reverse=True)
+    workers = min(workers or os.cpu_count() or 1, max(len(shards), 1))
+    
+    summary = {
+        "total_shards": len(all_shards),
+        "shards": 0,
+        "countries": 0,
+        "bytes": 0,
+        "failed": [],
+        "workers": workers,
+        "worker_seconds": 0.0,
+        "elapsed": 0.0,
+    }
+    if not shards:
+        return summary
+    
+    log(f"Пересчет {len(shards)} из {len(all_shards)} шардов в {workers} процессах...")
+    start = time.perf_counter()
+    progress_step = max(len(shards) // 10, 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(recompute_shard, shard, fingerprint): shard for shard in shards}
+        for done, future in enumerate(as_completed(futures), 1):
+            shard = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                summary["failed"].append(shard)
+                log(f"    ❌ {shard.run_id} {shard.geo}-{shard.category}: {e}")
+                continue
+            summary["shards"] += 1
+            summary["countries"] += result["countries"]
+            summary["bytes"] += result["bytes"]
+            summary["worker_seconds"] += result["seconds"]
+            if done % progress_step == 0 or done == len(shards):
+                log(f"  [{done}/{len(shards)}] {time.perf_counter() - start:.1f} сек")
+    summary["elapsed"] = time.perf_counter() - start
+    return summary
+
+
+if __name__ == "__main__":
+    # Состав истории и число шардов, которым нужен пересчет
+    store = HistoryStore()
+    shards = store.shards()
+    stale = store.stale_shards()
+    runs = sorted({shard.run_id for shard in shards})
+    print(f"История {store.directory}: {len(runs)} запусков, {len(shards)} шардов, устаревших: {len(stale)}")
+    for run_id in runs[-10:]:
+        run_shards = [f"{shard.geo}-{shard.category}" for shard in shards if shard.run_id == run_id]
+        print(f"  {run_id}: {', '.join(run_shards)}")
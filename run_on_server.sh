@@ -49,7 +49,7 @@ echo "✓ Развертывание завершено"
 
 # Запускаем парсер
 echo -e "\n[4/6] Запуск анализа..."
-echo "Это займет несколько минут (около 2-3 минут для 30 стран)"
+echo "Это займет длительное время (оценка: python main.py --plan)"
 echo ""
 
 ssh "$SERVER" "cd ~/$PROJECT_DIR && source venv/bin/activate && python main.py"
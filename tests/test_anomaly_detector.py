@@ -0,0 +1,61 @@
+"""
+Потоковый детектор: сдвиг окна с перенормировкой Google не считается всплеском
+"""
+import random
+
+from anomaly_detector import AnomalyDetector
+
+DAY = 86400
+WINDOW = 90
+
+
+def demand(days, peak_day=None, peak=60.0, seed=7):
+    """Истинный спрос: ровный уровень 30 +- 1.5 и, при необходимости, один пик"""
+    rng = random.Random(seed)
+    values = [30 + rng.uniform(-1.5, 1.5) for _ in range(days)]
+    if peak_day is not None:
+        values[peak_day] = peak
+    return values
+
+
+def window_response(values, end):
+    """Ответ Trends за окно, заканчивающееся днем end: максимум окна = 100"""
+    window = values[end - WINDOW:end]
+    top = max(window)
+    return {
+        "timestamps": [day * DAY for day in range(end - WINDOW, end)],
+        "values": {"vpn": [round(value / top * 100) for value in window]},
+    }
+
+
+def feed(detector, values, start, stop):
+    alerts = []
+    for end in range(start, stop):
+        alerts += detector.observe_series(window_response(values, end), "today 3-m", "RU", 13)
+    return alerts
+
+
+def test_peak_leaving_window_is_not_a_spike():
+    values = demand(200, peak_day=20)
+    detector = AnomalyDetector(path=None)
+    # Пик выходит из окна на день 111: все значения ответа вырастают примерно в 1.6 раза
+    assert feed(detector, values, WINDOW, 200) == []
+
+
+def test_real_spike_after_rescaled_window_is_detected():
+    values = demand(200, peak_day=20)
+    values[150] = 75.0
+    detector = AnomalyDetector(path=None)
+    alerts = feed(detector, values, WINDOW, 152)
+    assert [alert["kind"] for alert in alerts] == ["spike"]
+    assert alerts[0]["timestamp"] == 150 * DAY
+
+
+def test_disjoint_windows_restart_stream():
+    values = demand(400)
+    detector = AnomalyDetector(path=None)
+    feed(detector, values, WINDOW, WINDOW + 1)
+    # Следующий ответ без общих точек: состояние начинается заново
+    assert feed(detector, values, 300, 301) == []
+    stats = detector.streams["RU|13|today 3-m|vpn"]
+    assert stats.count == WINDOW
@@ -0,0 +1,195 @@
+"""
+Пул прокси на локальных заглушках: карантин, выбор выходов и интервал по хостам
+"""
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from proxy_pool import ProxyPool, ProxyRateLimiter, probe
+from trends_backends import NativeTrendsBackend, TrendsResponseError
+
+TARGET_URL = "http://trends.test/trends/explore/"
+
+
+def quiet(message):
+    pass
+
+
+class StandInProxy:
+    """HTTP-прокси заглушка: отвечает сама на запросы с абсолютным URL"""
+    
+    def __init__(self, host, status):
+        self.paths = []
+        proxy = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+            
+            def do_GET(self):
+                proxy.paths.append(self.path)
+                body = b"ok" if status == 200 else b"blocked"
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        
+        self.server = ThreadingHTTPServer((host, 0), Handler)
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def closed_port_url(host):
+    """Адрес, на котором никто не слушает: соединение отклоняется"""
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        port = sock.getsockname()[1]
+    return f"http://{host}:{port}"
+
+
+@pytest.fixture
+def proxies():
+    ok = StandInProxy("127.0.0.2", 200)
+    blocked = StandInProxy("127.0.0.3", 429)
+    yield {"ok": ok.url, "blocked": blocked.url, "dead": closed_port_url("127.0.0.4"), "ok_server": ok}
+    ok.close()
+    blocked.close()
+
+
+def egress_by_url(pool, url):
+    return next(egress for egress in pool.egresses if egress.url == url)
+
+
+def test_probe_through_stand_in_proxies(proxies):
+    pool = ProxyPool([proxies["ok"], proxies["blocked"], proxies["dead"]], log=quiet)
+    results = probe(pool, TARGET_URL, timeout=2, log=quiet)
+    
+    assert list(results.values()) == [200, 429, None]
+    assert proxies["ok_server"].paths == [TARGET_URL]
+    ok, blocked, dead = pool.egresses
+    assert not ok.quarantined() and ok.latency is not None
+    # 429 - карантин сразу, ошибка соединения - только после PROXY_MAX_FAILURES подряд
+    assert blocked.quarantined() and blocked.blocks == 1
+    assert not dead.quarantined() and dead.consecutive == 1
+    
+    probe(pool, TARGET_URL, timeout=2, log=quiet)
+    probe(pool, TARGET_URL, timeout=2, log=quiet)
+    assert dead.quarantined() and dead.errors == 3
+
+
+def test_quarantine_doubles_and_is_capped():
+    pool = ProxyPool(["http://10.0.0.1:3128"], quarantine=10, quarantine_max=35, log=quiet)
+    egress = pool.egresses[0]
+    durations = []
+    for _ in range(4):
+        pool.report_failure(egress, 429)
+        durations.append(round(egress.quarantined_until - time.monotonic()))
+    assert durations == [10, 20, 35, 35]
+    
+    # Каждый успешный ответ снимает один штраф
+    for _ in range(4):
+        pool.report_success(egress, 0.1)
+    pool.report_failure(egress, 429)
+    assert round(egress.quarantined_until - time.monotonic()) == 10
+
+
+def test_selection_prefers_healthy_exits():
+    random.seed(1)
+    pool = ProxyPool(["http://10.0.0.1:1", "http://10.0.0.2:1", "http://10.0.0.3:1", "http://10.0.0.4:1"],
+                     log=quiet)
+    fast, slow, flaky, blocked = pool.egresses
+    pool.report_success(fast, 0.1)
+    pool.report_success(slow, 1.0)
+    pool.report_success(flaky, 0.1)
+    pool.report_failure(flaky, 500)
+    pool.report_failure(flaky, 500)
+    pool.report_failure(blocked, 429)
+    
+    counts = {egress.name: 0 for egress in pool.egresses}
+    for _ in range(3000):
+        counts[pool.choose().name] += 1
+    assert counts[blocked.name] == 0
+    assert counts[fast.name] > 2 * counts[flaky.name] > 0
+    assert counts[fast.name] > 5 * counts[slow.name] > 0
+
+
+def test_each_host_keeps_its_own_interval():
+    # Два выхода на одном хосте делят интервал, третий хост - отдельный
+    pool = ProxyPool(["http://127.0.0.2:1", "http://127.0.0.2:2", "http://127.0.0.3:1"], log=quiet)
+    limiter = ProxyRateLimiter(pool, 0.2, 0.2)
+    sent = []
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.wait()
+        sent.append((pool.current.host, time.monotonic()))
+        limiter.mark()
+    elapsed = time.monotonic() - start
+    
+    for host in ("127.0.0.2", "127.0.0.3"):
+        times = [ts for sent_host, ts in sent if sent_host == host]
+        assert len(times) == 3
+        assert min(b - a for a, b in zip(times, times[1:])) >= 0.19
+    # Один хост отправил бы 6 запросов не быстрее чем за 1 сек
+    assert elapsed < 0.8
+
+
+def test_prefetch_waits_for_quarantine_and_host_interval(proxies):
+    pool = ProxyPool([proxies["blocked"]], quarantine=0.3, log=quiet)
+    limiter = ProxyRateLimiter(pool, 0.2, 0.2)
+    blocked = pool.egresses[0]
+    sent = []
+    
+    def prefetch():
+        sent.append(time.monotonic())
+        response = requests.get(TARGET_URL, proxies=pool.current.proxies, timeout=2)
+        if response.status_code == 200:
+            pool.report_success(pool.current, 0.01)
+        else:
+            pool.report_failure(pool.current, response.status_code)
+    
+    # Все выходы на карантине: токены не запрашиваются, пока он не кончится
+    pool.report_failure(blocked, 429)
+    released = blocked.quarantined_until
+    limiter.wait(prefetch)
+    assert sent[0] >= released
+    
+    # Запрос токенов выдерживает и интервал хоста
+    pool = ProxyPool([proxies["ok"]], log=quiet)
+    limiter = ProxyRateLimiter(pool, 0.2, 0.2)
+    limiter.wait(prefetch)
+    limiter.mark()
+    released = pool.ready_at(pool.current)
+    limiter.wait(prefetch)
+    assert sent[2] >= released
+    assert proxies["ok_server"].paths == [TARGET_URL, TARGET_URL]
+
+
+def test_backend_reports_requests_to_pool(proxies):
+    pool = ProxyPool([proxies["ok"], proxies["blocked"], proxies["dead"]], log=quiet)
+    backend = NativeTrendsBackend("test-agent", proxy_pool=pool, timeout=2)
+    ok, blocked, dead = pool.egresses
+    
+    pool.current = ok
+    assert backend._request("get", TARGET_URL, None) == "ok"
+    assert ok.requests == 1 and ok.errors == 0 and ok.latency is not None
+    
+    pool.current = blocked
+    with pytest.raises(TrendsResponseError):
+        backend._request("get", TARGET_URL, None)
+    assert blocked.quarantined()
+    
+    pool.current = dead
+    with pytest.raises(Exception):
+        backend._request("get", TARGET_URL, None)
+    assert dead.errors == 1 and not dead.quarantined()
+    # У каждого выхода своя сессия
+    assert set(backend.sessions) == {ok.name, blocked.name, dead.name}
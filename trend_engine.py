@@ -0,0 +1,179 @@
+"""
+Векторизованный расчет трендов по дневным рядам интереса
+
+Все ряды обрабатываются одной матрицей NumPy (страны × дни): удаление недельной
+сезонности, наклон методом наименьших квадратов, EWMA и изменение неделя к неделе.
+Ряды выравниваются по последней точке, недостающие дни слева заполняются NaN.
+"""
+import warnings
+
+import numpy as np
+
+DAY_SECONDS = 86400
+
+# Параметры по умолчанию
+EWMA_SPAN = 14
+WEEK = 7
+MIN_POINTS = 14
+# Порог |t| наклона, начиная с которого тренд считается значимым
+SIGNIFICANT_T = 2.0
+
+
+def build_matrix(series_list):
+    """
+    Собирает ряды в матрицу значений и матрицу дней недели
+    
+    Args:
+        series_list: Список словарей {"timestamps": [...], "values": [...]}
+    
+    Returns:
+        tuple: (values, weekdays, daily) - float-матрица n × T с NaN слева,
+               int-матрица дней недели (-1 для пустых ячеек) и bool-вектор
+               "ряд дневной"
+    """
+    length = max((len(s["values"]) for s in series_list), default=0)
+    values = np.full((len(series_list), length), np.nan)
+    weekdays = np.full((len(series_list), length), -1, dtype=np.int64)
+    daily = np.zeros(len(series_list), dtype=bool)
+    
+    for row, series in enumerate(series_list):
+        count = len(series["values"])
+        if not count:
+            continue
+        timestamps = np.asarray(series["timestamps"], dtype=np.int64)
+        values[row, length - count:] = series["values"]
+        # 1970-01-01 - четверг: сдвиг на 3 дает 0 = понедельник
+        weekdays[row, length - count:] = (timestamps // DAY_SECONDS + 3) % 7
+        if count > 1:
+            daily[row] = np.median(np.diff(timestamps)) == DAY_SECONDS
+    
+    return values, weekdays, daily
+
+
+def remove_weekly_seasonality(values, weekdays, daily):
+    """
+    Делит дневные ряды на индекс дня недели (среднее дня недели / среднее ряда)
+    
+    Args:
+        values: Матрица n × T
+        weekdays: Матрица дней недели
+        daily: Вектор "ряд дневной" (недневные ряды не меняются)
+    
+    Returns:
+        ndarray: Матрица без недельной сезонности
+    """
+    valid = ~np.isnan(values)
+    onehot = (weekdays[:, :, None] == np.arange(7)) & valid[:, :, None]
+    filled = np.where(valid, values, 0.0)
+    
+    sums = (filled[:, :, None] * onehot).sum(axis=1)
+    counts = onehot.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        day_means = sums / counts
+        row_means = filled.sum(axis=1) / valid.sum(axis=1)
+        factors = day_means / row_means[:, None]
+    # Нет данных или нулевое среднее - сезонность не учитывается
+    factors = np.where(np.isfinite(factors) & (factors > 0), factors, 1.0)
+    factors[~daily] = 1.0
+    
+    cell_factors = np.take_along_axis(factors, np.clip(weekdays, 0, 6), axis=1)
+    return np.where(valid, values / cell_factors, np.nan)
+
+
+def linear_trend(values):
+    """
+    Наклон МНК по каждой строке с учетом пропусков
+    
+    Returns:
+        tuple: (slope, t_stat, mean) - векторы длины n; наклон в единицах за день
+    """
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1)
+    x = np.broadcast_to(np.arange(values.shape[1], dtype=float), values.shape)
+    y = np.where(valid, values, 0.0)
+    
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = np.where(valid, x, 0.0).sum(axis=1) / count
+        y_mean = y.sum(axis=1) / count
+        dx = np.where(valid, x - x_mean[:, None], 0.0)
+        dy = np.where(valid, y - y_mean[:, None], 0.0)
+        sxx = (dx * dx).sum(axis=1)
+        slope = (dx * dy).sum(axis=1) / sxx
+        
+        residuals = dy - slope[:, None] * dx
+        sigma2 = (residuals * residuals).sum(axis=1) / (count - 2)
+        stderr = np.sqrt(sigma2 / sxx)
+        t_stat = np.where(stderr > 0, slope / stderr, 0.0)
+    
+    return slope, t_stat, y_mean
+
+
+def ewma_last(values, span=EWMA_SPAN):
+    """Последнее значение EWMA по каждой строке (пропуски не учитываются)"""
+    alpha = 2 / (span + 1)
+    weights = (1 - alpha) ** np.arange(values.shape[1] - 1, -1, -1, dtype=float)
+    valid = ~np.isnan(values)
+    weighted = np.where(valid, values, 0.0) * weights
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return weighted.sum(axis=1) / (valid * weights).sum(axis=1)
+
+
+def week_over_week(values):
+    """Изменение среднего последних 7 дней к предыдущим 7 дням, %"""
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        # Срез только из NaN (короткий ряд) дает NaN без предупреждения
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        last = np.nanmean(values[:, -WEEK:], axis=1)
+        previous = np.nanmean(values[:, -2 * WEEK:-WEEK], axis=1)
+        return (last - previous) / previous * 100
+
+
+def compute_trends(series_list, span=EWMA_SPAN, min_points=MIN_POINTS):
+    """
+    Считает показатели тренда для всех рядов за один проход
+    
+    Args:
+        series_list: Список словарей {"timestamps": [...], "values": [...]}
+        span: Окно EWMA в днях
+        min_points: Минимум точек, при котором ряд анализируется
+    
+    Returns:
+        list: Для каждого ряда словарь показателей или None (мало данных):
+              change_percent - изменение по линии тренда за 30 дней, % от среднего;
+              slope - наклон в пунктах в день; t_stat - t-статистика наклона;
+              ewma_ratio - EWMA / среднее; wow_percent - неделя к неделе, %
+              (None - не вычисляется);
+              significant - |t| >= SIGNIFICANT_T
+    """
+    if not series_list:
+        return []
+    
+    values, weekdays, daily = build_matrix(series_list)
+    adjusted = remove_weekly_seasonality(values, weekdays, daily)
+    
+    slope, t_stat, mean = linear_trend(adjusted)
+    ewma = ewma_last(adjusted, span)
+    wow = week_over_week(adjusted)
+    points = (~np.isnan(adjusted)).sum(axis=1)
+    
+    # Шаг ряда в днях: наклон переводится в изменение за 30 дней
+    step_days = np.where(daily, 1.0, 7.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        change = slope * (30 / step_days) / mean * 100
+        ewma_ratio = ewma / mean
+    
+    results = []
+    for row in range(len(series_list)):
+        if points[row] < min_points or not mean[row] > 0:
+            results.append(None)
+            continue
+        results.append({
+            "change_percent": float(change[row]),
+            "slope": float(slope[row]),
+            "t_stat": float(t_stat[row]),
+            "ewma_ratio": float(ewma_ratio[row]),
+            "wow_percent": float(wow[row]) if np.isfinite(wow[row]) else None,
+            "significant": bool(abs(t_stat[row]) >= SIGNIFICANT_T),
+        })
+    return results
+
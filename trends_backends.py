@@ -0,0 +1,464 @@
+"""
+Бэкенды доступа к Google Trends
+
+NativeTrendsBackend обращается к эндпоинтам Trends напрямую и разбирает JSON
+сразу в компактные массивы (array), без pandas. PytrendsBackend - обертка над
+pytrends с тем же интерфейсом.
+
+requests и pytrends импортируются лениво при создании сессии, чтобы импорт
+модуля не замедлял запуск путей, которые не обращаются к сети.
+"""
+import json
+import time
+from array import array
+
+from config import TRENDS_HL, TRENDS_TZ, REQUEST_TIMEOUT
+from profiler import NullProfiler
+
+BASE_TRENDS_URL = "https://trends.google.com/trends"
+EXPLORE_URL = f"{BASE_TRENDS_URL}/api/explore"
+INTEREST_OVER_TIME_URL = f"{BASE_TRENDS_URL}/api/widgetdata/multiline"
+INTEREST_BY_REGION_URL = f"{BASE_TRENDS_URL}/api/widgetdata/comparedgeo"
+RELATED_QUERIES_URL = f"{BASE_TRENDS_URL}/api/widgetdata/relatedsearches"
+
+# Сколько секунд токены виджетов explore переиспользуются для того же набора запросов
+WIDGET_TOKEN_TTL = 600
+WIDGET_CACHE_SIZE = 16
+
+
+class TrendsResponseError(Exception):
+    """Ошибка ответа Google Trends"""
+    
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class InterestSeries:
+    """Интерес к запросам во времени: общая ось времени и массив значений на запрос"""
+    
+    __slots__ = ("timestamps", "values", "partial")
+    
+    def __init__(self, timestamps=None, values=None, partial=False):
+        """
+        Args:
+            timestamps: array('q') с unix-временем точек
+            values: Словарь {query: array('d')}
+            partial: Последняя точка неполная (период еще не закончился)
+        """
+        self.timestamps = timestamps if timestamps is not None else array("q")
+        self.values = values if values is not None else {}
+        self.partial = partial
+    
+    @property
+    def empty(self):
+        """Нет ни одной точки"""
+        return len(self.timestamps) == 0
+    
+    def mean(self, query):
+        """Среднее значение интереса к запросу (0, если запроса нет)"""
+        values = self.values.get(query)
+        if not values:
+            return 0
+        return sum(values) / len(values)
+
+
+class RegionInterest:
+    """Интерес к запросам по регионам внутри геолокации"""
+    
+    __slots__ = ("codes", "names", "values")
+    
+    def __init__(self, codes=None, names=None, values=None):
+        """
+        Args:
+            codes: Коды регионов (например, RU-MOW)
+            names: Названия регионов
+            values: Словарь {query: array('d')} в порядке регионов
+        """
+        self.codes = codes if codes is not None else []
+        self.names = names if names is not None else []
+        self.values = values if values is not None else {}
+    
+    @property
+    def empty(self):
+        """Нет ни одного региона"""
+        return len(self.names) == 0
+
+
+def _parse_trends_json(text):
+    """Отрезает защитный префикс ")]}'," и разбирает JSON"""
+    start = text.find("{")
+    if start < 0:
+        raise TrendsResponseError("В ответе Google Trends нет JSON")
+    return json.loads(text[start:])
+
+
+def _related_from_widget_json(req_json):
+    """Достает списки top/rising из ответа relatedsearches"""
+    ranked = req_json.get("default", {}).get("rankedList", [])
+    result = {}
+    for position, name in enumerate(("top", "rising")):
+        if position < len(ranked) and "rankedKeyword" in ranked[position]:
+            result[name] = [
+                {"query": item["query"], "value": item["value"]}
+                for item in ranked[position]["rankedKeyword"]
+            ]
+        else:
+            result[name] = None
+    return result
+
+
+class TrendsBackend:
+    """Базовый интерфейс бэкенда Google Trends"""
+    
+    name = "base"
+    
+    def __init__(self, user_agent, hl=TRENDS_HL, tz=TRENDS_TZ, timeout=REQUEST_TIMEOUT, profiler=None):
+        """
+        Args:
+            user_agent: Заголовок User-Agent
+            hl: Язык интерфейса Trends
+            tz: Смещение часового пояса в минутах
+            timeout: Таймаут HTTP-запросов (connect, read)
+            profiler: Профилировщик фаз
+        """
+        self.user_agent = user_agent
+        self.hl = hl
+        self.tz = tz
+        self.timeout = timeout
+        self.profiler = profiler or NullProfiler()
+    
+    def reset(self, user_agent):
+        """Пересоздает сессию с новым User-Agent"""
+        raise NotImplementedError
+    
+    def prefetch(self, queries, timeframe, geo, category):
+        """
+        Заранее получает токены виджетов для набора запросов (если бэкенд их использует)
+        
+        Парсер вызывает его в паузе перед запросом, чтобы сам запрос состоял из
+        одного обращения за данными виджета.
+        """
+    
+    def interest_over_time(self, queries, timeframe, geo, category):
+        """Возвращает InterestSeries для до 5 запросов"""
+        raise NotImplementedError
+    
+    def interest_by_region(self, queries, timeframe, geo, category, resolution="REGION", keyword=None):
+        """
+        Возвращает RegionInterest для до 5 запросов
+        
+        Если задан keyword, возвращается карта только этого запроса (абсолютный
+        интерес 0-100 по регионам), иначе - карта сравнения всех запросов.
+        """
+        raise NotImplementedError
+    
+    def related_queries(self, query, timeframe, geo, category):
+        """Возвращает {"top": [{query, value}] | None, "rising": [...] | None}"""
+        raise NotImplementedError
+
+
+class NativeTrendsBackend(TrendsBackend):
+    """Легкий клиент: прямые HTTP-запросы к Trends и разбор в массивы"""
+    
+    name = "native"
+    
+    def __init__(self, user_agent, cassette=None, proxy_pool=None, **kwargs):
+        """
+        Args:
+            user_agent: Заголовок User-Agent
+            cassette: Кассета записи/воспроизведения HTTP-обмена (cassette.Cassette) или None
+            proxy_pool: Пул исходящих адресов (proxy_pool.ProxyPool) или None; запрос уходит
+                        через выход, выбранный ограничителем частоты (pool.current)
+        """
+        super().__init__(user_agent, **kwargs)
+        self.cassette = cassette
+        self.proxy_pool = proxy_pool
+        # Сессии по выходам пула ({имя выхода: сессия}, None - без пула) и выходы с cookie
+        self.sessions = {}
+        self._cookies = set()
+        self._widget_cache = {}
+        self.reset(user_agent)
+    
+    def _new_session(self, egress=None):
+        """Создает requests.Session (requests импортируется только здесь)"""
+        import requests
+        session = requests.Session()
+        if egress is not None:
+            session.proxies.update(egress.proxies)
+        return session
+    
+    def _egress(self):
+        """Выход текущего запроса (None - без пула)"""
+        return self.proxy_pool.current if self.proxy_pool is not None else None
+    
+    def _session(self, egress):
+        """HTTP-сессия выхода: создается при первом запросе через него"""
+        key = egress.name if egress is not None else None
+        session = self.sessions.get(key)
+        if session is None:
+            if self.cassette is not None:
+                session = self.cassette.wrap(lambda: self._new_session(egress))
+            else:
+                session = self._new_session(egress)
+            session.headers.update({
+                "User-Agent": self.user_agent,
+                "accept-language": self.hl,
+            })
+            self.sessions[key] = session
+        return session
+    
+    def reset(self, user_agent):
+        """Закрывает HTTP-сессии и меняет User-Agent (cookie и токены будут получены заново)"""
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+        self._cookies.clear()
+        self.user_agent = user_agent
+        self._widget_cache.clear()
+    
+    def _send(self, method, url, params=None):
+        """Отправляет запрос через текущий выход и передает пулу задержку или ошибку"""
+        egress = self._egress()
+        session = self._session(egress)
+        if egress is None:
+            return session.request(method, url, params=params, timeout=self.timeout)
+        
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, params=params, timeout=self.timeout)
+        except Exception:
+            self.proxy_pool.report_failure(egress)
+            raise
+        latency = time.perf_counter() - start
+        if response.status_code == 200:
+            self.proxy_pool.report_success(egress, latency)
+        else:
+            self.proxy_pool.report_failure(egress, response.status_code, latency)
+        return response
+    
+    def _ensure_cookie(self):
+        """Получает cookie NID один раз на сессию выхода"""
+        egress = self._egress()
+        key = egress.name if egress is not None else None
+        if key in self._cookies:
+            return
+        response = self._send("get", f"{BASE_TRENDS_URL}/explore/?geo={self.hl[-2:]}")
+        if egress is not None and egress.quarantined():
+            # Адрес заблокирован уже на странице cookie: запрос токенов через него бесполезен
+            raise TrendsResponseError(
+                f"Google Trends вернул код {response.status_code}", status_code=response.status_code
+            )
+        self._cookies.add(key)
+    
+    def _request(self, method, url, params):
+        """Выполняет запрос и возвращает тело ответа"""
+        response = self._send(method, url, params)
+        if response.status_code != 200:
+            raise TrendsResponseError(
+                f"Google Trends вернул код {response.status_code}", status_code=response.status_code
+            )
+        return response.text
+    
+    def _widgets(self, queries, timeframe, geo, category):
+        """
+        Возвращает токены виджетов (explore) для набора запросов
+        
+        Один payload дает токены сразу для временного ряда, карт регионов и
+        связанных запросов, поэтому ответ explore кэшируется и переиспользуется.
+        """
+        req = {
+            "comparisonItem": [{"keyword": q, "time": timeframe, "geo": geo} for q in queries],
+            "category": category,
+            "property": "",
+        }
+        cache_key = json.dumps(req, ensure_ascii=False, sort_keys=True)
+        cached = self._widget_cache.get(cache_key)
+        if cached is not None and time.monotonic() - cached[0] < WIDGET_TOKEN_TTL:
+            return cached[1]
+        
+        with self.profiler.phase("token"):
+            self._ensure_cookie()
+            text = self._request("post", EXPLORE_URL, {
+                "hl": self.hl, "tz": self.tz, "req": json.dumps(req)
+            })
+            widgets = _parse_trends_json(text)["widgets"]
+        
+        self._widget_cache.pop(cache_key, None)
+        self._widget_cache[cache_key] = (time.monotonic(), widgets)
+        while len(self._widget_cache) > WIDGET_CACHE_SIZE:
+            self._widget_cache.pop(next(iter(self._widget_cache)))
+        return widgets
+    
+    def _widget_data(self, url, widget, request=None):
+        """Запрашивает данные виджета по токену (request - измененный запрос виджета)"""
+        with self.profiler.phase("http"):
+            text = self._request("get", url, {
+                "req": json.dumps(request if request is not None else widget["request"]),
+                "token": widget["token"],
+                "tz": self.tz,
+            })
+        with self.profiler.phase("decode"):
+            return _parse_trends_json(text)
+    
+    def prefetch(self, queries, timeframe, geo, category):
+        self._widgets(queries, timeframe, geo, category)
+    
+    @staticmethod
+    def _find_widget(widgets, widget_id):
+        """Ищет первый виджет с заданным id"""
+        for widget in widgets:
+            if widget["id"] == widget_id:
+                return widget
+        raise TrendsResponseError(f"В ответе explore нет виджета {widget_id}")
+    
+    def interest_over_time(self, queries, timeframe, geo, category):
+        widgets = self._widgets(queries, timeframe, geo, category)
+        req_json = self._widget_data(INTEREST_OVER_TIME_URL, self._find_widget(widgets, "TIMESERIES"))
+        
+        with self.profiler.phase("decode"):
+            timeline = req_json.get("default", {}).get("timelineData", [])
+            timeline.sort(key=lambda point: int(point["time"]))
+            timestamps = array("q", (int(point["time"]) for point in timeline))
+            values = {
+                query: array("d", (point["value"][idx] for point in timeline))
+                for idx, query in enumerate(queries)
+            }
+            partial = bool(timeline and timeline[-1].get("isPartial", False))
+        return InterestSeries(timestamps, values, partial)
+    
+    def interest_by_region(self, queries, timeframe, geo, category, resolution="REGION", keyword=None):
+        widgets = self._widgets(queries, timeframe, geo, category)
+        columns = list(queries)
+        widget = None
+        if keyword is not None and len(queries) > 1:
+            # Для сравнения нескольких запросов explore отдает и карты по каждому (GEO_MAP_<i>)
+            widget_id = f"GEO_MAP_{list(queries).index(keyword)}"
+            widget = next((w for w in widgets if w["id"] == widget_id), None)
+            if widget is not None:
+                columns = [keyword]
+        if widget is None:
+            widget = self._find_widget(widgets, "GEO_MAP")
+        
+        request = dict(widget["request"], resolution=resolution, includeLowSearchVolumeGeos=False)
+        req_json = self._widget_data(INTEREST_BY_REGION_URL, widget, request)
+        
+        with self.profiler.phase("decode"):
+            geo_data = [
+                item for item in req_json.get("default", {}).get("geoMapData", [])
+                if any(item.get("hasData", [True]))
+            ]
+            codes = [item.get("geoCode", "") for item in geo_data]
+            names = [item["geoName"] for item in geo_data]
+            values = {
+                query: array("d", (item["value"][idx] for item in geo_data))
+                for idx, query in enumerate(columns)
+            }
+        return RegionInterest(codes, names, values)
+    
+    def related_queries(self, query, timeframe, geo, category):
+        widgets = self._widgets([query], timeframe, geo, category)
+        widget = next((w for w in widgets if "RELATED_QUERIES" in w["id"]), None)
+        if widget is None:
+            return {}
+        req_json = self._widget_data(RELATED_QUERIES_URL, widget)
+        with self.profiler.phase("decode"):
+            return _related_from_widget_json(req_json)
+
+
+class PytrendsBackend(TrendsBackend):
+    """Бэкенд на основе pytrends (pandas DataFrame внутри)"""
+    
+    name = "pytrends"
+    
+    def __init__(self, user_agent, **kwargs):
+        super().__init__(user_agent, **kwargs)
+        self.pytrends = None
+        self.reset(user_agent)
+    
+    def reset(self, user_agent):
+        """Переинициализация pytrends с новым user-agent"""
+        from pytrends.request import TrendReq
+        
+        self.user_agent = user_agent
+        self.pytrends = TrendReq(hl=self.hl, tz=self.tz, timeout=self.timeout,
+                                 requests_args={'headers': {'User-Agent': user_agent}})
+        self._payload_key = None
+    
+    def _build_payload(self, queries, timeframe, geo, category):
+        """Запрашивает токены, если payload отличается от предыдущего"""
+        payload_key = (tuple(queries), timeframe, geo, category)
+        if payload_key == self._payload_key:
+            return
+        with self.profiler.phase("token"):
+            self.pytrends.build_payload(list(queries), cat=category, timeframe=timeframe, geo=geo)
+        self._payload_key = payload_key
+    
+    def interest_over_time(self, queries, timeframe, geo, category):
+        self._build_payload(queries, timeframe, geo, category)
+        with self.profiler.phase("http+decode"):
+            data = self.pytrends.interest_over_time()
+        
+        with self.profiler.phase("decode"):
+            if data.empty:
+                return InterestSeries()
+            timestamps = array("q", (int(ts.timestamp()) for ts in data.index))
+            values = {
+                query: array("d", data[query].tolist())
+                for query in queries if query in data.columns
+            }
+            partial = bool('isPartial' in data.columns and data['isPartial'].iloc[-1])
+        return InterestSeries(timestamps, values, partial)
+    
+    def interest_by_region(self, queries, timeframe, geo, category, resolution="REGION", keyword=None):
+        if keyword is not None:
+            # pytrends хранит только карту сравнения, для отдельного запроса нужен свой payload
+            queries = [keyword]
+        self._build_payload(queries, timeframe, geo, category)
+        # pytrends применяет resolution только для мировых/US-запросов, поэтому задаем явно
+        self.pytrends.interest_by_region_widget['request']['resolution'] = resolution
+        with self.profiler.phase("http+decode"):
+            data = self.pytrends.interest_by_region(resolution=resolution, inc_geo_code=True)
+        
+        with self.profiler.phase("decode"):
+            if data.empty:
+                return RegionInterest()
+            codes = data['geoCode'].tolist() if 'geoCode' in data.columns else [""] * len(data)
+            values = {
+                query: array("d", data[query].tolist())
+                for query in queries if query in data.columns
+            }
+        return RegionInterest(codes, list(data.index), values)
+    
+    def related_queries(self, query, timeframe, geo, category):
+        self._build_payload([query], timeframe, geo, category)
+        with self.profiler.phase("http+decode"):
+            data = self.pytrends.related_queries()
+        
+        related = data.get(query, {})
+        return {
+            name: frame.to_dict('records') if frame is not None else None
+            for name, frame in related.items()
+        }
+
+
+BACKENDS = {
+    NativeTrendsBackend.name: NativeTrendsBackend,
+    PytrendsBackend.name: PytrendsBackend,
+}
+
+
+def create_backend(name, user_agent, **kwargs):
+    """
+    Создает бэкенд по имени
+    
+    Args:
+        name: "native" или "pytrends"
+        user_agent: Заголовок User-Agent
+    
+    Returns:
+        TrendsBackend: Экземпляр бэкенда
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд Google Trends: {name} (доступны: {', '.join(BACKENDS)})")
+    return BACKENDS[name](user_agent, **kwargs)
@@ -0,0 +1,92 @@
+"""
+Дисковый кэш ответов Google Trends
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from config import CACHE_DIR, CACHE_TTL
+
+
+class TrendsCache:
+    """Кэш результатов запросов к Google Trends в виде JSON-файлов"""
+    
+    def __init__(self, cache_dir=CACHE_DIR, ttl=CACHE_TTL):
+        """
+        Инициализация кэша
+        
+        Args:
+            cache_dir: Директория для файлов кэша
+            ttl: Время жизни записи в секундах (None - бессрочно)
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+    
+    @staticmethod
+    def make_key(kind, queries, timeframe, geo, category):
+        """
+        Строит ключ кэша для запроса
+        
+        Args:
+            kind: Тип запроса (interest, related, ...)
+            queries: Список запросов или один запрос
+            timeframe: Период времени
+            geo: Код геолокации
+            category: Категория поиска
+        
+        Returns:
+            str: Ключ кэша
+        """
+        if isinstance(queries, str):
+            queries = [queries]
+        raw = json.dumps([kind, list(queries), timeframe, geo, category], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    
+    def _path(self, key):
+        """Путь к файлу записи"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+    
+    def has(self, key):
+        """Проверяет, есть ли актуальная запись в кэше"""
+        path = self._path(key)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return False
+        return self.ttl is None or time.time() - mtime <= self.ttl
+    
+    def get(self, key):
+        """
+        Возвращает значение из кэша
+        
+        Args:
+            key: Ключ кэша
+        
+        Returns:
+            Значение или None, если записи нет или она устарела
+        """
+        if not self.has(key):
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def set(self, key, value):
+        """
+        Сохраняет значение в кэш
+        
+        Args:
+            key: Ключ кэша
+            value: JSON-сериализуемое значение
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Кэш пишут потоки асинхронного клиента и другие процессы: у каждого писателя свой файл
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)